@@ -0,0 +1,103 @@
+import logging
+import time
+from typing import Any, Iterable, Iterator, NamedTuple, Tuple
+
+from sqlalchemy.orm import Session
+
+from .cell_values import CELL_BOOL, CELL_DATE, CELL_NUMBER
+
+logger = logging.getLogger(__name__)
+
+CELL_LOAD_COLUMNS = "sheet_id, row, col, value_text, value_type, value_num, value_date, value_bool"
+
+INSERT_CELLS_SQL = f"INSERT INTO cells ({CELL_LOAD_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+
+# PostgreSQL: le righe sono trasmesse in streaming con il protocollo COPY
+COPY_CELLS_SQL = f"COPY cells ({CELL_LOAD_COLUMNS}) FROM STDIN"
+
+# Stesso formato usato da SQLAlchemy per DateTime su SQLite
+SQLITE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+class LoadStats(NamedTuple):
+    rows: int
+    seconds: float
+    # Celle il cui testo è stato troncato (policy CELL_TEXT_OVERFLOW)
+    truncated: int = 0
+    
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+class _Counter:
+    """Conta le righe che attraversano un generatore."""
+    
+    def __init__(self):
+        self.count = 0
+    
+    def wrap(self, rows: Iterable[tuple]) -> Iterator[tuple]:
+        for row in rows:
+            self.count += 1
+            yield row
+
+def cell_rows(
+    sheet_id: int,
+    cells: Iterable[Tuple[int, int, str, str, Any]],
+    dialect: str
+) -> Iterator[tuple]:
+    """
+    Righe della tabella cells: il valore nativo finisce nella colonna del suo
+    tipo, le altre restano NULL. Su SQLite le date sono già testo nel formato
+    di SQLAlchemy, negli altri database restano datetime.
+    """
+    dates_as_text = dialect == "sqlite"
+    for row, col, value_text, value_type, value in cells:
+        if value_type == CELL_DATE and dates_as_text:
+            value = value.strftime(SQLITE_DATETIME_FORMAT)
+        yield (
+            sheet_id, row, col, value_text, value_type,
+            value if value_type == CELL_NUMBER else None,
+            value if value_type == CELL_DATE else None,
+            value if value_type == CELL_BOOL else None,
+        )
+
+def copy_rows(cursor, rows: Iterable[tuple]):
+    """Carica le righe con COPY FROM STDIN (cursore psycopg)."""
+    with cursor.copy(COPY_CELLS_SQL) as copy:
+        for row in rows:
+            copy.write_row(row)
+
+def bulk_insert_cells(
+    db: Session,
+    sheet_id: int,
+    cells: Iterable[Tuple[int, int, str, str, Any]]
+) -> LoadStats:
+    """
+    Inserisce le celle di un foglio sul cursore DBAPI, alimentato da un
+    generatore di tuple (nessuna lista di dizionari intermedia): un unico
+    executemany su SQLite, COPY FROM STDIN su PostgreSQL.
+    Le righe fanno parte della transazione corrente della sessione: il commit
+    spetta al chiamante, così ogni foglio è caricato in una sola transazione.
+    
+    Ogni cella è (row, col, value_text, value_type, valore nativo).
+    """
+    
+    start = time.perf_counter()
+    dialect = db.get_bind().dialect.name
+    counter = _Counter()
+    rows = counter.wrap(cell_rows(sheet_id, cells, dialect))
+    
+    cursor = db.connection().connection.cursor()
+    try:
+        if dialect == "postgresql":
+            copy_rows(cursor, rows)
+        else:
+            cursor.executemany(INSERT_CELLS_SQL, rows)
+    finally:
+        cursor.close()
+    
+    stats = LoadStats(rows=counter.count, seconds=time.perf_counter() - start)
+    logger.info(
+        "Sheet %s: %d celle caricate in %.2fs (%.0f celle/s)",
+        sheet_id, stats.rows, stats.seconds, stats.rows_per_sec
+    )
+    return stats
@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+from .config import ANALYSIS_CACHE_SIZE, PREVIEW_CACHE_SIZE
+
+_MISSING = object()
+
+class LRUCache:
+    """
+    Cache in-process con eviction LRU e numero massimo di elementi.
+
+    Le chiavi sono tuple che iniziano con il dataset_id, così l'invalidazione
+    per dataset non richiede indici aggiuntivi. Thread-safe (i job di
+    ingestione girano in thread separati). La cache è locale al processo.
+    """
+
+    def __init__(self, name: str, max_entries: int):
+        self.name = name
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def invalidate_dataset(self, dataset_id: str):
+        with self._lock:
+            for key in [k for k in self._data if k[0] == dataset_id]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+# Analisi JSON già decodificate: (dataset_id, sheet_name) -> dict
+analysis_cache = LRUCache("analysis", ANALYSIS_CACHE_SIZE)
+
+# Preview già calcolate: (dataset_id, sheet_name, modo, finestra/candidato...) -> dict
+preview_cache = LRUCache("preview", PREVIEW_CACHE_SIZE)
+
+CACHES = (analysis_cache, preview_cache)
+
+def invalidate_dataset(dataset_id: str):
+    """Da chiamare quando sheet o celle di un dataset cambiano o vengono eliminati."""
+    for cache in CACHES:
+        cache.invalidate_dataset(dataset_id)
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {cache.name: cache.stats() for cache in CACHES}
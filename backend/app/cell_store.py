@@ -0,0 +1,300 @@
+import mmap
+import shutil
+from abc import ABC, abstractmethod
+from array import array
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import insert, select, literal
+from sqlalchemy.orm import Session
+
+from . import models
+from .bulk_load import bulk_insert_cells
+from .cell_values import CELL_BOOL, CELL_DATE, CELL_NUMBER, CELL_TEXT
+from .config import UPLOAD_DIR
+
+class CellValue(NamedTuple):
+    row: int
+    col: int
+    value_text: str
+    value_type: str = CELL_TEXT
+    # float, datetime o bool secondo value_type; None per i testi
+    value: Any = None
+
+# Cella in scrittura: (row, col, value_text, value_type, valore nativo)
+TypedCell = Tuple[int, int, str, str, Any]
+
+CELL_COLUMNS = (
+    models.Cell.row, models.Cell.col, models.Cell.value_text, models.Cell.value_type,
+    models.Cell.value_num, models.Cell.value_date, models.Cell.value_bool
+)
+
+# Codifica delle date nel formato colonnare: microsecondi dal 1970 (NaT se assente)
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+NAT = np.iinfo(np.int64).min
+NAN = float("nan")
+
+# Celle per blocco nelle letture sequenziali di un intero foglio (iter_chunks)
+READ_CHUNK_CELLS = 50_000
+
+def cell_from_row(row, col, value_text, value_type, value_num, value_date, value_bool) -> CellValue:
+    if value_type == CELL_NUMBER:
+        return CellValue(row, col, value_text, value_type, value_num)
+    if value_type == CELL_DATE:
+        return CellValue(row, col, value_text, value_type, value_date)
+    if value_type == CELL_BOOL:
+        return CellValue(row, col, value_text, value_type, bool(value_bool))
+    return CellValue(row, col, value_text, CELL_TEXT)
+
+class CellStore(ABC):
+    """
+    Interfaccia per la memorizzazione delle celle di un foglio.
+    Le celle sono scritte in ordine (row, col) e lette per rettangolo,
+    con il testo e il valore nativo (numero, data, booleano).
+    """
+    
+    name: str = ""
+    
+    @abstractmethod
+    def write_sheet(self, db: Session, sheet: models.Sheet, cells: Iterable[TypedCell]) -> int:
+        """
+        Scrive le celle del foglio; restituisce il numero di celle scritte.
+        Non esegue commit: il chiamante chiude la transazione del foglio.
+        """
+    
+    @abstractmethod
+    def read_range(
+        self,
+        db: Session,
+        sheet: models.Sheet,
+        row_start: int,
+        row_end: int,
+        col_start: int,
+        col_end: int
+    ) -> Sequence[CellValue]:
+        """Restituisce le celle (CellValue) nel rettangolo, ordinate per (row, col)."""
+    
+    @abstractmethod
+    def read_all(self, db: Session, sheet: models.Sheet) -> Sequence[CellValue]:
+        """Tutte le celle del foglio, ordinate per (row, col)."""
+    
+    @abstractmethod
+    def iter_chunks(
+        self,
+        db: Session,
+        sheet: models.Sheet,
+        chunk_size: int = READ_CHUNK_CELLS
+    ) -> Iterator[Sequence[CellValue]]:
+        """
+        Tutte le celle del foglio in ordine (row, col), a blocchi di al più
+        `chunk_size` celle: in memoria c'è un blocco alla volta.
+        """
+    
+    @abstractmethod
+    def clone_sheet(self, db: Session, source: models.Sheet, target: models.Sheet):
+        """Copia le celle di `source` su `target`."""
+    
+    @abstractmethod
+    def delete_dataset(self, db: Session, dataset_id: str):
+        """Elimina le celle di tutti i fogli del dataset."""
+
+class SQLiteCellStore(CellStore):
+    """Una riga della tabella `cells` per ogni cella non vuota."""
+    
+    name = "sqlite"
+    
+    def write_sheet(self, db: Session, sheet: models.Sheet, cells: Iterable[TypedCell]) -> int:
+        stats = bulk_insert_cells(db, sheet.id, cells)
+        return stats.rows
+    
+    def read_range(self, db, sheet, row_start, row_end, col_start, col_end):
+        # La query è risolta interamente sulla chiave primaria (sheet_id, row, col)
+        rows = db.query(*CELL_COLUMNS).filter(
+            models.Cell.sheet_id == sheet.id,
+            models.Cell.row >= row_start,
+            models.Cell.row <= row_end,
+            models.Cell.col >= col_start,
+            models.Cell.col <= col_end
+        ).order_by(models.Cell.row, models.Cell.col)
+        return [cell_from_row(*row) for row in rows]
+    
+    def read_all(self, db, sheet):
+        rows = db.query(*CELL_COLUMNS).filter(
+            models.Cell.sheet_id == sheet.id
+        ).order_by(models.Cell.row, models.Cell.col)
+        return [cell_from_row(*row) for row in rows]
+    
+    def iter_chunks(self, db, sheet, chunk_size=READ_CHUNK_CELLS):
+        # yield_per: le righe sono lette dal cursore un blocco alla volta
+        # (cursore lato server su PostgreSQL)
+        result = db.execute(
+            select(*CELL_COLUMNS)
+            .where(models.Cell.sheet_id == sheet.id)
+            .order_by(models.Cell.row, models.Cell.col)
+            .execution_options(yield_per=chunk_size)
+        )
+        for partition in result.partitions():
+            yield [cell_from_row(*row) for row in partition]
+    
+    def clone_sheet(self, db, source, target):
+        db.execute(
+            insert(models.Cell).from_select(
+                ["sheet_id"] + [column.name for column in CELL_COLUMNS],
+                select(literal(target.id), *CELL_COLUMNS)
+                .where(models.Cell.sheet_id == source.id)
+            )
+        )
+    
+    def delete_dataset(self, db, dataset_id):
+        sheet_ids = select(models.Sheet.id).where(models.Sheet.dataset_id == dataset_id)
+        db.query(models.Cell).filter(models.Cell.sheet_id.in_(sheet_ids)).delete(synchronize_session=False)
+
+class ColumnarCellStore(CellStore):
+    """
+    Un file colonnare per foglio accanto ai file del dataset:
+    `storage/uploads/<dataset_id>/cells/<sheet_id>/` con
+    rows.npy / cols.npy (int32), offsets.npy (int64, n+1) e heap.bin
+    (testi UTF-8 concatenati). I valori tipizzati sono in types.npy (codice
+    ASCII di value_type), nums.npy (float64, anche i booleani come 0/1;
+    NaN se assente) e dates.npy (datetime64[us]; NaT se assente).
+    Le celle sono ordinate per (row, col): la lettura di un rettangolo è
+    una ricerca binaria sulle righe seguita da una selezione sulle colonne,
+    su array mappati in memoria.
+    """
+    
+    name = "columnar"
+    
+    def __init__(self, base_dir: Path = UPLOAD_DIR):
+        self.base_dir = Path(base_dir)
+    
+    def sheet_dir(self, sheet: models.Sheet) -> Path:
+        return self.base_dir / sheet.dataset_id / "cells" / str(sheet.id)
+    
+    def write_sheet(self, db, sheet, cells):
+        path = self.sheet_dir(sheet)
+        path.mkdir(parents=True, exist_ok=True)
+        
+        rows = array("i")
+        cols = array("i")
+        offsets = array("q", [0])
+        types = bytearray()
+        nums = array("d")
+        dates = array("q")
+        offset = 0
+        
+        with open(path / "heap.bin", "wb") as heap:
+            for row, col, value_text, value_type, value in cells:
+                data = value_text.encode("utf-8")
+                heap.write(data)
+                offset += len(data)
+                rows.append(row)
+                cols.append(col)
+                offsets.append(offset)
+                types.append(ord(value_type))
+                if value_type == CELL_DATE:
+                    nums.append(NAN)
+                    dates.append((value - EPOCH) // ONE_MICROSECOND)
+                else:
+                    nums.append(float(value) if value_type in (CELL_NUMBER, CELL_BOOL) else NAN)
+                    dates.append(NAT)
+        
+        np.save(path / "rows.npy", np.frombuffer(rows, dtype=np.int32))
+        np.save(path / "cols.npy", np.frombuffer(cols, dtype=np.int32))
+        np.save(path / "offsets.npy", np.frombuffer(offsets, dtype=np.int64))
+        np.save(path / "types.npy", np.frombuffer(bytes(types), dtype=np.uint8))
+        np.save(path / "nums.npy", np.frombuffer(nums, dtype=np.float64))
+        np.save(path / "dates.npy", np.frombuffer(dates, dtype=np.int64).view("datetime64[us]"))
+        return len(rows)
+    
+    def _load(self, sheet: models.Sheet):
+        path = self.sheet_dir(sheet)
+        rows = np.load(path / "rows.npy", mmap_mode="r")
+        cols = np.load(path / "cols.npy", mmap_mode="r")
+        offsets = np.load(path / "offsets.npy", mmap_mode="r")
+        return path, rows, cols, offsets
+    
+    def _decode(self, path: Path, offsets, indexes) -> List[str]:
+        if len(indexes) == 0:
+            return []
+        with open(path / "heap.bin", "rb") as f:
+            try:
+                heap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # heap vuoto: solo celle con testo vuoto
+                return ["" for _ in indexes]
+            with heap:
+                starts = offsets[indexes].tolist()
+                ends = offsets[indexes + 1].tolist()
+                return [heap[s:e].decode("utf-8") for s, e in zip(starts, ends)]
+    
+    def _cells(self, path: Path, rows, cols, offsets, indexes) -> List[CellValue]:
+        texts = self._decode(path, offsets, indexes)
+        row_list = rows[indexes].tolist()
+        col_list = cols[indexes].tolist()
+        
+        # Fogli scritti prima dei valori tipizzati: solo testo
+        if not (path / "types.npy").exists():
+            return [CellValue(row, col, text) for row, col, text in zip(row_list, col_list, texts)]
+        
+        types = np.load(path / "types.npy", mmap_mode="r")[indexes].tobytes().decode("ascii")
+        nums = np.load(path / "nums.npy", mmap_mode="r")[indexes].tolist()
+        dates = np.load(path / "dates.npy", mmap_mode="r")[indexes].tolist()
+        
+        cells = []
+        for row, col, text, value_type, num, when in zip(row_list, col_list, texts, types, nums, dates):
+            if value_type == CELL_NUMBER:
+                cells.append(CellValue(row, col, text, value_type, num))
+            elif value_type == CELL_DATE:
+                cells.append(CellValue(row, col, text, value_type, when))
+            elif value_type == CELL_BOOL:
+                cells.append(CellValue(row, col, text, value_type, bool(num)))
+            else:
+                cells.append(CellValue(row, col, text, CELL_TEXT))
+        return cells
+    
+    def read_range(self, db, sheet, row_start, row_end, col_start, col_end):
+        path, rows, cols, offsets = self._load(sheet)
+        
+        lo = int(np.searchsorted(rows, row_start, side="left"))
+        hi = int(np.searchsorted(rows, row_end, side="right"))
+        window_cols = cols[lo:hi]
+        indexes = np.nonzero((window_cols >= col_start) & (window_cols <= col_end))[0] + lo
+        
+        return self._cells(path, rows, cols, offsets, indexes)
+    
+    def read_all(self, db, sheet):
+        path, rows, cols, offsets = self._load(sheet)
+        return self._cells(path, rows, cols, offsets, np.arange(len(rows)))
+    
+    def iter_chunks(self, db, sheet, chunk_size=READ_CHUNK_CELLS):
+        path, rows, cols, offsets = self._load(sheet)
+        for lo in range(0, len(rows), chunk_size):
+            yield self._cells(path, rows, cols, offsets, np.arange(lo, min(lo + chunk_size, len(rows))))
+    
+    def clone_sheet(self, db, source, target):
+        src = self.sheet_dir(source)
+        dst = self.sheet_dir(target)
+        dst.mkdir(parents=True, exist_ok=True)
+        for item in src.iterdir():
+            # I file sono immutabili: un hard link evita la copia quando possibile
+            try:
+                (dst / item.name).hardlink_to(item)
+            except OSError:
+                shutil.copyfile(item, dst / item.name)
+    
+    def delete_dataset(self, db, dataset_id):
+        shutil.rmtree(self.base_dir / dataset_id / "cells", ignore_errors=True)
+
+CELL_STORES: Dict[str, CellStore] = {
+    SQLiteCellStore.name: SQLiteCellStore(),
+    ColumnarCellStore.name: ColumnarCellStore(),
+}
+
+def get_cell_store(name: str) -> CellStore:
+    try:
+        return CELL_STORES[name]
+    except KeyError:
+        raise ValueError(f"Cell store sconosciuto: {name}")
@@ -0,0 +1,59 @@
+from datetime import date, datetime, time
+from typing import Any, Optional, Tuple
+
+from .config import CELL_TEXT_MAX_LENGTH, CELL_TEXT_OVERFLOW
+
+# Tipo del valore originale di una cella (colonna `value_type`)
+CELL_TEXT = "s"
+CELL_NUMBER = "n"
+CELL_DATE = "d"
+CELL_BOOL = "b"
+
+# Policy per i testi più lunghi di CELL_TEXT_MAX_LENGTH
+OVERFLOW_TRUNCATE = "truncate"
+OVERFLOW_ERROR = "error"
+
+class CellTextTooLongError(ValueError):
+    """Testo di una cella oltre il limite con policy `error`."""
+
+def typed_value(value: Any) -> Tuple[str, Any]:
+    """
+    Restituisce (value_type, valore nativo) di un valore letto da openpyxl:
+    float per i numeri, datetime per le date, bool per i booleani.
+    Per i testi il valore nativo è None (il testo è già in value_text).
+    """
+    value_class = type(value)
+    if value_class is str:
+        return CELL_TEXT, None
+    if value_class is bool:
+        return CELL_BOOL, value
+    if value_class is int or value_class is float:
+        return CELL_NUMBER, float(value)
+    if value_class is datetime:
+        return CELL_DATE, value
+    if value_class is date:
+        return CELL_DATE, datetime.combine(value, time())
+    # time, timedelta e altri tipi restano testo
+    return CELL_TEXT, None
+
+class TextPolicy:
+    """
+    Applica la policy sui testi troppo lunghi e conta le celle troncate.
+    Un'istanza per foglio: il conteggio è salvato in Sheet.truncated_cells.
+    """
+
+    def __init__(self, max_length: Optional[int] = None, overflow: Optional[str] = None):
+        self.max_length = CELL_TEXT_MAX_LENGTH if max_length is None else max_length
+        self.overflow = overflow or CELL_TEXT_OVERFLOW
+        if self.overflow not in (OVERFLOW_TRUNCATE, OVERFLOW_ERROR):
+            raise ValueError(f"Policy di troncamento sconosciuta: {self.overflow}")
+        self.truncated = 0
+
+    def apply(self, value_text: str, row: int, col: int) -> str:
+        """Da chiamare solo per testi più lunghi di `max_length`."""
+        if self.overflow == OVERFLOW_ERROR:
+            raise CellTextTooLongError(
+                f"Cella ({row}, {col}): {len(value_text)} caratteri, limite {self.max_length}"
+            )
+        self.truncated += 1
+        return value_text[:self.max_length]
@@ -0,0 +1,204 @@
+import math
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .cell_store import CellValue
+from .cell_values import CELL_BOOL, CELL_DATE, CELL_NUMBER, CELL_TEXT
+from .config import STATS_DISTINCT_EXACT_LIMIT, STATS_TOP_K
+
+TYPE_NAMES = {
+    CELL_TEXT: "text",
+    CELL_NUMBER: "number",
+    CELL_DATE: "date",
+    CELL_BOOL: "boolean",
+}
+
+# Quota minima di valori non vuoti dello stesso tipo per assegnarlo alla colonna
+TYPE_INFERENCE_THRESHOLD = 0.9
+
+# Oltre questo numero di valori distinti il conteggio per i top-k viene potato
+TOP_K_CAPACITY_FACTOR = 100
+
+class HyperLogLog:
+    """
+    Stima del numero di valori distinti con memoria costante (2^precision
+    registri da un byte, errore standard ~1.04/sqrt(2^precision)).
+    Gli aggiornamenti sono vettoriali su array di hash a 64 bit.
+    """
+    
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+    
+    def add_hashes(self, hashes: np.ndarray):
+        if len(hashes) == 0:
+            return
+        hashes = hashes.astype(np.uint64, copy=False)
+        suffix_bits = 64 - self.precision
+        index = (hashes >> np.uint64(suffix_bits)).astype(np.int64)
+        suffix = hashes & np.uint64((1 << suffix_bits) - 1)
+        # Posizione del primo bit a 1 nei bit rimanenti (1 = bit più significativo)
+        rank = (suffix_bits - _bit_length(suffix) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+    
+    def add(self, values: Sequence[str]):
+        hashes = np.array([hash(v) for v in values], dtype=np.int64).view(np.uint64)
+        self.add_hashes(hashes)
+    
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # Correzione per cardinalità piccole (linear counting)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Numero di bit significativi di ogni elemento (uint64), senza passare da float."""
+    values = values.copy()
+    length = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= np.uint64(1 << shift)
+        length[high] += shift
+        values[high] >>= np.uint64(shift)
+    return length + (values > 0)
+
+class ColumnAccumulator:
+    """Statistiche di una colonna, aggiornate un blocco di celle alla volta."""
+    
+    def __init__(self, name: str, col: int):
+        self.name = name
+        self.col = col
+        self.type_counts = Counter()
+        self.count = 0
+        self.num_count = 0
+        self.num_sum = 0.0
+        self.num_min: Optional[float] = None
+        self.num_max: Optional[float] = None
+        self.date_min: Optional[np.datetime64] = None
+        self.date_max: Optional[np.datetime64] = None
+        self.exact: Optional[set] = set()
+        self.hll = HyperLogLog()
+        self.top = Counter()
+        self.top_pruned = False
+    
+    def update(self, types: np.ndarray, texts: np.ndarray, nums: np.ndarray, dates: np.ndarray):
+        """Aggiorna con le celle (non vuote) della colonna in un blocco."""
+        
+        self.count += len(types)
+        kinds, kind_counts = np.unique(types, return_counts=True)
+        self.type_counts.update(dict(zip(kinds.tolist(), kind_counts.tolist())))
+        
+        numbers = nums[~np.isnan(nums)]
+        if len(numbers):
+            self.num_count += len(numbers)
+            self.num_sum += float(numbers.sum())
+            low, high = float(numbers.min()), float(numbers.max())
+            self.num_min = low if self.num_min is None else min(self.num_min, low)
+            self.num_max = high if self.num_max is None else max(self.num_max, high)
+        
+        when = dates[~np.isnat(dates)]
+        if len(when):
+            low, high = when.min(), when.max()
+            self.date_min = low if self.date_min is None else min(self.date_min, low)
+            self.date_max = high if self.date_max is None else max(self.date_max, high)
+        
+        values, counts = np.unique(texts, return_counts=True)
+        values = values.tolist()
+        self.hll.add(values)
+        if self.exact is not None:
+            self.exact.update(values)
+            if len(self.exact) > STATS_DISTINCT_EXACT_LIMIT:
+                # Colonna grande: resta solo la stima HyperLogLog
+                self.exact = None
+        
+        self.top.update(dict(zip(values, counts.tolist())))
+        capacity = STATS_TOP_K * TOP_K_CAPACITY_FACTOR
+        if len(self.top) > capacity:
+            self.top = Counter(dict(self.top.most_common(capacity // 2)))
+            self.top_pruned = True
+    
+    def inferred_type(self) -> str:
+        if not self.count:
+            return "empty"
+        value_type, n = self.type_counts.most_common(1)[0]
+        if n / self.count >= TYPE_INFERENCE_THRESHOLD:
+            return TYPE_NAMES.get(value_type, "text")
+        return "mixed"
+    
+    def to_dict(self, total_rows: int) -> Dict[str, Any]:
+        null_count = total_rows - self.count
+        result = {
+            "column": self.name,
+            "col": self.col,
+            "inferred_type": self.inferred_type(),
+            "type_counts": {TYPE_NAMES.get(k, k): v for k, v in sorted(self.type_counts.items())},
+            "count": self.count,
+            "null_count": null_count,
+            "null_ratio": null_count / total_rows if total_rows else 0.0,
+            "distinct": len(self.exact) if self.exact is not None else self.hll.count(),
+            "distinct_approximate": self.exact is None,
+            "min": None,
+            "max": None,
+            "mean": None,
+            "top_values": [
+                {"value": value, "count": count} for value, count in self.top.most_common(STATS_TOP_K)
+            ],
+            "top_values_approximate": self.top_pruned,
+        }
+        if self.num_count:
+            result.update(min=self.num_min, max=self.num_max, mean=self.num_sum / self.num_count)
+        elif self.date_min is not None:
+            result.update(
+                min=np.datetime_as_string(self.date_min, unit="s"),
+                max=np.datetime_as_string(self.date_max, unit="s")
+            )
+        return result
+
+class TableStats:
+    """
+    Statistiche per colonna di un candidato tabella in un solo passaggio:
+    ogni blocco di celle letto dal cell store è convertito in array NumPy
+    e suddiviso per colonna, senza materializzare la tabella.
+    """
+    
+    def __init__(self, headers: List[str], col_start: int):
+        self.col_start = col_start
+        self.columns = [ColumnAccumulator(name, col_start + i) for i, name in enumerate(headers)]
+        self.rows = 0
+    
+    def add_chunk(self, n_rows: int, cells: Sequence[CellValue]):
+        self.rows += n_rows
+        if not cells:
+            return
+        
+        cols = np.fromiter((c.col for c in cells), dtype=np.int64, count=len(cells))
+        types = np.array([c.value_type for c in cells], dtype="U1")
+        texts = np.array([c.value_text for c in cells], dtype=object)
+        nums = np.fromiter(
+            (c.value if c.value_type == CELL_NUMBER else math.nan for c in cells),
+            dtype=np.float64, count=len(cells)
+        )
+        dates = np.array(
+            [c.value if c.value_type == CELL_DATE else None for c in cells],
+            dtype="datetime64[us]"
+        )
+        
+        # Celle raggruppate per colonna (ordinamento stabile)
+        order = np.argsort(cols, kind="stable")
+        sorted_cols = cols[order]
+        bounds = np.flatnonzero(np.diff(sorted_cols)) + 1
+        for segment in np.split(order, bounds):
+            column = self.columns[int(cols[segment[0]]) - self.col_start]
+            column.update(types[segment], texts[segment], nums[segment], dates[segment])
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "columns": [column.to_dict(self.rows) for column in self.columns],
+        }
@@ -0,0 +1,91 @@
+import os
+from pathlib import Path
+
+# Directory di storage: file per-dataset, file originali per contenuto e
+# database SQLite di default
+STORAGE_DIR = Path(os.getenv("STORAGE_DIR", "storage"))
+UPLOAD_DIR = STORAGE_DIR / "uploads"
+BLOB_DIR = STORAGE_DIR / "blobs"
+
+# Numero di thread dedicati all'ingestione dei file caricati
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+
+# Engine di lettura dei workbook per gli upload che non ne indicano uno:
+# "stream" (XML in streaming), "openpyxl" o "calamine" (richiede python-calamine)
+XLSX_READER_ENGINE = os.getenv("XLSX_READER_ENGINE", "stream")
+
+# Processi per il parsing parallelo dei fogli di un workbook (1 = sequenziale)
+SHEET_WORKERS = int(os.getenv("SHEET_WORKERS", "1"))
+
+# Dimensione massima di un file caricato (byte) e dimensione dei blocchi di scrittura
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(100 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Backend per le celle dei nuovi fogli: "sqlite" (tabella cells) o "columnar" (file per foglio)
+CELL_STORE = os.getenv("CELL_STORE", "sqlite")
+
+# Database: URL SQLAlchemy (sqlite:///... o postgresql://...) ed eventuale URL
+# separato per le letture delle API (ad esempio una replica)
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{STORAGE_DIR / 'datasets.db'}")
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", DATABASE_URL)
+
+# PostgreSQL: partizioni hash della tabella cells per sheet_id (0 = non partizionata).
+# Vale alla creazione della tabella
+DB_CELLS_PARTITIONS = int(os.getenv("DB_CELLS_PARTITIONS", "0"))
+
+# Tuning SQLite: page cache (KiB) e dimensione della mappatura in memoria (byte)
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Attesa massima (secondi) del lock di scrittura SQLite: l'ingestione lo tiene
+# per un intero foglio, gli altri scrittori (job paralleli, API) attendono
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "300"))
+
+# Pool di connessioni: scritture (una sola alla volta in SQLite) e letture
+# concorrenti in WAL, su connessioni separate in sola lettura
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Thread per gli handler sincroni delle API (limite del threadpool di AnyIO)
+API_THREADS = int(os.getenv("API_THREADS", "40"))
+
+# Indicizza il testo delle celle per la ricerca (/api/search) durante l'ingestione
+SEARCH_INDEX = os.getenv("SEARCH_INDEX", "1") == "1"
+
+# Rielaborazione dei dataset (reprocess.py): processi per la rianalisi dei
+# fogli e fogli per transazione (e in memoria contemporaneamente)
+REPROCESS_WORKERS = int(os.getenv("REPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+REPROCESS_BATCH_SIZE = int(os.getenv("REPROCESS_BATCH_SIZE", "32"))
+
+# Header Server-Timing con le fasi misurate e le query SQL di ogni richiesta
+# (le metriche su /metrics sono sempre raccolte)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+# Profiling delle ingestioni (flamegraph): tutti gli upload o solo quelli con
+# `profile=true`, e intervallo di campionamento dello stack (secondi)
+PROFILE_UPLOADS = os.getenv("PROFILE_UPLOADS", "0") == "1"
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+
+# Numero massimo di elementi nelle cache LRU in-process (0 = disabilitata)
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "1024"))
+PREVIEW_CACHE_SIZE = int(os.getenv("PREVIEW_CACHE_SIZE", "256"))
+
+# Righe lette dal cell store per ogni blocco dell'export in streaming
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+
+# Lunghezza massima del testo di una cella e cosa fare oltre il limite:
+# "truncate" (tronca e conta le celle troncate) o "error" (l'ingestione fallisce)
+CELL_TEXT_MAX_LENGTH = int(os.getenv("CELL_TEXT_MAX_LENGTH", "2000"))
+CELL_TEXT_OVERFLOW = os.getenv("CELL_TEXT_OVERFLOW", "truncate")
+
+# Statistiche per colonna: distinti esatti fino a questa soglia (poi HyperLogLog)
+# e numero di valori più frequenti restituiti
+STATS_DISTINCT_EXACT_LIMIT = int(os.getenv("STATS_DISTINCT_EXACT_LIMIT", "10000"))
+STATS_TOP_K = int(os.getenv("STATS_TOP_K", "10"))
+
+# Dimensione delle tile della griglia (righe x colonne) e validità in cache HTTP (secondi)
+TILE_ROWS = int(os.getenv("TILE_ROWS", "256"))
+TILE_COLS = int(os.getenv("TILE_COLS", "32"))
+TILE_MAX_AGE = int(os.getenv("TILE_MAX_AGE", str(24 * 3600)))
@@ -1,20 +1,139 @@
+import base64
 import hashlib
 import uuid
 import os
 import json
+import logging
+import multiprocessing
+import shutil
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterable, Iterator, NamedTuple, Optional, Sequence, Tuple
+from sqlalchemy import and_, func, insert, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from openpyxl import load_workbook
 from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
 
-from . import models, schemas
-from .table_detection import analyze_sheet_structure
+from . import models, schemas, search
+from .bulk_load import LoadStats
+from .cache import analysis_cache, preview_cache, invalidate_dataset
+from .cell_store import CellValue, TypedCell, get_cell_store
+from .cell_values import CELL_DATE, CELL_NUMBER, TextPolicy, typed_value
+from .column_stats import TableStats
+from .config import (
+    MAX_UPLOAD_SIZE, UPLOAD_CHUNK_SIZE, UPLOAD_DIR, BLOB_DIR, CELL_STORE, SHEET_WORKERS,
+    CELL_TEXT_MAX_LENGTH, CELL_TEXT_OVERFLOW, EXPORT_CHUNK_ROWS, TILE_ROWS, TILE_COLS, SEARCH_INDEX, XLSX_READER_ENGINE
+)
+from .table_detection import DETECTOR_VERSION, MergedRange, SheetAnalyzer
+from .metrics import TimedIterator, record_ingest, record_stage, span, timed
+from .readers import open_workbook
 
-UPLOAD_DIR = Path("storage/uploads")
+logger = logging.getLogger(__name__)
 
-def get_datasets(db: Session, skip: int = 0, limit: int = 100) -> List[models.Dataset]:
-    return db.query(models.Dataset).offset(skip).limit(limit).all()
+# Un file xlsx è un archivio ZIP: i primi byte sono sempre la firma locale
+XLSX_MAGIC = b"PK\x03\x04"
+
+# Versione del formato delle tile: cambiarla invalida gli ETag già emessi
+GRID_TILE_FORMAT = 1
+
+class UploadError(Exception):
+    """File caricato non valido."""
+    status_code = 400
+
+class UploadTooLargeError(UploadError):
+    """File caricato oltre la dimensione massima consentita."""
+    status_code = 413
+
+class DatasetFilters(NamedTuple):
+    filename: Optional[str] = None
+    uploaded_from: Optional[datetime] = None
+    uploaded_to: Optional[datetime] = None
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+
+def encode_cursor(dataset: models.Dataset) -> str:
+    """Cursore opaco con la chiave (upload_date, id) dell'ultimo dataset della pagina."""
+    raw = f"{dataset.upload_date.isoformat()}|{dataset.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        upload_date, dataset_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(upload_date), dataset_id
+    except (ValueError, UnicodeError) as exc:
+        raise ValueError("Cursore non valido") from exc
+
+def _as_utc(value: datetime) -> datetime:
+    # Su SQLite le date sono memorizzate in UTC senza fuso: confronto coerente
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def get_datasets(
+    db: Session,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    filters: DatasetFilters = DatasetFilters(),
+    offset: Optional[int] = None
+) -> Tuple[List[Tuple[models.Dataset, int]], Optional[str]]:
+    """
+    Pagina di dataset, dal più recente, con il numero di sheet di ciascuno.
+    
+    Un'unica query: il conteggio è una subquery correlata risolta
+    sull'indice (dataset_id, sheet_name), valutata solo per le righe della
+    pagina. La paginazione è keyset su (upload_date, id): il costo non cresce
+    con la posizione della pagina. Restituisce le righe e il cursore della
+    pagina successiva (None se è l'ultima).
+    
+    `offset` (parametro deprecato `skip` delle API) salta righe dopo il
+    cursore, con il costo lineare della paginazione per offset.
+    """
+    
+    sheet_count = (
+        select(func.count(models.Sheet.id))
+        .where(models.Sheet.dataset_id == models.Dataset.id)
+        .correlate(models.Dataset)
+        .scalar_subquery()
+    )
+    query = db.query(models.Dataset, sheet_count)
+    
+    if filters.filename:
+        # Prefisso del nome senza distinzione di maiuscole: intervallo sull'indice di filename_key
+        prefix = filters.filename.lower()
+        query = query.filter(
+            models.Dataset.filename_key >= prefix,
+            models.Dataset.filename_key < prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        )
+    if filters.uploaded_from is not None:
+        query = query.filter(models.Dataset.upload_date >= _as_utc(filters.uploaded_from))
+    if filters.uploaded_to is not None:
+        query = query.filter(models.Dataset.upload_date <= _as_utc(filters.uploaded_to))
+    if filters.min_size is not None:
+        query = query.filter(models.Dataset.file_size >= filters.min_size)
+    if filters.max_size is not None:
+        query = query.filter(models.Dataset.file_size <= filters.max_size)
+    
+    if cursor:
+        upload_date, dataset_id = decode_cursor(cursor)
+        upload_date = _as_utc(upload_date)
+        query = query.filter(or_(
+            models.Dataset.upload_date < upload_date,
+            and_(models.Dataset.upload_date == upload_date, models.Dataset.id < dataset_id)
+        ))
+    
+    # Una riga in più indica se esiste una pagina successiva
+    query = query.order_by(models.Dataset.upload_date.desc(), models.Dataset.id.desc())
+    if offset:
+        query = query.offset(offset)
+    rows = query.limit(limit + 1).all()
+    
+    page = [(dataset, count) for dataset, count in rows[:limit]]
+    next_cursor = encode_cursor(page[-1][0]) if len(rows) > limit else None
+    return page, next_cursor
 
 def get_dataset(db: Session, dataset_id: str) -> models.Dataset:
     return db.query(models.Dataset).filter(models.Dataset.id == dataset_id).first()
@@ -22,114 +141,626 @@ def get_dataset(db: Session, dataset_id: str) -> models.Dataset:
 def get_sheets_by_dataset(db: Session, dataset_id: str) -> List[models.Sheet]:
     return db.query(models.Sheet).filter(models.Sheet.dataset_id == dataset_id).all()
 
+def count_sheets(db: Session, dataset_id: str) -> int:
+    return db.query(models.Sheet).filter(models.Sheet.dataset_id == dataset_id).count()
+
 def get_sheet(db: Session, dataset_id: str, sheet_name: str) -> models.Sheet:
     return db.query(models.Sheet).filter(
         models.Sheet.dataset_id == dataset_id,
         models.Sheet.sheet_name == sheet_name
     ).first()
 
-async def create_dataset(db: Session, file: UploadFile) -> models.Dataset:
-    """Crea dataset da file xlsx caricato."""
+async def create_dataset(db: Session, file: UploadFile, reader_engine: Optional[str] = None) -> models.Dataset:
+    """
+    Crea dataset da file xlsx caricato.
+    
+    Il file originale è memorizzato per contenuto (SHA256): se lo stesso file
+    è già stato caricato ed elaborato, sheet e celle vengono copiati in SQL
+    senza rielaborare il workbook. Altrimenti l'elaborazione avviene in
+    background (vedi jobs.py) con l'engine di lettura `reader_engine`.
+    """
     
     # Genera ID univoco
     dataset_id = str(uuid.uuid4())
     
-    # Crea directory per il dataset
-    dataset_dir = UPLOAD_DIR / dataset_id
-    dataset_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Salva file originale
-    file_path = dataset_dir / "original.xlsx"
-    content = await file.read()
+    # Salva file in area di staging (in streaming, con hash incrementale)
+    staging_dir = BLOB_DIR / "incoming"
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    staged_path = staging_dir / f"{dataset_id}.xlsx"
+    with span("upload_save"):
+        sha256_hash, file_size = await save_upload(file, staged_path)
     
-    with open(file_path, "wb") as f:
-        f.write(content)
+    # Le operazioni sul database sono sincrone: fuori dall'event loop
+    with span("upload_register"):
+        return await run_in_threadpool(
+            register_dataset, db, dataset_id, file.filename, staged_path, sha256_hash, file_size, reader_engine
+        )
+
+def register_dataset(
+    db: Session,
+    dataset_id: str,
+    filename: str,
+    staged_path: Path,
+    sha256_hash: str,
+    file_size: int,
+    reader_engine: Optional[str] = None
+) -> models.Dataset:
+    """Registra il file salvato in staging come blob e crea il record Dataset."""
     
-    # Calcola SHA256
-    sha256_hash = hashlib.sha256(content).hexdigest()
+    try:
+        blob = store_blob(db, sha256_hash, staged_path, file_size)
+    finally:
+        staged_path.unlink(missing_ok=True)
     
     # Crea record Dataset
     dataset = models.Dataset(
         id=dataset_id,
-        filename=file.filename,
+        filename=filename,
         sha256=sha256_hash,
-        file_path=str(file_path),
-        file_size=len(content)
+        file_path=blob.file_path,
+        file_size=file_size,
+        reader_engine=reader_engine
     )
     
     db.add(dataset)
     db.commit()
     db.refresh(dataset)
     
-    # Processa il file Excel
-    process_excel_file(db, dataset_id, file_path)
+    # Fast path: contenuto già elaborato per un altro dataset
+    source = find_processed_duplicate(db, dataset)
+    if source:
+        clone_dataset_content(db, source.id, dataset.id)
     
     return dataset
 
-def process_excel_file(db: Session, dataset_id: str, file_path: Path):
-    """Processa file Excel e salva sheet + celle."""
+def blob_path(sha256_hash: str) -> Path:
+    return BLOB_DIR / sha256_hash[:2] / f"{sha256_hash}.xlsx"
+
+def store_blob(db: Session, sha256_hash: str, staged_path: Path, file_size: int) -> models.Blob:
+    """Registra il file nello storage per contenuto incrementando il reference count."""
+    
+    blob = db.get(models.Blob, sha256_hash)
+    if blob:
+        result = db.execute(
+            update(models.Blob)
+            .where(models.Blob.sha256 == sha256_hash)
+            .values(ref_count=models.Blob.ref_count + 1)
+        )
+        if result.rowcount:
+            db.commit()
+            return blob
+        
+        # Rimosso da un release_blob concorrente dopo la lettura: il blob è ricreato
+        db.rollback()
+        db.expunge(blob)
+    
+    path = blob_path(sha256_hash)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(staged_path, path)
+    
+    blob = models.Blob(sha256=sha256_hash, file_path=str(path), file_size=file_size, ref_count=1)
+    db.add(blob)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Upload concorrente dello stesso contenuto: il blob esiste già
+        db.rollback()
+        return store_blob(db, sha256_hash, staged_path, file_size)
+    
+    return blob
+
+def release_blob(db: Session, sha256_hash: str):
+    """Decrementa il reference count e rimuove il file quando non più usato."""
+    
+    # Decremento atomico come in store_blob: un upload concorrente dello
+    # stesso contenuto non va perso
+    db.execute(
+        update(models.Blob)
+        .where(models.Blob.sha256 == sha256_hash)
+        .values(ref_count=models.Blob.ref_count - 1)
+    )
+    
+    # Il conteggio è riletto dopo il decremento, nella stessa transazione
+    blob = db.get(models.Blob, sha256_hash, populate_existing=True)
+    if not blob or blob.ref_count > 0:
+        db.commit()
+        return
+    
+    # Il file è rimosso solo a eliminazione confermata: se il commit fallisce
+    # il record resta valido e punta ancora al file
+    unused_path = Path(blob.file_path)
+    db.delete(blob)
+    db.commit()
+    unused_path.unlink(missing_ok=True)
+
+def find_processed_duplicate(db: Session, dataset: models.Dataset) -> Optional[models.Dataset]:
+    """
+    Cerca un altro dataset con lo stesso contenuto già elaborato con successo
+    con lo stesso engine di lettura (NULL è l'engine di default).
+    """
+    
+    pending_jobs = select(models.Job.id).where(
+        models.Job.dataset_id == models.Dataset.id,
+        models.Job.status != models.JOB_DONE
+    ).exists()
     
-    wb = load_workbook(filename=file_path, read_only=True, data_only=True)
+    done_jobs = select(models.Job.id).where(
+        models.Job.dataset_id == models.Dataset.id,
+        models.Job.status == models.JOB_DONE
+    ).exists()
+    
+    return db.query(models.Dataset).filter(
+        models.Dataset.sha256 == dataset.sha256,
+        models.Dataset.id != dataset.id,
+        func.coalesce(models.Dataset.reader_engine, XLSX_READER_ENGINE) == (dataset.reader_engine or XLSX_READER_ENGINE),
+        done_jobs,
+        ~pending_jobs
+    ).first()
+
+def clone_dataset_content(db: Session, source_id: str, dataset_id: str):
+    """Copia sheet e celle di un dataset su un altro con INSERT ... SELECT."""
     
-    for sheet_name in wb.sheetnames:
-        ws = wb[sheet_name]
+    sheet_columns = [
+        "sheet_name", "n_rows", "n_cols", "merged_cells_count", "merged_ranges", "analysis_json", "detector_version",
+        "cell_store", "truncated_cells"
+    ]
+    db.execute(
+        insert(models.Sheet).from_select(
+            ["dataset_id"] + sheet_columns,
+            select(literal(dataset_id), *[getattr(models.Sheet, c) for c in sheet_columns])
+            .where(models.Sheet.dataset_id == source_id)
+        )
+    )
+    
+    # Le celle vengono ricollegate ai nuovi sheet per nome
+    targets = {s.sheet_name: s for s in get_sheets_by_dataset(db, dataset_id)}
+    stats_columns = [models.CandidateStats.candidate, models.CandidateStats.candidate_hash, models.CandidateStats.stats_json]
+    for source in get_sheets_by_dataset(db, source_id):
+        target = targets[source.sheet_name]
+        get_cell_store(source.cell_store).clone_sheet(db, source, target)
+        index_sheet_for_search(db, target)
+        db.execute(
+            insert(models.CandidateStats).from_select(
+                ["sheet_id"] + [column.name for column in stats_columns],
+                select(literal(target.id), *stats_columns).where(models.CandidateStats.sheet_id == source.id)
+            )
+        )
+    db.commit()
+
+def delete_dataset(db: Session, dataset: models.Dataset):
+    """Elimina un dataset con sheet, celle e job; il file originale è rilasciato."""
+    
+    dataset_id = dataset.id
+    sha256_hash = dataset.sha256
+    
+    clear_dataset_content(db, dataset_id)
+    db.query(models.Job).filter(models.Job.dataset_id == dataset_id).delete(synchronize_session=False)
+    db.delete(dataset)
+    db.commit()
+    
+    release_blob(db, sha256_hash)
+    invalidate_dataset(dataset_id)
+    
+    # Directory per-dataset (file derivati o upload precedenti allo storage per contenuto)
+    shutil.rmtree(UPLOAD_DIR / dataset_id, ignore_errors=True)
+
+async def save_upload(
+    file: UploadFile,
+    dest: Path,
+    max_size: Optional[int] = None,
+    chunk_size: Optional[int] = None
+) -> tuple[str, int]:
+    """
+    Scrive l'upload su disco a blocchi calcolando lo SHA256 al volo.
+    La memoria usata è limitata a un blocco indipendentemente dalla dimensione del file.
+    Restituisce (sha256, dimensione in byte).
+    """
+    
+    max_size = max_size or MAX_UPLOAD_SIZE
+    chunk_size = chunk_size or UPLOAD_CHUNK_SIZE
+    
+    # Rifiuta subito se la dimensione dichiarata supera il limite
+    if file.size is not None and file.size > max_size:
+        raise UploadTooLargeError(f"File troppo grande (max {max_size} byte)")
+    
+    sha256 = hashlib.sha256()
+    size = 0
+    tmp_path = dest.with_name(dest.name + ".part")
+    
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                
+                if size == 0 and not chunk.startswith(XLSX_MAGIC):
+                    raise UploadError("Il file non è un xlsx valido")
+                
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLargeError(f"File troppo grande (max {max_size} byte)")
+                
+                # Hash e scrittura di un blocco (fino a 1 MiB) fuori dall'event loop
+                await run_in_threadpool(_write_chunk, f, sha256, chunk)
         
-        # Calcola dimensioni
-        max_row = ws.max_row or 0
-        max_col = ws.max_column or 0
+        if size == 0:
+            raise UploadError("File vuoto")
         
-        # Conta merged cells (best effort)
-        merged_count = 0
-        try:
-            if hasattr(ws, 'merged_cells'):
-                merged_count = len(ws.merged_cells.ranges)
-        except:
-            merged_count = 0
+        os.replace(tmp_path, dest)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    
+    return sha256.hexdigest(), size
+
+def _write_chunk(f, sha256, chunk: bytes):
+    sha256.update(chunk)
+    f.write(chunk)
+
+def clear_dataset_content(db: Session, dataset_id: str):
+    """Elimina sheet e celle di un dataset (es. dopo un'ingestione fallita)."""
+    invalidate_dataset(dataset_id)
+    search.delete_sheets(db, [
+        sheet_id for sheet_id, in db.query(models.Sheet.id).filter(models.Sheet.dataset_id == dataset_id)
+    ])
+    for store_name, in db.query(models.Sheet.cell_store).filter(
+        models.Sheet.dataset_id == dataset_id
+    ).distinct():
+        get_cell_store(store_name).delete_dataset(db, dataset_id)
+    db.query(models.Sheet).filter(models.Sheet.dataset_id == dataset_id).delete(synchronize_session=False)
+    db.commit()
+
+def iter_sheet_cells(ws, policy: Optional[TextPolicy] = None) -> Iterator[TypedCell]:
+    """
+    Genera (row, col, value_text, value_type, valore nativo) delle celle non
+    vuote in ordine di riga. Il tipo viene dal valore letto (numeri, date e
+    booleani restano nativi); i testi oltre il limite seguono `policy`.
+    """
+    policy = policy or TextPolicy()
+    max_length = policy.max_length
+    for row_idx, col_idx, value in ws.iter_cells():
+        value_text = str(value).strip()
+        if not value_text:
+            continue
+        if len(value_text) > max_length:
+            value_text = policy.apply(value_text, row_idx, col_idx)
+        value_type, native = typed_value(value)
+        yield row_idx, col_idx, value_text, value_type, native
+
+def index_sheet_for_search(db: Session, sheet: models.Sheet):
+    """Aggiunge le celle del foglio all'indice di ricerca (se SEARCH_INDEX)."""
+    if SEARCH_INDEX:
+        with span("ingest_search_index"):
+            search.index_sheet(db, sheet)
+
+def sheet_merged_ranges(sheet: models.Sheet) -> List[MergedRange]:
+    return [tuple(r) for r in json.loads(sheet.merged_ranges)] if sheet.merged_ranges else []
+
+def finish_sheet(sheet: models.Sheet, n_rows: int, n_cols: int, merged_ranges: Sequence[MergedRange]):
+    """Dimensioni e intervalli uniti, noti solo dopo la lettura completa del foglio."""
+    sheet.n_rows = n_rows
+    sheet.n_cols = n_cols
+    sheet.merged_cells_count = len(merged_ranges)
+    sheet.merged_ranges = json.dumps([list(r) for r in merged_ranges]) if merged_ranges else None
+
+ProgressCallback = Callable[[str, str, int, int], None]
+
+class ParsedSheet(NamedTuple):
+    """Foglio letto e analizzato da un worker, pronto per la scrittura."""
+    sheet_name: str
+    n_rows: int
+    n_cols: int
+    merged_ranges: List[MergedRange]
+    rows: array
+    cols: array
+    values: List[str]
+    value_types: List[str]
+    natives: List[Any]
+    truncated_cells: int
+    analysis_json: str
+
+def parse_sheet(file_path: Path, sheet_name: str, engine: Optional[str] = None) -> ParsedSheet:
+    """
+    Legge e analizza un singolo foglio con l'engine di lettura indicato.
+    Eseguita nei processi worker: non accede al database.
+    """
+    
+    with open_workbook(file_path, engine) as reader:
+        ws = reader.sheet(sheet_name)
         
-        # Estrai celle non vuote
-        cells_data = []
-        for row_idx, row in enumerate(ws.iter_rows(values_only=True), start=1):
-            for col_idx, value in enumerate(row, start=1):
-                if value is not None and str(value).strip():
-                    value_text = str(value).strip()[:2000]
-                    cells_data.append({
-                        "dataset_id": dataset_id,
-                        "sheet_name": sheet_name,
-                        "row": row_idx,
-                        "col": col_idx,
-                        "value_text": value_text
-                    })
+        analyzer = SheetAnalyzer()
+        policy = TextPolicy()
+        values, value_types, natives = [], [], []
+        for _, _, value_text, value_type, native in analyzer.observe(iter_sheet_cells(ws, policy)):
+            values.append(value_text)
+            value_types.append(value_type)
+            natives.append(native)
+        analyzer.merged_ranges = ws.merged_ranges
         
-        # Batch insert celle (1000 alla volta)
-        batch_size = 1000
-        for i in range(0, len(cells_data), batch_size):
-            batch = cells_data[i:i+batch_size]
-            db.bulk_insert_mappings(models.Cell, batch)
-            db.commit()
+        return ParsedSheet(
+            sheet_name=sheet_name,
+            n_rows=ws.max_row,
+            n_cols=ws.max_col,
+            merged_ranges=ws.merged_ranges,
+            rows=analyzer.rows,
+            cols=analyzer.cols,
+            values=values,
+            value_types=value_types,
+            natives=natives,
+            truncated_cells=policy.truncated,
+            analysis_json=analyzer.to_json()
+        )
+
+def create_sheet(db: Session, dataset_id: str, sheet_name: str, n_rows: int, n_cols: int, merged_count: int) -> models.Sheet:
+    """Crea record Sheet (serve l'id per collegare le celle)."""
+    
+    sheet = models.Sheet(
+        dataset_id=dataset_id,
+        sheet_name=sheet_name,
+        n_rows=n_rows,
+        n_cols=n_cols,
+        merged_cells_count=merged_count,
+        cell_store=CELL_STORE
+    )
+    
+    db.add(sheet)
+    db.flush()
+    return sheet
+
+def process_excel_file(
+    db: Session,
+    dataset_id: str,
+    file_path: Path,
+    progress: Optional[ProgressCallback] = None,
+    workers: Optional[int] = None,
+    engine: Optional[str] = None
+) -> LoadStats:
+    """
+    Processa file Excel e salva sheet + celle.
+    Restituisce il numero di celle caricate e il tempo impiegato.
+    
+    I testi oltre CELL_TEXT_MAX_LENGTH sono troncati e contati (o fanno
+    fallire l'ingestione, secondo CELL_TEXT_OVERFLOW). Con SEARCH_INDEX il
+    testo delle celle di ogni foglio è indicizzato per la ricerca nella stessa
+    transazione del foglio.
+    
+    Con `workers` > 1 (default SHEET_WORKERS) i fogli sono letti e analizzati
+    in parallelo da un pool di processi, mentre questo processo resta l'unico
+    a scrivere sul database.
+    
+    `engine` sceglie il lettore del workbook (vedi readers.py, default
+    XLSX_READER_ENGINE).
+    
+    Se fornita, `progress(stato, sheet_name, sheets_done, sheets_total)` viene
+    invocata solo fuori dalla transazione del foglio: "parsing" prima di
+    leggerlo, "analyzing" dopo il commit di celle e analisi (il chiamante può
+    quindi salvare lo stato del job con un commit sulla stessa sessione).
+    """
+    
+    workers = workers or SHEET_WORKERS
+    start = time.perf_counter()
+    
+    # Il lettore è chiuso anche se l'ingestione fallisce
+    with open_workbook(file_path, engine) as reader:
+        sheet_names = reader.sheetnames
+        if workers <= 1 or len(sheet_names) <= 1:
+            total_cells, truncated = process_sheets_sequentially(db, dataset_id, reader, progress)
+            return ingest_stats(dataset_id, total_cells, truncated, start, file_path)
+    
+    # I processi del pool aprono il file per conto proprio
+    total_cells, truncated = process_sheets_in_parallel(
+        db, dataset_id, file_path, sheet_names, workers, progress, engine
+    )
+    return ingest_stats(dataset_id, total_cells, truncated, start, file_path)
+
+def process_sheets_sequentially(
+    db: Session,
+    dataset_id: str,
+    reader,
+    progress: Optional[ProgressCallback] = None
+) -> Tuple[int, int]:
+    """
+    Lettura, analisi e scrittura dei fogli uno alla volta nel processo corrente.
+    Celle e intervalli uniti sono letti in un solo passaggio per foglio.
+    Restituisce il numero di celle scritte e di celle con testo troncato.
+    """
+    
+    sheet_names = reader.sheetnames
+    sheets_total = len(sheet_names)
+    total_cells = 0
+    truncated = 0
+    
+    for sheet_idx, sheet_name in enumerate(sheet_names):
+        if progress:
+            progress("parsing", sheet_name, sheet_idx, sheets_total)
         
-        # Analizza struttura tabella
-        cells_objects = db.query(models.Cell).filter(
-            models.Cell.dataset_id == dataset_id,
-            models.Cell.sheet_name == sheet_name
-        ).all()
+        ws = reader.sheet(sheet_name)
+        sheet = create_sheet(db, dataset_id, sheet_name, ws.max_row, ws.max_col, 0)
         
-        analysis_json = analyze_sheet_structure(cells_objects)
+        # Le celle sono analizzate mentre vengono scritte: nessuna rilettura dal database.
+        # Lettura e scrittura sono interlacciate: il tempo di lettura è misurato
+        # a blocchi sul generatore, l'inserimento è il resto
+        analyzer = SheetAnalyzer()
+        policy = TextPolicy()
+        store = get_cell_store(sheet.cell_store)
+        cells = TimedIterator(iter_sheet_cells(ws, policy))
+        load_start = time.perf_counter()
+        total_cells += store.write_sheet(db, sheet, analyzer.observe(cells))
+        record_stage("ingest_read", cells.seconds)
+        record_stage("ingest_insert", time.perf_counter() - load_start - cells.seconds)
+        index_sheet_for_search(db, sheet)
+        finish_sheet(sheet, ws.max_row, ws.max_col, ws.merged_ranges)
+        analyzer.merged_ranges = ws.merged_ranges
+        sheet.truncated_cells = policy.truncated
+        truncated += policy.truncated
         
-        # Crea record Sheet
-        sheet = models.Sheet(
-            dataset_id=dataset_id,
-            sheet_name=sheet_name,
-            n_rows=max_row,
-            n_cols=max_col,
-            merged_cells_count=merged_count,
-            analysis_json=analysis_json
+        # Analizza struttura tabella: salvata nella stessa transazione delle celle
+        sheet.analysis_json = analyzer.to_json()
+        sheet.detector_version = DETECTOR_VERSION
+        with span("ingest_commit"):
+            db.commit()
+        
+        if progress:
+            progress("analyzing", sheet_name, sheet_idx, sheets_total)
+    
+    return total_cells, truncated
+
+def ingest_stats(dataset_id: str, total_cells: int, truncated: int, start: float, file_path: Path) -> LoadStats:
+    stats = LoadStats(rows=total_cells, seconds=time.perf_counter() - start, truncated=truncated)
+    record_ingest(stats.rows, file_path.stat().st_size, stats.seconds)
+    logger.info(
+        "Dataset %s: %d celle in %.2fs (%.0f celle/s)",
+        dataset_id, stats.rows, stats.seconds, stats.rows_per_sec
+    )
+    if truncated:
+        logger.warning(
+            "Dataset %s: testo troncato a %d caratteri in %d celle",
+            dataset_id, CELL_TEXT_MAX_LENGTH, truncated
         )
+    return stats
+
+def process_sheets_in_parallel(
+    db: Session,
+    dataset_id: str,
+    file_path: Path,
+    sheet_names: List[str],
+    workers: int,
+    progress: Optional[ProgressCallback] = None,
+    engine: Optional[str] = None
+) -> Tuple[int, int]:
+    """
+    Parsing e analisi dei fogli in un pool di processi, scrittura nel processo corrente.
+    Restituisce il numero di celle scritte e di celle con testo troncato.
+    """
+    
+    sheets_total = len(sheet_names)
+    total_cells = 0
+    truncated = 0
+    
+    # spawn: il chiamante può essere un thread del server, fork non è sicuro
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, sheets_total), mp_context=context) as executor:
+        futures = [executor.submit(parse_sheet, file_path, name, engine) for name in sheet_names]
         
-        db.add(sheet)
-        db.commit()
+        # Scrittura nell'ordine dei fogli, mentre gli altri worker continuano il parsing
+        for sheet_idx, future in enumerate(futures):
+            if progress:
+                progress("parsing", sheet_names[sheet_idx], sheet_idx, sheets_total)
+            
+            with span("ingest_parse_wait"):
+                parsed = future.result()
+            sheet = create_sheet(
+                db, dataset_id, parsed.sheet_name,
+                parsed.n_rows, parsed.n_cols, len(parsed.merged_ranges)
+            )
+            finish_sheet(sheet, parsed.n_rows, parsed.n_cols, parsed.merged_ranges)
+            
+            store = get_cell_store(sheet.cell_store)
+            with span("ingest_insert"):
+                total_cells += store.write_sheet(
+                    db, sheet,
+                    zip(parsed.rows, parsed.cols, parsed.values, parsed.value_types, parsed.natives)
+                )
+            index_sheet_for_search(db, sheet)
+            sheet.truncated_cells = parsed.truncated_cells
+            truncated += parsed.truncated_cells
+            
+            sheet.analysis_json = parsed.analysis_json
+            sheet.detector_version = DETECTOR_VERSION
+            with span("ingest_commit"):
+                db.commit()
+            
+            if progress:
+                progress("analyzing", parsed.sheet_name, sheet_idx, sheets_total)
+    
+    return total_cells, truncated
+
+def get_cells_in_range(
+    db: Session,
+    sheet: models.Sheet,
+    row_start: int,
+    row_end: int,
+    col_start: int,
+    col_end: int
+) -> Sequence[CellValue]:
+    """Restituisce le celle (CellValue) nel rettangolo."""
+    store = get_cell_store(sheet.cell_store)
+    return store.read_range(db, sheet, row_start, row_end, col_start, col_end)
+
+def build_headers(
+    cells: Iterable[CellValue],
+    candidate: Dict[str, Any],
+    merged_ranges: Sequence[MergedRange] = ()
+) -> List[str]:
+    """
+    Intestazioni del candidato tabella (ColN per le celle vuote). Il testo di
+    una cella unita vale per tutte le colonne che copre; con un header su più
+    righe i testi di ogni colonna sono uniti con " / " (es. "Vendite 2023 / Q1").
+    """
+    col_start, col_end = candidate["col_start"], candidate["col_end"]
+    header_row = candidate.get("header_row", candidate["row_start"])
+    first_row = candidate.get("header_row_start", header_row)
     
-    wb.close()
+    texts = {
+        (cell.row, cell.col): cell.value_text for cell in cells
+        if first_row <= cell.row <= header_row and col_start <= cell.col <= col_end
+    }
+    for r0, c0, r1, c1 in merged_ranges:
+        anchor = texts.get((r0, c0))
+        if anchor is None:
+            continue
+        for row in range(max(r0, first_row), min(r1, header_row) + 1):
+            for col in range(max(c0, col_start), min(c1, col_end) + 1):
+                texts.setdefault((row, col), anchor)
+    
+    headers = []
+    for col in range(col_start, col_end + 1):
+        parts = []
+        for row in range(first_row, header_row + 1):
+            text = texts.get((row, col))
+            # Una cella unita in verticale compare una sola volta
+            if text and (not parts or parts[-1] != text):
+                parts.append(text)
+        headers.append(" / ".join(parts) if parts else f"Col{col}")
+    return headers
+
+def get_table_headers(db: Session, sheet: models.Sheet, candidate: Dict[str, Any]) -> List[str]:
+    """Intestazioni del candidato tabella (vedi build_headers)."""
+    header_row = candidate.get("header_row", candidate["row_start"])
+    first_row = candidate.get("header_row_start", header_row)
+    cells = get_cells_in_range(db, sheet, first_row, header_row, candidate["col_start"], candidate["col_end"])
+    return build_headers(cells, candidate, sheet_merged_ranges(sheet))
+
+def iter_table_cells(
+    db: Session,
+    sheet: models.Sheet,
+    candidate: Dict[str, Any],
+    chunk_rows: int
+) -> Iterator[Tuple[int, int, Sequence[CellValue]]]:
+    """
+    Legge le righe dati del candidato (dopo l'intestazione) a blocchi di
+    `chunk_rows` righe: genera (prima riga, ultima riga, celle del blocco).
+    """
+    header_row = candidate.get("header_row", candidate["row_start"])
+    row_end = candidate["row_end"]
+    for chunk_start in range(header_row + 1, row_end + 1, chunk_rows):
+        chunk_end = min(chunk_start + chunk_rows - 1, row_end)
+        cells = get_cells_in_range(
+            db, sheet, chunk_start, chunk_end, candidate["col_start"], candidate["col_end"]
+        )
+        yield chunk_start, chunk_end, cells
+
+def get_sheet_analysis(dataset_id: str, sheet: models.Sheet) -> Dict[str, Any]:
+    """Analisi del foglio decodificata, dalla cache se disponibile."""
+    if not sheet.analysis_json:
+        return {"candidates": []}
+    return analysis_cache.get_or_set(
+        (dataset_id, sheet.sheet_name),
+        lambda: json.loads(sheet.analysis_json)
+    )
 
+@timed("preview_grid")
 def get_grid_preview(
     db: Session,
     dataset_id: str,
@@ -141,18 +772,17 @@ def get_grid_preview(
 ) -> Dict[str, Any]:
     """Restituisce preview in modalità griglia."""
     
+    cache_key = (dataset_id, sheet_name, "grid", row_start, row_end, col_start, col_end)
+    cached = preview_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     # Query celle nel range
-    cells = db.query(models.Cell).filter(
-        models.Cell.dataset_id == dataset_id,
-        models.Cell.sheet_name == sheet_name,
-        models.Cell.row >= row_start,
-        models.Cell.row <= row_end,
-        models.Cell.col >= col_start,
-        models.Cell.col <= col_end
-    ).all()
+    sheet = get_sheet(db, dataset_id, sheet_name)
+    cells = get_cells_in_range(db, sheet, row_start, row_end, col_start, col_end) if sheet else []
     
     # Crea mappa celle
-    cell_map = {(c.row, c.col): c.value_text for c in cells}
+    cell_map = {(cell.row, cell.col): cell.value_text for cell in cells}
     
     # Costruisci matrice 2D
     data = []
@@ -162,7 +792,7 @@ def get_grid_preview(
             row_data.append(cell_map.get((row, col), ""))
         data.append(row_data)
     
-    return {
+    preview = {
         "mode": "grid",
         "data": data,
         "dimensions": {
@@ -172,7 +802,154 @@ def get_grid_preview(
             "col_end": col_end
         }
     }
+    
+    # Solo fogli completi: l'analisi è salvata insieme all'ultima cella
+    if sheet and sheet.analysis_json:
+        preview_cache.set(cache_key, preview)
+    
+    return preview
+
+@timed("grid_layout")
+def get_grid_layout(dataset_id: str, sheet: models.Sheet) -> Dict[str, Any]:
+    """
+    Dimensioni del foglio e delle tile. In read_only openpyxl può non
+    conoscere le dimensioni: vale anche il bounding box dell'analisi.
+    """
+    n_rows, n_cols = sheet.n_rows or 0, sheet.n_cols or 0
+    for candidate in get_sheet_analysis(dataset_id, sheet).get("candidates", []):
+        n_rows = max(n_rows, candidate["row_end"])
+        n_cols = max(n_cols, candidate["col_end"])
+    return {
+        "n_rows": n_rows,
+        "n_cols": n_cols,
+        "tile_rows": TILE_ROWS,
+        "tile_cols": TILE_COLS,
+        "complete": bool(sheet.analysis_json),
+    }
+
+def grid_tile_etag(dataset: models.Dataset, sheet_name: str, tile_row: int, tile_col: int) -> str:
+    """
+    ETag di una tile: il contenuto dipende dal file (SHA256), dall'engine di
+    lettura, dalla policy sui testi lunghi, dal foglio, dalla posizione e dal
+    formato, quindi è uguale per i dataset deduplicati.
+    """
+    engine = dataset.reader_engine or XLSX_READER_ENGINE
+    text_policy = f"{CELL_TEXT_MAX_LENGTH}:{CELL_TEXT_OVERFLOW}"
+    key = (
+        f"{GRID_TILE_FORMAT}:{dataset.sha256}:{engine}:{text_policy}:{sheet_name}:"
+        f"{TILE_ROWS}x{TILE_COLS}:{tile_row}:{tile_col}"
+    )
+    return '"' + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + '"'
+
+@timed("grid_tile")
+def get_grid_tile(
+    db: Session,
+    dataset_id: str,
+    sheet: models.Sheet,
+    tile_row: int,
+    tile_col: int
+) -> Dict[str, Any]:
+    """
+    Tile della griglia in formato sparso: solo le celle non vuote, come
+    array paralleli di offset di riga e colonna (relativi all'inizio della
+    tile) e di indici in un dizionario di stringhe condiviso nella tile.
+    """
+    
+    cache_key = (dataset_id, sheet.sheet_name, "tile", tile_row, tile_col)
+    cached = preview_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    row_start = tile_row * TILE_ROWS + 1
+    col_start = tile_col * TILE_COLS + 1
+    cells = get_cells_in_range(
+        db, sheet, row_start, row_start + TILE_ROWS - 1, col_start, col_start + TILE_COLS - 1
+    )
+    
+    strings: List[str] = []
+    string_ids: Dict[str, int] = {}
+    rows, cols, values = [], [], []
+    for cell in cells:
+        string_id = string_ids.get(cell.value_text)
+        if string_id is None:
+            string_id = string_ids[cell.value_text] = len(strings)
+            strings.append(cell.value_text)
+        rows.append(cell.row - row_start)
+        cols.append(cell.col - col_start)
+        values.append(string_id)
+    
+    tile = {
+        "tile_row": tile_row,
+        "tile_col": tile_col,
+        "row_start": row_start,
+        "col_start": col_start,
+        "rows": rows,
+        "cols": cols,
+        "values": values,
+        "strings": strings,
+    }
+    
+    # Solo fogli completi: l'analisi è salvata insieme all'ultima cella
+    if sheet.analysis_json:
+        preview_cache.set(cache_key, tile)
+    
+    return tile
+
+def get_table_candidate(dataset_id: str, sheet: models.Sheet, candidate_idx: int) -> Optional[Dict[str, Any]]:
+    """Candidato tabella `candidate_idx` dell'analisi del foglio (None se assente)."""
+    candidates = get_sheet_analysis(dataset_id, sheet).get("candidates", [])
+    if candidate_idx >= len(candidates):
+        return None
+    return candidates[candidate_idx]
+
+@timed("table_stats")
+def get_table_stats(
+    db: Session,
+    dataset_id: str,
+    sheet: models.Sheet,
+    candidate_idx: int
+) -> Optional[Dict[str, Any]]:
+    """
+    Statistiche per colonna del candidato tabella (None se il candidato non
+    esiste). Calcolate al primo accesso e salvate in candidate_stats con
+    l'impronta del candidato: l'analisi del foglio non è riscritta, e
+    statistiche di un candidato cambiato da una rianalisi sono ricalcolate.
+    """
+    
+    candidates = get_sheet_analysis(dataset_id, sheet).get("candidates", [])
+    if candidate_idx >= len(candidates):
+        return None
+    
+    candidate = candidates[candidate_idx]
+    candidate_hash = hashlib.sha256(json.dumps(candidate, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+    saved = db.get(models.CandidateStats, (sheet.id, candidate_idx))
+    if saved is not None and saved.candidate_hash == candidate_hash:
+        return json.loads(saved.stats_json)
+    
+    table = TableStats(get_table_headers(db, sheet, candidate), candidate["col_start"])
+    for chunk_start, chunk_end, cells in iter_table_cells(db, sheet, candidate, EXPORT_CHUNK_ROWS):
+        table.add_chunk(chunk_end - chunk_start + 1, cells)
+    
+    stats = {"candidate": candidate_idx, **table.to_dict()}
+    
+    if saved is None:
+        saved = models.CandidateStats(sheet_id=sheet.id, candidate=candidate_idx)
+        db.add(saved)
+    saved.candidate_hash = candidate_hash
+    saved.stats_json = json.dumps(stats)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Stesso candidato salvato da una richiesta concorrente, o foglio eliminato
+        db.rollback()
+    
+    return stats
+
+def date_column_indexes(headers: Sequence[str]) -> List[int]:
+    """Indici delle colonne che contengono "DATA" nell'header."""
+    return [col_idx for col_idx, header in enumerate(headers) if "DATA" in header.upper()]
 
+@timed("preview_table")
 def get_table_preview(
     db: Session,
     dataset_id: str,
@@ -182,6 +959,11 @@ def get_table_preview(
 ) -> Dict[str, Any]:
     """Restituisce preview in modalità tabella."""
     
+    cache_key = (dataset_id, sheet_name, "table", candidate_idx, raw_values)
+    cached = preview_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     # Carica analysis JSON
     sheet = get_sheet(db, dataset_id, sheet_name)
     if not sheet or not sheet.analysis_json:
@@ -193,10 +975,8 @@ def get_table_preview(
             "score": 0.0
         }
     
-    analysis = json.loads(sheet.analysis_json)
-    candidates = analysis.get("candidates", [])
-    
-    if candidate_idx >= len(candidates):
+    candidate = get_table_candidate(dataset_id, sheet, candidate_idx)
+    if candidate is None:
         return {
             "mode": "table",
             "headers": [],
@@ -205,7 +985,6 @@ def get_table_preview(
             "score": 0.0
         }
     
-    candidate = candidates[candidate_idx]
     row_start = candidate["row_start"]
     row_end = min(candidate["row_end"], candidate["row_start"] + 100)
     col_start = candidate["col_start"]
@@ -213,26 +992,13 @@ def get_table_preview(
     header_row = candidate.get("header_row", row_start)
     
     # Query celle nel rettangolo
-    cells = db.query(models.Cell).filter(
-        models.Cell.dataset_id == dataset_id,
-        models.Cell.sheet_name == sheet_name,
-        models.Cell.row >= row_start,
-        models.Cell.row <= row_end,
-        models.Cell.col >= col_start,
-        models.Cell.col <= col_end
-    ).all()
+    cells = get_cells_in_range(db, sheet, row_start, row_end, col_start, col_end)
     
-    cell_map = {(c.row, c.col): c.value_text for c in cells}
+    cell_map = {(cell.row, cell.col): cell for cell in cells}
     
     # Estrai headers
-    headers = []
-    date_columns = []  # Indici colonne che contengono "DATA" nell'header
-    for col_idx, col in enumerate(range(col_start, col_end + 1)):
-        header_val = cell_map.get((header_row, col), f"Col{col}")
-        headers.append(header_val)
-        # Rileva colonne data
-        if "DATA" in header_val.upper():
-            date_columns.append(col_idx)
+    headers = build_headers(cells, candidate, sheet_merged_ranges(sheet))
+    date_columns = date_column_indexes(headers)
     
     # Estrai righe dati (fino a 50)
     rows = []
@@ -240,59 +1006,77 @@ def get_table_preview(
     for row in range(data_start_row, min(data_start_row + 50, row_end + 1)):
         row_data = []
         for col_idx, col in enumerate(range(col_start, col_end + 1)):
-            value = cell_map.get((row, col), "")
-            
+            cell = cell_map.get((row, col))
+            if cell is None:
+                row_data.append("")
             # Formatta date se richiesto e se la colonna è una colonna data
-            if not raw_values and col_idx in date_columns and value:
-                formatted_value = format_excel_date(value)
-                row_data.append(formatted_value)
+            elif not raw_values and col_idx in date_columns:
+                row_data.append(format_cell_date(cell))
             else:
-                row_data.append(value)
+                row_data.append(cell.value_text)
         rows.append(row_data)
     
-    return {
+    preview = {
         "mode": "table",
         "headers": headers,
         "rows": rows,
         "confidence": candidate.get("confidence", "low"),
         "score": candidate.get("score", 0.0)
     }
+    preview_cache.set(cache_key, preview)
+    
+    return preview
 
 def format_excel_date(value: str) -> str:
     """Converte seriale Excel in data dd/mm/yyyy se possibile."""
     try:
         # Prova a convertire in numero
         serial = float(value)
-        
-        # Excel date serials: giorni dal 1900-01-01
-        # Valori ragionevoli: tra 1 (1900) e 60000 (circa anno 2064)
-        if 1 <= serial <= 60000:
-            from datetime import datetime, timedelta
-            
-            # Separa parte intera (giorni) e decimale (frazione di giorno = ora)
-            days = int(serial)
-            time_fraction = serial - days
-            
-            # Excel considera erroneamente il 1900 come bisestile
-            if days > 59:
-                days -= 1
-            
-            base_date = datetime(1899, 12, 30)
-            excel_date = base_date + timedelta(days=days)
-            
-            # Aggiungi la componente temporale se presente
-            if time_fraction > 0:
-                excel_date += timedelta(days=time_fraction)
-            
-            # Formatta in base alla presenza di orario
-            # Se ora è 00:00:00 => solo data
-            if excel_date.hour == 0 and excel_date.minute == 0 and excel_date.second == 0:
-                return excel_date.strftime("%d/%m/%Y")
-            else:
-                # Include ora e minuti (senza secondi)
-                return excel_date.strftime("%d/%m/%Y %H:%M")
-        else:
-            return value
-    except (ValueError, TypeError, OverflowError):
+    except (ValueError, TypeError):
         # Non è un numero o non può essere convertito
         return value
+    return format_excel_serial(serial, value)
+
+def format_cell_date(cell: CellValue) -> str:
+    """
+    Formatta una cella di una colonna data usando il valore tipizzato:
+    le date sono già datetime e i numeri già float, nessun parsing del testo.
+    """
+    if cell.value_type == CELL_DATE:
+        return format_datetime(cell.value)
+    if cell.value_type == CELL_NUMBER:
+        return format_excel_serial(cell.value, cell.value_text)
+    return cell.value_text
+
+def format_excel_serial(serial: float, default: str) -> str:
+    """Converte un seriale Excel in data; restituisce `default` se fuori range."""
+    
+    # Excel date serials: giorni dal 1900-01-01
+    # Valori ragionevoli: tra 1 (1900) e 60000 (circa anno 2064)
+    if not 1 <= serial <= 60000:
+        return default
+    
+    # Separa parte intera (giorni) e decimale (frazione di giorno = ora)
+    days = int(serial)
+    time_fraction = serial - days
+    
+    # Excel considera erroneamente il 1900 come bisestile
+    if days > 59:
+        days -= 1
+    
+    base_date = datetime(1899, 12, 30)
+    excel_date = base_date + timedelta(days=days)
+    
+    # Aggiungi la componente temporale se presente
+    if time_fraction > 0:
+        excel_date += timedelta(days=time_fraction)
+    
+    return format_datetime(excel_date)
+
+def format_datetime(value: datetime) -> str:
+    # Formatta in base alla presenza di orario
+    # Se ora è 00:00:00 => solo data
+    if value.hour == 0 and value.minute == 0 and value.second == 0:
+        return value.strftime("%d/%m/%Y")
+    # Include ora e minuti (senza secondi)
+    return value.strftime("%d/%m/%Y %H:%M")
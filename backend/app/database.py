@@ -1,22 +1,82 @@
 from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./storage/datasets.db"
-
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}
+from .config import (
+    DATABASE_READ_URL,
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_READ_POOL_SIZE,
+    SQLITE_BUSY_TIMEOUT,
+    SQLITE_CACHE_SIZE_KB,
+    SQLITE_MMAP_SIZE,
 )
+from .metrics import instrument_engine
+
+def normalize_database_url(url: str) -> str:
+    """Gli URL postgres:// e postgresql:// usano il driver psycopg (3)."""
+    parsed = make_url(url)
+    if parsed.drivername in ("postgres", "postgresql"):
+        parsed = parsed.set(drivername="postgresql+psycopg")
+    return parsed.render_as_string(hide_password=False)
 
 # Enable foreign keys for SQLite
-@event.listens_for(engine, "connect")
+# WAL: i lettori non bloccano l'ingestione; con WAL synchronous=NORMAL è sicuro
+# (sync solo ai checkpoint) e riduce drasticamente gli fsync durante l'import.
+# Un solo scrittore alla volta: busy_timeout copre la transazione di un foglio
+# (il default del driver, 5 secondi, fa fallire il secondo job con "database is locked").
 def set_sqlite_pragma(dbapi_conn, connection_record):
     cursor = dbapi_conn.cursor()
     cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000}")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
     cursor.close()
 
+def set_sqlite_read_pragma(dbapi_conn, connection_record):
+    set_sqlite_pragma(dbapi_conn, connection_record)
+    # Una scrittura accidentale su una sessione di lettura fallisce subito
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+def create_database_engine(url: str, pool_size: int, read_only: bool = False) -> Engine:
+    """
+    Engine con pool di connessioni per SQLite o PostgreSQL.
+    Con `read_only` le transazioni non possono scrivere (PRAGMA query_only
+    su SQLite, default_transaction_read_only su PostgreSQL).
+    """
+    url = normalize_database_url(url)
+    pool_options = dict(pool_size=pool_size, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    
+    if make_url(url).get_backend_name() == "sqlite":
+        engine = create_engine(url, connect_args={"check_same_thread": False}, **pool_options)
+        event.listen(engine, "connect", set_sqlite_read_pragma if read_only else set_sqlite_pragma)
+        return engine
+    
+    # Date in UTC come su SQLite; pre_ping scarta le connessioni chiuse dal server
+    options = "-c timezone=UTC"
+    if read_only:
+        options += " -c default_transaction_read_only=on"
+    return create_engine(url, connect_args={"options": options}, pool_pre_ping=True, **pool_options)
+
+engine = create_database_engine(DATABASE_URL, DB_POOL_SIZE)
+
+# Connessioni per le sole letture delle API: in WAL i lettori non si bloccano
+# tra loro né con la scrittura in corso, e non occupano il pool delle scritture
+read_engine = create_database_engine(DATABASE_READ_URL, DB_READ_POOL_SIZE, read_only=True)
+
+instrument_engine(engine, "write")
+instrument_engine(read_engine, "read")
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
 
@@ -26,3 +86,11 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    """Sessione per gli endpoint in sola lettura."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
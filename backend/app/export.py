@@ -0,0 +1,155 @@
+import csv
+import io
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+from . import models
+from .config import EXPORT_CHUNK_ROWS
+from .crud import date_column_indexes, format_cell_date, get_table_headers, iter_table_cells
+from .database import ReadSessionLocal
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # dipendenza opzionale, solo per l'export Parquet
+    pa = None
+    pq = None
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+class ExportUnavailableError(Exception):
+    """Formato richiesto non disponibile (dipendenza opzionale mancante)."""
+
+def parquet_available() -> bool:
+    return pq is not None
+
+def unique_headers(headers: List[str], col_start: int) -> List[str]:
+    """Nomi di colonna non vuoti e univoci (necessari per NDJSON e Parquet)."""
+    
+    seen: Dict[str, int] = {}
+    result = []
+    for offset, header in enumerate(headers):
+        name = header or f"Col{col_start + offset}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}_{seen[name]}"
+        seen.setdefault(name, 1)
+        result.append(name)
+    return result
+
+def iter_table_chunks(
+    sheet_id: int,
+    candidate: Dict[str, Any],
+    raw_values: bool = False,
+    chunk_rows: Optional[int] = None
+) -> Iterator[List[List[str]]]:
+    """
+    Legge il rettangolo del candidato a blocchi di righe ordinate e genera,
+    per ogni blocco, le righe dati come liste di valori (celle vuote = "").
+    Il primo blocco contiene solo la riga di intestazione.
+    
+    Usa una sessione propria: il generatore è consumato dalla
+    StreamingResponse, dopo la chiusura della sessione della richiesta.
+    La memoria occupata è proporzionale a `chunk_rows`, non alla tabella.
+    """
+    
+    chunk_rows = chunk_rows or EXPORT_CHUNK_ROWS
+    col_start = candidate["col_start"]
+    width = candidate["col_end"] - col_start + 1
+    
+    db = ReadSessionLocal()
+    try:
+        sheet = db.get(models.Sheet, sheet_id)
+        
+        headers = get_table_headers(db, sheet, candidate)
+        yield [headers]
+        
+        date_columns = set() if raw_values else set(date_column_indexes(headers))
+        
+        for chunk_start, chunk_end, cells in iter_table_cells(db, sheet, candidate, chunk_rows):
+            rows = [[""] * width for _ in range(chunk_end - chunk_start + 1)]
+            for cell in cells:
+                col_idx = cell.col - col_start
+                if col_idx in date_columns:
+                    rows[cell.row - chunk_start][col_idx] = format_cell_date(cell)
+                else:
+                    rows[cell.row - chunk_start][col_idx] = cell.value_text
+            yield rows
+    finally:
+        db.close()
+
+def stream_csv(chunks: Iterator[List[List[str]]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+def stream_ndjson(chunks: Iterator[List[List[str]]], col_start: int) -> Iterator[bytes]:
+    headers = unique_headers(next(chunks)[0], col_start)
+    for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(headers, row_data)), ensure_ascii=False) + "\n"
+            for row_data in rows
+        ).encode("utf-8")
+
+class _ChunkSink(io.RawIOBase):
+    """File di sola scrittura che accumula i byte fino al prossimo `drain`."""
+    
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self._position
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+def stream_parquet(chunks: Iterator[List[List[str]]], col_start: int) -> Iterator[bytes]:
+    """Un row group per blocco di righe: i byte escono man mano che sono scritti."""
+    
+    headers = unique_headers(next(chunks)[0], col_start)
+    schema = pa.schema([(name, pa.string()) for name in headers])
+    sink = _ChunkSink()
+    
+    with pq.ParquetWriter(sink, schema) as writer:
+        for rows in chunks:
+            columns = [pa.array(column, type=pa.string()) for column in zip(*rows)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+def stream_table(
+    sheet_id: int,
+    candidate: Dict[str, Any],
+    export_format: str,
+    raw_values: bool = False
+) -> Iterator[bytes]:
+    """Generatore di byte per la StreamingResponse nel formato richiesto."""
+    
+    if export_format == "parquet" and not parquet_available():
+        raise ExportUnavailableError("Export Parquet non disponibile: installare pyarrow")
+    
+    chunks = iter_table_chunks(sheet_id, candidate, raw_values)
+    if export_format == "csv":
+        return stream_csv(chunks)
+    if export_format == "ndjson":
+        return stream_ndjson(chunks, candidate["col_start"])
+    return stream_parquet(chunks, candidate["col_start"])
@@ -0,0 +1,160 @@
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import models, crud
+from .config import INGEST_WORKERS, PROFILE_UPLOADS
+from .database import SessionLocal
+from .models import JOB_QUEUED, JOB_PARSING, JOB_ANALYZING, JOB_DONE, JOB_FAILED
+from .profiling import SamplingProfiler, profile_path
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATES = (JOB_QUEUED, JOB_PARSING, JOB_ANALYZING)
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+
+def create_job(
+    db: Session,
+    dataset_id: str,
+    status: str = JOB_QUEUED,
+    sheets_total: int = 0,
+    profile: bool = False
+) -> models.Job:
+    """Crea un job di ingestione (di default in stato queued)."""
+    job = models.Job(
+        id=str(uuid.uuid4()),
+        dataset_id=dataset_id,
+        status=status,
+        sheets_total=sheets_total,
+        sheets_done=sheets_total if status == JOB_DONE else 0,
+        profile=profile
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def start_ingestion(db: Session, dataset_id: str, profile: bool = False) -> Tuple[models.Job, int]:
+    """
+    Crea il job per un dataset appena caricato e restituisce (job, numero di sheet).
+    Se il contenuto è già stato elaborato (duplicato) il job è subito completato,
+    altrimenti viene accodato sul pool di worker.
+    
+    Con `profile` (o PROFILE_UPLOADS) l'ingestione è profilata (vedi
+    run_ingestion_job); un duplicato non è elaborato e quindi nemmeno profilato.
+    """
+    sheet_count = crud.count_sheets(db, dataset_id)
+    if sheet_count:
+        return create_job(db, dataset_id, status=JOB_DONE, sheets_total=sheet_count), sheet_count
+    
+    job = create_job(db, dataset_id, profile=profile or PROFILE_UPLOADS)
+    submit_job(job.id)
+    return job, 0
+
+def get_job(db: Session, job_id: str) -> Optional[models.Job]:
+    return db.query(models.Job).filter(models.Job.id == job_id).first()
+
+def has_active_job(db: Session, dataset_id: str) -> bool:
+    return db.query(models.Job).filter(
+        models.Job.dataset_id == dataset_id,
+        models.Job.status.in_(ACTIVE_STATES)
+    ).count() > 0
+
+def submit_job(job_id: str):
+    """Accoda il job sul pool di worker."""
+    _executor.submit(run_ingestion_job, job_id)
+
+def run_ingestion_job(job_id: str):
+    """
+    Esegue l'ingestione di un dataset aggiornando lo stato del job.
+    
+    I job con `profile` sono eseguiti sotto il profiler a campionamento, in
+    modo sequenziale (i fogli non sono letti da altri processi, così il
+    profilo copre anche lettura e analisi): gli stack campionati sono salvati
+    in storage/uploads/<dataset_id>/, anche se l'ingestione fallisce.
+    """
+    
+    # Ogni worker usa una sessione dedicata
+    db = SessionLocal()
+    try:
+        job = get_job(db, job_id)
+        if not job:
+            return
+        
+        dataset = crud.get_dataset(db, job.dataset_id)
+        if not dataset:
+            job.status = JOB_FAILED
+            job.error = "Dataset non trovato"
+            db.commit()
+            return
+        
+        # Invocata tra le transazioni dei fogli: il commit salva solo il job
+        def on_progress(status: str, sheet_name: str, sheets_done: int, sheets_total: int):
+            job.status = status
+            job.current_sheet = sheet_name
+            job.sheets_done = sheets_done
+            job.sheets_total = sheets_total
+            db.commit()
+        
+        # Letto prima: dopo un errore la transazione può essere annullata
+        # (PostgreSQL) e gli attributi scaduti non sono più ricaricabili
+        dataset_id = dataset.id
+        
+        # Una rielaborazione (reprocess.py) riparte dal file: il contenuto
+        # precedente del dataset è eliminato (nessuno per un nuovo upload)
+        crud.clear_dataset_content(db, dataset_id)
+        
+        profiler = SamplingProfiler() if job.profile else None
+        if profiler:
+            profiler.start()
+        try:
+            stats = crud.process_excel_file(
+                db, dataset_id, Path(dataset.file_path),
+                progress=on_progress, engine=dataset.reader_engine,
+                workers=1 if profiler else None
+            )
+        except Exception as exc:
+            logger.exception("Ingestione fallita per il dataset %s", dataset_id)
+            db.rollback()
+            crud.clear_dataset_content(db, dataset_id)
+            job.status = JOB_FAILED
+            job.error = str(exc) or exc.__class__.__name__
+            db.commit()
+            return
+        finally:
+            if profiler:
+                profiler.stop()
+                profiler.write(profile_path(dataset_id, job_id))
+        
+        job.status = JOB_DONE
+        job.current_sheet = None
+        job.sheets_done = job.sheets_total
+        job.cells_loaded = stats.rows
+        job.cells_per_sec = round(stats.rows_per_sec, 1)
+        job.cells_truncated = stats.truncated
+        db.commit()
+    finally:
+        db.close()
+
+def resume_pending_jobs():
+    """Riaccoda i job rimasti incompleti (es. dopo un riavvio del server)."""
+    db = SessionLocal()
+    try:
+        pending = db.query(models.Job).filter(models.Job.status.in_(ACTIVE_STATES)).all()
+        for job in pending:
+            crud.clear_dataset_content(db, job.dataset_id)
+            job.status = JOB_QUEUED
+            job.sheets_done = 0
+            job.current_sheet = None
+            db.commit()
+            submit_job(job.id)
+    finally:
+        db.close()
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -1,16 +1,27 @@
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Query
+from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from datetime import datetime
+from typing import List, Optional
+from urllib.parse import quote
 import os
-from pathlib import Path
 
-from . import models, schemas, crud
-from .database import engine, get_db, Base
+import anyio
 
-# Crea tabelle al primo avvio
-Path("storage/uploads").mkdir(parents=True, exist_ok=True)
+from . import schemas, crud, jobs, export, metrics, readers, reprocess, search
+from .profiling import profile_path
+from .cache import cache_stats
+from .config import API_THREADS, TILE_MAX_AGE, UPLOAD_DIR
+from .database import engine, get_db, get_read_db, Base
+from .migrations import run_migrations
+
+# Crea tabelle al primo avvio e aggiorna gli schemi esistenti
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
+search.create_search_index(engine)
 
 app = FastAPI(
     title="Excel Dataset Importer",
@@ -25,29 +36,75 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Server-Timing"],
 )
 
+# Richieste per route, query SQL e (con SERVER_TIMING=1) header Server-Timing
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Gli handler che accedono al database sono sincroni (`def`): FastAPI li esegue
+# nel threadpool di AnyIO, così le query non bloccano l'event loop
+
+@app.on_event("startup")
+async def configure_threadpool():
+    anyio.to_thread.current_default_thread_limiter().total_tokens = API_THREADS
+
+@app.on_event("startup")
+def resume_jobs():
+    """Riprende le ingestioni interrotte da un riavvio."""
+    jobs.resume_pending_jobs()
+
+@app.on_event("shutdown")
+def stop_jobs():
+    jobs.shutdown()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
     return {"status": "ok"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Metriche nel formato testo di Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Contatori hit/miss delle cache in-process."""
+    return cache_stats()
+
 @app.post("/api/datasets", response_model=schemas.DatasetResponse)
 async def upload_dataset(
     file: UploadFile = File(...),
+    engine: Optional[str] = Query(None),
+    profile: bool = Query(False),
     db: Session = Depends(get_db)
 ):
-    """Upload di un file Excel e creazione dataset."""
+    """
+    Upload di un file Excel e creazione dataset.
+    
+    Il file viene solo salvato: l'elaborazione avviene in background e il suo
+    stato è consultabile su /api/jobs/{job_id}. `engine` sceglie il lettore
+    del workbook (stream, openpyxl, calamine; default XLSX_READER_ENGINE).
+    Con `profile` l'elaborazione è profilata e il profilo è scaricabile da
+    /api/jobs/{job_id}/profile.
+    """
     
     if not file.filename.endswith('.xlsx'):
         raise HTTPException(status_code=400, detail="Solo file .xlsx sono supportati")
     
-    dataset = await crud.create_dataset(db, file)
+    try:
+        engine = readers.check_engine(engine)
+    except readers.ReaderUnavailableError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    
+    try:
+        dataset = await crud.create_dataset(db, file, engine)
+    except crud.UploadError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
     
-    # Conta sheets
-    sheet_count = db.query(models.Sheet).filter(
-        models.Sheet.dataset_id == dataset.id
-    ).count()
+    # Contenuto già elaborato (deduplicato per SHA256): nessuna elaborazione
+    job, sheet_count = await run_in_threadpool(jobs.start_ingestion, db, dataset.id, profile)
     
     return schemas.DatasetResponse(
         id=dataset.id,
@@ -55,40 +112,167 @@ async def upload_dataset(
         sha256=dataset.sha256,
         upload_date=dataset.upload_date,
         file_size=dataset.file_size,
-        sheet_count=sheet_count
+        reader_engine=dataset.reader_engine,
+        sheet_count=sheet_count,
+        job_id=job.id
     )
 
+@app.get("/api/jobs/{job_id}", response_model=schemas.JobResponse)
+def get_job_status(
+    job_id: str,
+    db: Session = Depends(get_read_db)
+):
+    """Stato di un job di ingestione."""
+    
+    job = jobs.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job non trovato")
+    
+    return job
+
+@app.get("/api/jobs/{job_id}/profile")
+def get_job_profile(
+    job_id: str,
+    db: Session = Depends(get_read_db)
+):
+    """
+    Profilo dell'ingestione di un job avviato con `profile`: stack campionati
+    in formato collapsed (flamegraph.pl, speedscope).
+    """
+    
+    job = jobs.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job non trovato")
+    
+    path = profile_path(job.dataset_id, job.id)
+    if not job.profile or not path.exists():
+        raise HTTPException(status_code=404, detail="Profilo non disponibile")
+    
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=path.name)
+
 @app.get("/api/datasets", response_model=List[schemas.DatasetResponse])
-async def list_datasets(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+def list_datasets(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    skip: Optional[int] = Query(None, ge=0, deprecated=True),
+    filename: Optional[str] = None,
+    uploaded_from: Optional[datetime] = None,
+    uploaded_to: Optional[datetime] = None,
+    min_size: Optional[int] = Query(None, ge=0),
+    max_size: Optional[int] = Query(None, ge=0),
+    db: Session = Depends(get_read_db)
 ):
-    """Lista tutti i dataset."""
+    """
+    Lista dei dataset, dal più recente.
+    
+    Paginazione a cursore: se ci sono altri risultati l'header X-Next-Cursor
+    contiene il valore da passare come `cursor` per la pagina successiva.
+    `skip` (offset) è deprecato ma ancora accettato per i client esistenti.
+    `filename` filtra per prefisso del nome, senza distinzione di maiuscole.
+    """
+    
+    filters = crud.DatasetFilters(
+        filename=filename,
+        uploaded_from=uploaded_from,
+        uploaded_to=uploaded_to,
+        min_size=min_size,
+        max_size=max_size
+    )
+    try:
+        rows, next_cursor = crud.get_datasets(db, limit=limit, cursor=cursor, filters=filters, offset=skip)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     
-    datasets = crud.get_datasets(db, skip=skip, limit=limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
-    result = []
-    for dataset in datasets:
-        sheet_count = db.query(models.Sheet).filter(
-            models.Sheet.dataset_id == dataset.id
-        ).count()
-        
-        result.append(schemas.DatasetResponse(
+    return [
+        schemas.DatasetResponse(
             id=dataset.id,
             filename=dataset.filename,
             sha256=dataset.sha256,
             upload_date=dataset.upload_date,
             file_size=dataset.file_size,
+            reader_engine=dataset.reader_engine,
             sheet_count=sheet_count
-        ))
+        )
+        for dataset, sheet_count in rows
+    ]
+
+def check_datasets_exist(db: Session, dataset_ids: Optional[List[str]]):
+    missing = [dataset_id for dataset_id in dataset_ids or [] if not crud.get_dataset(db, dataset_id)]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Dataset non trovati: {', '.join(missing)}")
+
+@app.post("/api/reprocess", response_model=schemas.ReprocessStatusResponse, status_code=202)
+def start_reprocess(
+    request: schemas.ReprocessRequest,
+    db: Session = Depends(get_read_db)
+):
+    """
+    Rianalizza in background la struttura dei fogli dalle celle memorizzate:
+    solo i fogli analizzati da una versione precedente del rilevamento, o
+    tutti con `force`. Lo stato è su GET /api/reprocess.
+    """
+    
+    check_datasets_exist(db, request.dataset_ids)
+    if not reprocess.start_reanalysis(request.dataset_ids, request.force):
+        raise HTTPException(status_code=409, detail="Rielaborazione già in corso")
+    return reprocess.get_status()
+
+@app.get("/api/reprocess", response_model=schemas.ReprocessStatusResponse)
+def get_reprocess_status():
+    """Stato dell'ultima rianalisi avviata da questo processo."""
+    return reprocess.get_status()
+
+@app.post("/api/reprocess/reparse", response_model=schemas.ReparseResponse, status_code=202)
+def start_reparse(
+    request: schemas.ReprocessRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Rilegge i file originali dei dataset con fogli da rielaborare (o di tutti
+    quelli indicati con `force`): un job di ingestione per dataset, con lo
+    stato su /api/jobs/{job_id}. I dataset saltati sono riportati con il motivo.
+    """
+    
+    check_datasets_exist(db, request.dataset_ids)
+    result = reprocess.reparse_datasets(db, request.dataset_ids, request.force)
+    return schemas.ReparseResponse(job_ids=[job.id for job in result.jobs], skipped=result.skipped)
+
+@app.get("/api/search", response_model=List[schemas.SearchHitResponse])
+def search_cells(
+    response: Response,
+    q: str = Query(..., min_length=1),
+    dataset_id: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[int] = Query(None, ge=0),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Ricerca nel testo delle celle di tutti i dataset (o di `dataset_id`):
+    ogni parola della query è un prefisso e devono essere presenti tutte.
+    Restituisce dataset, foglio, riga, colonna e uno snippet con i termini
+    trovati tra <mark> e </mark>.
+    
+    Paginazione a cursore come per /api/datasets (header X-Next-Cursor).
+    """
+    
+    try:
+        hits, next_cursor = search.search_cells(db, q, dataset_id=dataset_id, limit=limit, cursor=cursor)
+    except search.SearchQueryError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     
-    return result
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    
+    return [schemas.SearchHitResponse(**hit._asdict()) for hit in hits]
 
 @app.get("/api/datasets/{dataset_id}", response_model=schemas.DatasetDetailResponse)
-async def get_dataset_detail(
+def get_dataset_detail(
     dataset_id: str,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Dettaglio dataset con lista sheets."""
     
@@ -107,6 +291,7 @@ async def get_dataset_detail(
             sha256=dataset.sha256,
             upload_date=dataset.upload_date,
             file_size=dataset.file_size,
+            reader_engine=dataset.reader_engine,
             sheet_count=sheet_count
         ),
         sheets=[
@@ -116,13 +301,32 @@ async def get_dataset_detail(
                 n_rows=s.n_rows,
                 n_cols=s.n_cols,
                 merged_cells_count=s.merged_cells_count,
-                analysis_json=s.analysis_json
+                merged_ranges=crud.sheet_merged_ranges(s),
+                analysis_json=s.analysis_json,
+                detector_version=s.detector_version,
+                truncated_cells=s.truncated_cells or 0
             ) for s in sheets
         ]
     )
 
+@app.delete("/api/datasets/{dataset_id}", status_code=204)
+def delete_dataset(
+    dataset_id: str,
+    db: Session = Depends(get_db)
+):
+    """Elimina un dataset (il file originale è rimosso quando non più referenziato)."""
+    
+    dataset = crud.get_dataset(db, dataset_id)
+    if not dataset:
+        raise HTTPException(status_code=404, detail="Dataset non trovato")
+    
+    if jobs.has_active_job(db, dataset_id):
+        raise HTTPException(status_code=409, detail="Dataset in elaborazione")
+    
+    crud.delete_dataset(db, dataset)
+
 @app.get("/api/datasets/{dataset_id}/sheets/{sheet_name}/preview")
-async def preview_sheet(
+def preview_sheet(
     dataset_id: str,
     sheet_name: str,
     mode: str = Query("grid", regex="^(grid|table)$"),
@@ -132,7 +336,7 @@ async def preview_sheet(
     col_end: int = Query(20, ge=1),
     candidate: int = Query(0, ge=0),
     raw_values: bool = Query(False),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Preview foglio in modalità grid o table."""
     
@@ -149,3 +353,122 @@ async def preview_sheet(
         return crud.get_table_preview(
             db, dataset_id, sheet_name, candidate, raw_values
         )
+
+@app.get("/api/datasets/{dataset_id}/sheets/{sheet_name}/grid")
+def grid_layout(
+    dataset_id: str,
+    sheet_name: str,
+    db: Session = Depends(get_read_db)
+):
+    """Dimensioni del foglio e delle tile per la griglia virtualizzata."""
+    
+    sheet = crud.get_sheet(db, dataset_id, sheet_name)
+    if not sheet:
+        raise HTTPException(status_code=404, detail="Sheet non trovato")
+    
+    return crud.get_grid_layout(dataset_id, sheet)
+
+@app.get("/api/datasets/{dataset_id}/sheets/{sheet_name}/grid/tiles/{tile_row}/{tile_col}")
+def grid_tile(
+    dataset_id: str,
+    sheet_name: str,
+    tile_row: int,
+    tile_col: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db)
+):
+    """
+    Tile della griglia (TILE_ROWS x TILE_COLS celle) in formato sparso.
+    Le tile di un foglio completo sono immutabili: ETag derivato dallo
+    SHA256 del file e risposta 304 se il client ha già la stessa versione.
+    """
+    
+    if tile_row < 0 or tile_col < 0:
+        raise HTTPException(status_code=400, detail="Indice tile non valido")
+    
+    dataset = crud.get_dataset(db, dataset_id)
+    sheet = crud.get_sheet(db, dataset_id, sheet_name) if dataset else None
+    if not sheet:
+        raise HTTPException(status_code=404, detail="Sheet non trovato")
+    
+    # Foglio ancora in ingestione: contenuto parziale, da non memorizzare
+    if not sheet.analysis_json:
+        response.headers["Cache-Control"] = "no-store"
+        return crud.get_grid_tile(db, dataset_id, sheet, tile_row, tile_col)
+    
+    etag = crud.grid_tile_etag(dataset, sheet_name, tile_row, tile_col)
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={TILE_MAX_AGE}"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    response.headers.update(headers)
+    return crud.get_grid_tile(db, dataset_id, sheet, tile_row, tile_col)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Confronto debole di If-None-Match (RFC 9110): lista di entity tag
+    separati da virgole, con prefisso W/ opzionale, o "*".
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+@app.get("/api/datasets/{dataset_id}/sheets/{sheet_name}/stats")
+def table_stats(
+    dataset_id: str,
+    sheet_name: str,
+    candidate: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    """
+    Statistiche per colonna di una tabella rilevata: tipo prevalente, quota
+    di celle vuote, valori distinti (stimati con HyperLogLog oltre una
+    soglia), min/max/media e valori più frequenti.
+    """
+    
+    sheet = crud.get_sheet(db, dataset_id, sheet_name)
+    if not sheet:
+        raise HTTPException(status_code=404, detail="Sheet non trovato")
+    
+    stats = crud.get_table_stats(db, dataset_id, sheet, candidate)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Tabella non trovata")
+    
+    return stats
+
+@app.get("/api/datasets/{dataset_id}/sheets/{sheet_name}/export")
+def export_table(
+    dataset_id: str,
+    sheet_name: str,
+    format: str = Query("csv", regex="^(csv|ndjson|parquet)$"),
+    candidate: int = Query(0, ge=0),
+    raw_values: bool = Query(False),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Export completo di una tabella rilevata (header e tutte le righe) in
+    CSV, NDJSON o Parquet. Le celle sono lette a blocchi e il file è
+    trasmesso in streaming, a memoria costante.
+    """
+    
+    sheet = crud.get_sheet(db, dataset_id, sheet_name)
+    if not sheet:
+        raise HTTPException(status_code=404, detail="Sheet non trovato")
+    
+    table = crud.get_table_candidate(dataset_id, sheet, candidate)
+    if table is None:
+        raise HTTPException(status_code=404, detail="Tabella non trovata")
+    
+    try:
+        content = export.stream_table(sheet.id, table, format, raw_values)
+    except export.ExportUnavailableError as exc:
+        raise HTTPException(status_code=501, detail=str(exc))
+    
+    filename = quote(f"{sheet_name}_{candidate}.{format}")
+    return StreamingResponse(
+        content,
+        media_type=export.EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{filename}"}
+    )
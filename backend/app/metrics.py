@@ -0,0 +1,294 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+from .cache import cache_stats
+from .config import SERVER_TIMING
+
+# Estremi (secondi) dei bucket degli istogrammi di durata
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict[str, Any]) -> LabelValues:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(labels: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in items)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + "}"
+
+class Counter:
+    """Contatore monotono con etichette (formato testo di Prometheus)."""
+    
+    kind = "counter"
+    
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_labels(labels), 0)
+    
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(k)} {v}" for k, v in self._values.items()]
+
+class Gauge(Counter):
+    """Valore istantaneo (ultimo impostato)."""
+    
+    kind = "gauge"
+    
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_labels(labels)] = value
+
+class Histogram:
+    """Istogramma cumulativo di durate con bucket fissi."""
+    
+    kind = "histogram"
+    
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # etichette -> [conteggi per bucket (non cumulativi)..., +Inf, somma]
+        self._values: Dict[LabelValues, List[float]] = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        idx = 0
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            idx = len(self.buckets)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[idx] += 1
+            counts[-1] += value
+    
+    def count(self, **labels) -> int:
+        with self._lock:
+            counts = self._values.get(_labels(labels))
+            return int(sum(counts[:-1])) if counts else 0
+    
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, counts in self._values.items():
+                cumulative = 0
+                for bound, n in zip(self.buckets + (float("inf"),), counts[:-1]):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', le))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {counts[-1]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+# Richieste HTTP (route = percorso della route, non l'URL, per limitare le serie)
+http_requests = Counter("http_requests_total", "Richieste HTTP per metodo, route e stato")
+http_request_duration = Histogram("http_request_duration_seconds", "Durata delle richieste HTTP per route")
+http_request_sql_queries = Counter("http_request_sql_queries_total", "Query SQL eseguite dalle richieste HTTP per route")
+
+# Query SQL di tutto il processo (API e job di ingestione)
+sql_queries = Counter("sql_queries_total", "Query SQL eseguite per engine")
+sql_query_seconds = Counter("sql_query_seconds_total", "Tempo speso nelle query SQL per engine")
+
+# Fasi instrumentate (lettura, inserimento, analisi, preview, ...)
+stage_duration = Histogram("stage_duration_seconds", "Durata delle fasi di ingestione e delle preview")
+
+# Ingestione: i ratei (celle/s, byte/s) si ottengono dai contatori
+ingest_cells = Counter("ingest_cells_total", "Celle caricate dalle ingestioni")
+ingest_bytes = Counter("ingest_bytes_total", "Byte dei workbook elaborati")
+ingest_seconds = Counter("ingest_seconds_total", "Durata totale delle ingestioni")
+ingest_last_cells_per_second = Gauge("ingest_last_cells_per_second", "Celle/s dell'ultima ingestione")
+ingest_last_bytes_per_second = Gauge("ingest_last_bytes_per_second", "Byte/s dell'ultima ingestione")
+
+METRICS = (
+    http_requests, http_request_duration, http_request_sql_queries,
+    sql_queries, sql_query_seconds, stage_duration,
+    ingest_cells, ingest_bytes, ingest_seconds, ingest_last_cells_per_second, ingest_last_bytes_per_second,
+)
+
+class RequestTimings:
+    """Fasi e query SQL di una richiesta, per l'header Server-Timing."""
+    
+    __slots__ = ("stages", "sql_count", "sql_seconds", "_lock")
+    
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self._lock = threading.Lock()
+    
+    def add_stage(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+    
+    def add_query(self, seconds: float):
+        with self._lock:
+            self.sql_count += 1
+            self.sql_seconds += seconds
+    
+    def server_timing(self, total: float) -> str:
+        with self._lock:
+            parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+            if self.sql_count:
+                parts.append(f'sql;desc="{self.sql_count} query";dur={self.sql_seconds * 1000:.1f}')
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+# Richiesta corrente: il contesto è copiato nei thread del threadpool di AnyIO,
+# non nei worker di ingestione (che quindi non sono attribuiti all'upload)
+_current_request: ContextVar[Optional[RequestTimings]] = ContextVar("metrics_request", default=None)
+
+def record_stage(stage: str, seconds: float):
+    stage_duration.observe(seconds, stage=stage)
+    timings = _current_request.get()
+    if timings is not None:
+        timings.add_stage(stage, seconds)
+
+@contextmanager
+def span(stage: str):
+    """Misura la durata del blocco come fase `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+def timed(stage: str) -> Callable:
+    """Decoratore: misura ogni chiamata della funzione come fase `stage`."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class TimedIterator:
+    """
+    Misura il tempo speso a produrre gli elementi di un iteratore (es. la
+    lettura delle celle) separato da quello di chi li consuma. Gli elementi
+    sono letti a blocchi di `batch`, così il costo è di due letture
+    dell'orologio per blocco e non per elemento.
+    """
+    
+    def __init__(self, iterable: Iterable, batch: int = 1024):
+        self._iterator = iter(iterable)
+        self.batch = batch
+        self.seconds = 0.0
+    
+    def __iter__(self) -> Iterator:
+        iterator, batch = self._iterator, self.batch
+        while True:
+            start = time.perf_counter()
+            chunk = list(islice(iterator, batch))
+            self.seconds += time.perf_counter() - start
+            if not chunk:
+                return
+            yield from chunk
+
+def record_ingest(cells: int, file_bytes: int, seconds: float):
+    ingest_cells.inc(cells)
+    ingest_bytes.inc(file_bytes)
+    ingest_seconds.inc(seconds)
+    if seconds > 0:
+        ingest_last_cells_per_second.set(cells / seconds)
+        ingest_last_bytes_per_second.set(file_bytes / seconds)
+
+def instrument_engine(engine: Engine, name: str):
+    """Conta le query SQL dell'engine (totali e della richiesta corrente)."""
+    
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+    
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+        sql_queries.inc(engine=name)
+        sql_query_seconds.inc(elapsed, engine=name)
+        timings = _current_request.get()
+        if timings is not None:
+            timings.add_query(elapsed)
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI: conta e misura le richieste HTTP per route, con le query
+    SQL eseguite, e con `server_timing` aggiunge l'header Server-Timing con
+    le fasi misurate durante la richiesta.
+    """
+    
+    def __init__(self, app, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        timings = RequestTimings()
+        token = _current_request.set(timings)
+        start = time.perf_counter()
+        status = 500
+        
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", timings.server_timing(time.perf_counter() - start))
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_request.reset(token)
+            # La route è nota solo dopo il routing (lo scope è aggiornato sul posto)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_requests.inc(method=scope["method"], route=route, status=status)
+            http_request_duration.observe(time.perf_counter() - start, route=route)
+            if timings.sql_count:
+                http_request_sql_queries.inc(timings.sql_count, route=route)
+
+def render() -> str:
+    """Tutte le metriche, incluse le statistiche delle cache, nel formato testo di Prometheus."""
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    
+    caches = cache_stats()
+    for field, kind in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"), ("entries", "gauge")):
+        name = f"cache_{field}" + ("_total" if kind == "counter" else "")
+        lines.append(f"# HELP {name} Cache in-process: {field}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f'{name}{{cache="{cache}"}} {stats[field]}' for cache, stats in caches.items())
+    return "\n".join(lines) + "\n"
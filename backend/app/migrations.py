@@ -0,0 +1,150 @@
+import logging
+
+from sqlalchemy import inspect, select, text, update
+from sqlalchemy.engine import Engine
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+def run_migrations(engine: Engine):
+    """Aggiorna in place gli schemi creati da versioni precedenti."""
+    migrate_cells_to_sheet_id(engine)
+    add_missing_columns(engine)
+    add_missing_indexes(engine)
+    fill_filename_keys(engine)
+    normalize_upload_dates(engine)
+
+def add_missing_columns(engine: Engine):
+    """Aggiunge le colonne introdotte dopo la creazione delle tabelle."""
+    
+    inspector = inspect(engine)
+    for table in models.Base.metadata.sorted_tables:
+        if table.name not in inspector.get_table_names():
+            continue
+        
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            
+            column_type = column.type.compile(dialect=engine.dialect)
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'
+            if column.server_default is not None:
+                ddl += f" DEFAULT '{column.server_default.arg}'"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            
+            logger.info("Aggiunta colonna %s.%s", table.name, column.name)
+            with engine.begin() as conn:
+                conn.execute(text(ddl))
+
+def add_missing_indexes(engine: Engine):
+    """Crea gli indici dichiarati nei modelli ma assenti nel database."""
+    
+    inspector = inspect(engine)
+    for table in models.Base.metadata.sorted_tables:
+        if table.name not in inspector.get_table_names():
+            continue
+        
+        existing = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            
+            logger.info("Creazione indice %s", index.name)
+            with engine.begin() as conn:
+                index.create(conn, checkfirst=True)
+
+def fill_filename_keys(engine: Engine):
+    """
+    Valorizza filename_key dei dataset creati prima della colonna (in Python,
+    come il default del modello: lower() di SQLite converte solo l'ASCII).
+    La ricerca dei NULL usa l'indice della colonna.
+    """
+    
+    datasets = models.Dataset.__table__
+    with engine.begin() as conn:
+        rows = conn.execute(
+            select(datasets.c.id, datasets.c.filename).where(datasets.c.filename_key.is_(None))
+        ).all()
+        for dataset_id, filename in rows:
+            conn.execute(
+                update(datasets).where(datasets.c.id == dataset_id).values(filename_key=filename.lower())
+            )
+
+# PRAGMA user_version dopo normalize_upload_dates (migrazione una tantum su SQLite)
+UPLOAD_DATES_USER_VERSION = 1
+
+def normalize_upload_dates(engine: Engine):
+    """
+    Porta le date di upload scritte dal default SQL (CURRENT_TIMESTAMP, senza
+    microsecondi) al formato usato da SQLAlchemy su SQLite, altrimenti il
+    confronto testuale del cursore di paginazione non è coerente.
+    
+    Le nuove righe hanno già i microsecondi (default lato Python): l'UPDATE,
+    che legge tutta la tabella, è eseguito una sola volta e registrato in
+    PRAGMA user_version.
+    """
+    
+    if engine.dialect.name != "sqlite":
+        return
+    
+    with engine.begin() as conn:
+        if conn.execute(text("PRAGMA user_version")).scalar() >= UPLOAD_DATES_USER_VERSION:
+            return
+        conn.execute(text(
+            "UPDATE datasets SET upload_date = upload_date || '.000000' "
+            "WHERE length(upload_date) = 19"
+        ))
+        conn.execute(text(f"PRAGMA user_version = {UPLOAD_DATES_USER_VERSION}"))
+
+def migrate_cells_to_sheet_id(engine: Engine):
+    """
+    Converte la tabella `cells` dal vecchio schema (dataset_id + sheet_name
+    ripetuti su ogni riga, id autoincrement e tre indici separati) allo schema
+    con chiave (sheet_id, row, col).
+    
+    Il vecchio schema ha solo il testo: le celle copiate sono tutte testi
+    (value_type 's', senza valore nativo) e i fogli restano senza
+    detector_version. I tipi si recuperano rileggendo i file originali con
+    `python -m app.reprocess --reparse`, da eseguire prima di una rianalisi
+    (che rianalizzerebbe i soli testi e aggiornerebbe detector_version).
+    """
+    
+    inspector = inspect(engine)
+    if "cells" not in inspector.get_table_names():
+        return
+    
+    columns = {c["name"] for c in inspector.get_columns("cells")}
+    sheet_columns = {c["name"] for c in inspector.get_columns("sheets")}
+    sheet_indexes = {i["name"] for i in inspector.get_indexes("sheets")}
+    
+    with engine.begin() as conn:
+        if "ix_sheet_dataset_name" not in sheet_indexes:
+            conn.execute(text("DROP INDEX IF EXISTS ix_sheet_dataset"))
+            conn.execute(text(
+                "CREATE UNIQUE INDEX ix_sheet_dataset_name ON sheets (dataset_id, sheet_name)"
+            ))
+        
+        if "dataset_id" not in columns:
+            return
+        
+        logger.info("Migrazione tabella cells allo schema (sheet_id, row, col)")
+        
+        conn.execute(text("ALTER TABLE cells RENAME TO cells_legacy"))
+        models.Cell.__table__.create(conn)
+        conn.execute(text(
+            "INSERT INTO cells (sheet_id, row, col, value_text) "
+            "SELECT s.id, c.row, c.col, c.value_text "
+            "FROM cells_legacy c "
+            "JOIN sheets s ON s.dataset_id = c.dataset_id AND s.sheet_name = c.sheet_name"
+        ))
+        conn.execute(text("DROP TABLE cells_legacy"))
+        
+        # Fogli da rileggere (vedi sopra); la colonna, se assente, è aggiunta vuota
+        if "detector_version" in sheet_columns:
+            conn.execute(text("UPDATE sheets SET detector_version = NULL"))
+        logger.warning(
+            "Celle migrate come testo: eseguire python -m app.reprocess --reparse per recuperare numeri e date"
+        )
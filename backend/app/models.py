@@ -1,16 +1,57 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Index
+from datetime import datetime, timezone
+
+from sqlalchemy import DDL, Boolean, Column, Integer, Float, String, DateTime, ForeignKey, Text, Index, event
 from sqlalchemy.sql import func
+from .config import CELL_TEXT_MAX_LENGTH, DB_CELLS_PARTITIONS
 from .database import Base
 
+# Stati di un job di ingestione
+JOB_QUEUED = "queued"
+JOB_PARSING = "parsing"
+JOB_ANALYZING = "analyzing"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def filename_key(context) -> str:
+    return context.get_current_parameters()["filename"].lower()
+
+class Blob(Base):
+    """File originale memorizzato per contenuto (condiviso tra dataset identici)."""
+    __tablename__ = "blobs"
+    
+    sha256 = Column(String, primary_key=True)
+    file_path = Column(String, nullable=False)
+    file_size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class Dataset(Base):
     __tablename__ = "datasets"
     
     id = Column(String, primary_key=True, index=True)
     filename = Column(String, nullable=False)
+    # Nome in minuscolo per il filtro per prefisso; su PostgreSQL con
+    # collation "C", così intervalli e LIKE 'prefisso%' usano l'indice
+    filename_key = Column(String().with_variant(String(collation="C"), "postgresql"), nullable=True, default=filename_key)
     sha256 = Column(String, nullable=False)
-    upload_date = Column(DateTime(timezone=True), server_default=func.now())
+    # Valorizzata lato Python (con microsecondi) così che il cursore della
+    # paginazione confronti valori nello stesso formato memorizzato
+    upload_date = Column(DateTime(timezone=True), default=utc_now, server_default=func.now())
     file_path = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)
+    # Engine di lettura scelto all'upload (vedi readers.py)
+    reader_engine = Column(String, nullable=True)
+    
+    __table_args__ = (
+        Index('ix_dataset_sha256', 'sha256'),
+        # Paginazione keyset (upload_date, id) e filtri per data e dimensione
+        Index('ix_dataset_upload_date', 'upload_date', 'id'),
+        Index('ix_dataset_file_size', 'file_size'),
+        Index('ix_dataset_filename_key', 'filename_key'),
+    )
 
 class Sheet(Base):
     __tablename__ = "sheets"
@@ -21,24 +62,82 @@ class Sheet(Base):
     n_rows = Column(Integer, nullable=False)
     n_cols = Column(Integer, nullable=False)
     merged_cells_count = Column(Integer, default=0)
+    # Intervalli uniti in JSON: [[row_start, col_start, row_end, col_end], ...]
+    merged_ranges = Column(Text, nullable=True)
     analysis_json = Column(Text, nullable=True)
+    # Versione del rilevamento che ha prodotto analysis_json (NULL: precedente al versionamento)
+    detector_version = Column(Integer, nullable=True)
+    cell_store = Column(String, nullable=False, default="sqlite", server_default="sqlite")
+    # Celle il cui testo è stato troncato a CELL_TEXT_MAX_LENGTH
+    truncated_cells = Column(Integer, nullable=False, default=0, server_default="0")
     
     __table_args__ = (
-        Index('ix_sheet_dataset', 'dataset_id'),
+        Index('ix_sheet_dataset_name', 'dataset_id', 'sheet_name', unique=True),
     )
 
+class CandidateStats(Base):
+    """Statistiche per colonna di un candidato tabella (crud.get_table_stats)."""
+    __tablename__ = "candidate_stats"
+    
+    sheet_id = Column(Integer, ForeignKey("sheets.id", ondelete="CASCADE"), primary_key=True, autoincrement=False)
+    candidate = Column(Integer, primary_key=True, autoincrement=False)
+    # Impronta del candidato da cui sono calcolate: se una rianalisi lo
+    # cambia, le statistiche non corrispondono più e sono ricalcolate
+    candidate_hash = Column(String, nullable=False)
+    stats_json = Column(Text, nullable=False)
+
 class Cell(Base):
     __tablename__ = "cells"
     
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    # Chiave primaria composta: su SQLite la tabella WITHOUT ROWID è ordinata
+    # fisicamente per (sheet_id, row, col), quindi le query per intervallo
+    # leggono righe contigue senza indici secondari.
+    sheet_id = Column(Integer, ForeignKey("sheets.id", ondelete="CASCADE"), primary_key=True, autoincrement=False)
+    row = Column(Integer, primary_key=True, autoincrement=False)
+    col = Column(Integer, primary_key=True, autoincrement=False)
+    value_text = Column(String(CELL_TEXT_MAX_LENGTH), nullable=False)
+    # Tipo originale (cell_values.CELL_*) e valore nativo nella colonna del tipo
+    value_type = Column(String(1), nullable=False, default="s", server_default="s")
+    value_num = Column(Float, nullable=True)
+    value_date = Column(DateTime, nullable=True)
+    value_bool = Column(Boolean, nullable=True)
+    
+    # Su PostgreSQL la tabella può essere partizionata per hash di sheet_id:
+    # ogni foglio sta in una sola partizione e le query per foglio ne leggono una
+    __table_args__ = (
+        {
+            'sqlite_with_rowid': False,
+            **({'postgresql_partition_by': 'HASH (sheet_id)'} if DB_CELLS_PARTITIONS else {}),
+        },
+    )
+
+for _remainder in range(DB_CELLS_PARTITIONS):
+    event.listen(
+        Cell.__table__,
+        "after_create",
+        DDL(
+            f"CREATE TABLE cells_p{_remainder} PARTITION OF cells "
+            f"FOR VALUES WITH (MODULUS {DB_CELLS_PARTITIONS}, REMAINDER {_remainder})"
+        ).execute_if(dialect="postgresql")
+    )
+
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(String, primary_key=True, index=True)
     dataset_id = Column(String, ForeignKey("datasets.id", ondelete="CASCADE"), nullable=False)
-    sheet_name = Column(String, nullable=False)
-    row = Column(Integer, nullable=False)
-    col = Column(Integer, nullable=False)
-    value_text = Column(String(2000), nullable=False)
+    status = Column(String, nullable=False, default=JOB_QUEUED)
+    sheets_total = Column(Integer, default=0)
+    sheets_done = Column(Integer, default=0)
+    current_sheet = Column(String, nullable=True)
+    cells_loaded = Column(Integer, nullable=True)
+    cells_per_sec = Column(Float, nullable=True)
+    cells_truncated = Column(Integer, nullable=True)
+    profile = Column(Boolean, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     __table_args__ = (
-        Index('ix_cell_dataset', 'dataset_id'),
-        Index('ix_cell_sheet', 'sheet_name'),
-        Index('ix_cell_position', 'row', 'col'),
+        Index('ix_job_dataset', 'dataset_id'),
     )
@@ -0,0 +1,88 @@
+import os
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+from types import CodeType, FrameType
+from typing import Dict, Optional, Tuple
+
+from .config import PROFILE_SAMPLE_INTERVAL, UPLOAD_DIR
+
+class SamplingProfiler:
+    """
+    Profiler a campionamento di un thread: ogni `interval` secondi un thread
+    separato legge lo stack corrente del thread osservato (sys._current_frames)
+    e conta gli stack uguali. Il thread osservato non è rallentato se non per
+    il GIL durante il campionamento, quindi è adatto a ingestioni lunghe.
+
+    Il risultato è in formato "collapsed stacks" (una riga per stack:
+    frame;frame;... conteggio), l'input di flamegraph.pl e di speedscope.
+
+        with SamplingProfiler() as profiler:
+            process(...)
+        profiler.write(path)
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._labels: Dict[CodeType, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "SamplingProfiler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            self.stacks[self._stack(frame)] += 1
+            self.samples += 1
+
+    def _stack(self, frame: Optional[FrameType]) -> Tuple[str, ...]:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def collapsed(self) -> str:
+        """Stack campionati in formato collapsed, dal più frequente."""
+        return "".join(
+            ";".join(stack) + f" {count}\n"
+            for stack, count in self.stacks.most_common()
+        )
+
+    def write(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".part")
+        tmp_path.write_text(self.collapsed(), encoding="utf-8")
+        tmp_path.replace(path)
+
+def profile_path(dataset_id: str, job_id: str) -> Path:
+    """Profilo di un job, nella directory per-dataset degli upload."""
+    return UPLOAD_DIR / dataset_id / f"profile-{job_id}.collapsed"
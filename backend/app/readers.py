@@ -0,0 +1,220 @@
+import logging
+from datetime import date, datetime, time
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Tuple
+
+from openpyxl import load_workbook
+from openpyxl.utils.cell import range_boundaries
+
+from .config import XLSX_READER_ENGINE
+from .xlsx_reader import MergedRange, XlsxReader
+
+try:
+    # Parser interno di openpyxl, verificato con le versioni ammesse in
+    # requirements.txt: se manca o cambia si usa l'API pubblica iter_rows
+    from openpyxl.worksheet._reader import WorkSheetParser
+except ImportError:
+    WorkSheetParser = None
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # dipendenza opzionale, solo per l'engine "calamine"
+    CalamineWorkbook = None
+
+logger = logging.getLogger(__name__)
+
+# Engine di lettura dei workbook. Tutti espongono la stessa interfaccia di
+# XlsxReader: `sheetnames`, `sheet(name)` e `close()` (anche come context
+# manager); ogni foglio ha `iter_cells()` che genera (row, col, valore) delle
+# celle con un valore, `max_row`/`max_col` e `merged_ranges`, gli ultimi
+# completi dopo aver consumato `iter_cells`.
+ENGINE_STREAM = "stream"
+ENGINE_OPENPYXL = "openpyxl"
+ENGINE_CALAMINE = "calamine"
+READER_ENGINES = (ENGINE_STREAM, ENGINE_OPENPYXL, ENGINE_CALAMINE)
+
+class ReaderUnavailableError(ValueError):
+    """Engine sconosciuto o con dipendenza opzionale mancante."""
+
+def engine_available(engine: str) -> bool:
+    if engine == ENGINE_CALAMINE:
+        return CalamineWorkbook is not None
+    return engine in READER_ENGINES
+
+def check_engine(engine: Optional[str]) -> str:
+    """Restituisce l'engine da usare (default XLSX_READER_ENGINE) o solleva ReaderUnavailableError."""
+    engine = engine or XLSX_READER_ENGINE
+    if engine not in READER_ENGINES:
+        raise ReaderUnavailableError(
+            f"Engine di lettura sconosciuto: {engine} (disponibili: {', '.join(READER_ENGINES)})"
+        )
+    if not engine_available(engine):
+        raise ReaderUnavailableError(f"Engine {engine} non disponibile: installare python-calamine")
+    return engine
+
+def open_workbook(file_path: Path, engine: Optional[str] = None):
+    """Apre il workbook con l'engine indicato (default XLSX_READER_ENGINE)."""
+    engine = check_engine(engine)
+    if engine == ENGINE_OPENPYXL:
+        return OpenpyxlReader(file_path)
+    if engine == ENGINE_CALAMINE:
+        return CalamineReader(file_path)
+    return XlsxReader(file_path)
+
+class _Reader:
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+class OpenpyxlReader(_Reader):
+    """
+    openpyxl in read_only e data_only, l'engine di riferimento. Le celle sono
+    lette con il parser di foglio di openpyxl (lo stesso di iter_rows, senza
+    le righe di riempimento), che in un solo passaggio raccoglie anche gli
+    intervalli uniti non esposti dal foglio read_only. Il parser non è API
+    pubblica: se non è disponibile nella versione installata le celle sono
+    lette con iter_rows, senza intervalli uniti.
+    """
+    
+    def __init__(self, file_path: Path):
+        self.workbook = load_workbook(file_path, read_only=True, data_only=True)
+    
+    def close(self):
+        self.workbook.close()
+    
+    @property
+    def sheetnames(self) -> List[str]:
+        return self.workbook.sheetnames
+    
+    def sheet(self, name: str) -> "OpenpyxlSheet":
+        return OpenpyxlSheet(self.workbook, self.workbook[name])
+
+class OpenpyxlSheet:
+    def __init__(self, workbook, worksheet):
+        self.workbook = workbook
+        self.worksheet = worksheet
+        self.merged_ranges: List[MergedRange] = []
+        self.max_row = worksheet.max_row or 0
+        self.max_col = worksheet.max_column or 0
+    
+    def iter_cells(self) -> Iterator[Tuple[int, int, Any]]:
+        parsed = self._open_parser() if WorkSheetParser is not None else None
+        if parsed is None:
+            yield from self._iter_public()
+        else:
+            yield from self._iter_parsed(*parsed)
+    
+    def _open_parser(self):
+        """(sorgente XML, parser) del foglio, o None se l'API interna è cambiata."""
+        workbook = self.workbook
+        src = None
+        try:
+            src = self.worksheet._get_source()
+            parser = WorkSheetParser(
+                src, self.worksheet._shared_strings, data_only=True, epoch=workbook.epoch,
+                date_formats=workbook._date_formats, timedelta_formats=workbook._timedelta_formats
+            )
+        except (AttributeError, TypeError):
+            if src is not None:
+                src.close()
+            logger.warning("Parser interno di openpyxl non compatibile: lettura con iter_rows", exc_info=True)
+            return None
+        return src, parser
+    
+    def _iter_public(self) -> Iterator[Tuple[int, int, Any]]:
+        seen_row = seen_col = 0
+        rows = self.worksheet.iter_rows(min_row=1, min_col=1, values_only=True)
+        for row_idx, row in enumerate(rows, start=1):
+            for col_idx, value in enumerate(row, start=1):
+                if value is None:
+                    continue
+                if col_idx > seen_col:
+                    seen_col = col_idx
+                seen_row = row_idx
+                yield row_idx, col_idx, value
+        
+        self.max_row = max(self.max_row, seen_row)
+        self.max_col = max(self.max_col, seen_col)
+    
+    def _iter_parsed(self, src, parser) -> Iterator[Tuple[int, int, Any]]:
+        seen_row = seen_col = 0
+        with src:
+            for row_idx, row in parser.parse():
+                for cell in row:
+                    value = cell["value"]
+                    if value is None:
+                        continue
+                    col_idx = cell["column"]
+                    if col_idx > seen_col:
+                        seen_col = col_idx
+                    seen_row = row_idx
+                    yield row_idx, col_idx, value
+            
+            if parser.merged_cells:
+                for merged in parser.merged_cells.mergeCell:
+                    col_start, row_start, col_end, row_end = range_boundaries(merged.ref)
+                    self.merged_ranges.append((row_start, col_start, row_end, col_end))
+        
+        self.max_row = max(self.max_row, seen_row)
+        self.max_col = max(self.max_col, seen_col)
+
+class CalamineReader(_Reader):
+    """
+    Lettore in Rust (python-calamine), opzionale. calamine restituisce tutti
+    i numeri come float e le date senza ora come date: sono convertiti come
+    negli altri engine (int per gli interi, datetime), così il testo delle
+    celle coincide. Le formule senza valore in cache sono ignorate.
+    """
+    
+    def __init__(self, file_path: Path):
+        self.workbook = CalamineWorkbook.from_path(str(file_path))
+    
+    def close(self):
+        self.workbook.close()
+    
+    @property
+    def sheetnames(self) -> List[str]:
+        return list(self.workbook.sheet_names)
+    
+    def sheet(self, name: str) -> "CalamineSheet":
+        return CalamineSheet(self.workbook.get_sheet_by_name(name))
+
+class CalamineSheet:
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.merged_ranges: List[MergedRange] = []
+        self.max_row = 0
+        self.max_col = 0
+    
+    def iter_cells(self) -> Iterator[Tuple[int, int, Any]]:
+        worksheet = self.worksheet
+        # iter_rows parte dalla riga 1 ma dalla prima colonna usata (non da A)
+        start = worksheet.start or (0, 0)
+        col_offset = start[1] + 1
+        seen_row = seen_col = 0
+        
+        for row_idx, row in enumerate(worksheet.iter_rows(), start=1):
+            for col_pos, value in enumerate(row):
+                if value is None or value == "":
+                    continue
+                value_class = type(value)
+                if value_class is float:
+                    # Come nell'XML: interi senza decimali, esponente da 1e16 (repr di Python)
+                    if value.is_integer() and abs(value) < 1e16:
+                        value = int(value)
+                elif value_class is date:
+                    value = datetime.combine(value, time())
+                col_idx = col_pos + col_offset
+                if col_idx > seen_col:
+                    seen_col = col_idx
+                seen_row = row_idx
+                yield row_idx, col_idx, value
+        
+        for (row_start, col_start), (row_end, col_end) in getattr(worksheet, "merged_cell_ranges", None) or ():
+            self.merged_ranges.append((row_start + 1, col_start + 1, row_end + 1, col_end + 1))
+        
+        end = worksheet.end
+        self.max_row = max(end[0] + 1 if end else 0, seen_row)
+        self.max_col = max(end[1] + 1 if end else 0, seen_col)
@@ -0,0 +1,307 @@
+"""
+Rielaborazione dei dataset già caricati, senza un nuovo upload.
+
+- Rianalisi (default): ricalcola l'analisi della struttura dei fogli dalle
+  celle memorizzate, in un pool di processi e a blocchi di fogli.
+- Re-parse (`reparse`): rilegge il file originale con un job di ingestione
+  per dataset (celle, indice di ricerca e analisi).
+
+Sono rielaborati solo i fogli analizzati da una versione del rilevamento
+precedente a DETECTOR_VERSION (o tutti con `force`). Ogni blocco è salvato
+con la nuova versione, quindi un'esecuzione interrotta riprende dai fogli
+rimasti. I job di re-parse interrotti sono ripresi all'avvio del server come
+ogni altro job, o dalla CLI con --reparse (che va quindi eseguita con il
+server fermo, altrimenti conviene usare le API).
+
+Uso da riga di comando (dalla directory backend):
+    python -m app.reprocess                      # fogli non aggiornati di tutti i dataset
+    python -m app.reprocess --dataset ID --force
+    python -m app.reprocess --reparse
+"""
+import argparse
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Query, Session
+
+from . import crud, jobs, models
+from .cache import invalidate_dataset
+from .cell_store import get_cell_store
+from .config import REPROCESS_BATCH_SIZE, REPROCESS_WORKERS
+from .database import Base, ReadSessionLocal, SessionLocal, engine
+from .migrations import run_migrations
+from .search import create_search_index
+from .table_detection import DETECTOR_VERSION, SheetAnalyzer
+
+logger = logging.getLogger(__name__)
+
+class ReanalysisStats(NamedTuple):
+    sheets: int
+    failed: int
+    seconds: float
+
+class ReparseResult(NamedTuple):
+    # Job creati e dataset saltati (con il motivo)
+    jobs: List[models.Job]
+    skipped: Dict[str, str]
+
+def stale_sheets(db: Session, dataset_ids: Optional[Sequence[str]] = None, force: bool = False) -> Query:
+    """Fogli da rielaborare: analizzati da una versione precedente (o tutti con `force`)."""
+    query = db.query(models.Sheet)
+    if dataset_ids is not None:
+        query = query.filter(models.Sheet.dataset_id.in_(dataset_ids))
+    if not force:
+        query = query.filter(or_(
+            models.Sheet.detector_version.is_(None),
+            models.Sheet.detector_version < DETECTOR_VERSION
+        ))
+    return query
+
+def analyze_stored_sheet(sheet_id: int) -> Tuple[int, str]:
+    """
+    Analisi di un foglio dalle celle memorizzate: restituisce (sheet_id,
+    analysis_json). Eseguita nei processi worker con una sessione propria in
+    sola lettura. Le celle sono lette a blocchi (CellStore.iter_chunks):
+    oltre al blocco corrente l'analizzatore tiene 9 byte per cella, come
+    durante l'ingestione.
+    """
+    db = ReadSessionLocal()
+    try:
+        sheet = db.get(models.Sheet, sheet_id)
+        analyzer = SheetAnalyzer()
+        for chunk in get_cell_store(sheet.cell_store).iter_chunks(db, sheet):
+            for cell in chunk:
+                analyzer.add(cell.row, cell.col, cell.value_text)
+        analyzer.merged_ranges = crud.sheet_merged_ranges(sheet)
+        return sheet_id, analyzer.to_json()
+    finally:
+        db.close()
+
+def reanalyze_sheets(
+    db: Session,
+    dataset_ids: Optional[Sequence[str]] = None,
+    force: bool = False,
+    workers: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    progress: Optional[Callable[[int, int, int], None]] = None
+) -> ReanalysisStats:
+    """
+    Ricalcola l'analisi dei fogli da rielaborare (vedi stale_sheets).
+    
+    I fogli sono presi a blocchi di `batch_size` in ordine di id e analizzati
+    da `workers` processi; ogni blocco è salvato in una transazione con
+    DETECTOR_VERSION. Un foglio la cui analisi fallisce resta com'è (e resta
+    da rielaborare). Le cache dei dataset toccati sono invalidate.
+    
+    Se fornita, `progress(fogli fatti, falliti, totale)` è invocata dopo ogni blocco.
+    """
+    
+    workers = workers or REPROCESS_WORKERS
+    batch_size = batch_size or REPROCESS_BATCH_SIZE
+    start = time.perf_counter()
+    total = stale_sheets(db, dataset_ids, force).count()
+    done = failed = 0
+    last_id = 0
+    
+    # spawn: il chiamante può essere un thread del server, fork non è sicuro
+    executor = None
+    if workers > 1 and total > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=min(workers, total), mp_context=multiprocessing.get_context("spawn")
+        )
+    try:
+        while True:
+            # Paginazione per id: anche con `force` ogni foglio è visto una volta
+            batch = [
+                (sheet_id, dataset_id) for sheet_id, dataset_id in stale_sheets(db, dataset_ids, force)
+                .filter(models.Sheet.id > last_id)
+                .order_by(models.Sheet.id)
+                .with_entities(models.Sheet.id, models.Sheet.dataset_id)
+                .limit(batch_size)
+            ]
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            
+            if executor:
+                futures = [executor.submit(analyze_stored_sheet, sheet_id) for sheet_id, _ in batch]
+                results = [_analysis_or_none(sheet_id, future.result) for (sheet_id, _), future in zip(batch, futures)]
+            else:
+                results = [_analysis_or_none(sheet_id, analyze_stored_sheet, sheet_id) for sheet_id, _ in batch]
+            
+            for (sheet_id, _), analysis_json in zip(batch, results):
+                if analysis_json is None:
+                    failed += 1
+                    continue
+                db.query(models.Sheet).filter(models.Sheet.id == sheet_id).update(
+                    {"analysis_json": analysis_json, "detector_version": DETECTOR_VERSION},
+                    synchronize_session=False
+                )
+                done += 1
+            db.commit()
+            
+            for dataset_id in {dataset_id for _, dataset_id in batch}:
+                invalidate_dataset(dataset_id)
+            if progress:
+                progress(done, failed, total)
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+    
+    stats = ReanalysisStats(sheets=done, failed=failed, seconds=time.perf_counter() - start)
+    logger.info(
+        "Rianalisi: %d fogli in %.2fs (%d falliti, versione %d)",
+        stats.sheets, stats.seconds, stats.failed, DETECTOR_VERSION
+    )
+    return stats
+
+def _analysis_or_none(sheet_id: int, func: Callable, *args) -> Optional[str]:
+    try:
+        return func(*args)[1]
+    except Exception:
+        logger.exception("Rianalisi fallita per il foglio %s", sheet_id)
+        return None
+
+def reparse_datasets(
+    db: Session,
+    dataset_ids: Optional[Sequence[str]] = None,
+    force: bool = False,
+    submit: bool = True
+) -> ReparseResult:
+    """
+    Crea un job di ingestione per ogni dataset con fogli da rielaborare (o
+    per tutti i dataset indicati con `force`): il job rilegge il file
+    originale e sostituisce il contenuto. Sono saltati i dataset con un job
+    in corso e quelli il cui file non è più disponibile (il job fallirebbe
+    dopo aver eliminato il contenuto).
+    
+    Con `submit` i job sono accodati sul pool di ingestione; altrimenti il
+    chiamante li esegue (jobs.run_ingestion_job), come fa la CLI.
+    """
+    
+    if force:
+        query = db.query(models.Dataset.id)
+        if dataset_ids is not None:
+            query = query.filter(models.Dataset.id.in_(dataset_ids))
+    else:
+        query = stale_sheets(db, dataset_ids).with_entities(models.Sheet.dataset_id).distinct()
+    selected = sorted(dataset_id for dataset_id, in query)
+    
+    result = ReparseResult(jobs=[], skipped={})
+    for dataset_id in selected:
+        dataset = crud.get_dataset(db, dataset_id)
+        if jobs.has_active_job(db, dataset_id):
+            result.skipped[dataset_id] = "job in corso"
+        elif not Path(dataset.file_path).exists():
+            result.skipped[dataset_id] = "file originale non trovato"
+        else:
+            job = jobs.create_job(db, dataset_id)
+            if submit:
+                jobs.submit_job(job.id)
+            result.jobs.append(job)
+    return result
+
+# Stato della rianalisi avviata dalle API (una alla volta per processo)
+_status_lock = threading.Lock()
+_status: Dict[str, Any] = {"status": "idle"}
+
+def get_status() -> Dict[str, Any]:
+    with _status_lock:
+        return dict(_status)
+
+def _update_status(**values):
+    with _status_lock:
+        _status.update(values)
+
+def start_reanalysis(dataset_ids: Optional[Sequence[str]] = None, force: bool = False) -> bool:
+    """
+    Avvia la rianalisi in un thread in background; restituisce False se
+    un'altra rianalisi è già in corso. Lo stato è in get_status().
+    """
+    with _status_lock:
+        if _status["status"] == "running":
+            return False
+        _status.clear()
+        _status.update(
+            status="running", detector_version=DETECTOR_VERSION,
+            sheets_total=None, sheets_done=0, sheets_failed=0, error=None,
+            started_at=datetime.now(timezone.utc), finished_at=None
+        )
+    
+    def run():
+        db = SessionLocal()
+        try:
+            stats = reanalyze_sheets(
+                db, dataset_ids, force,
+                progress=lambda done, failed, total: _update_status(
+                    sheets_done=done, sheets_failed=failed, sheets_total=total
+                )
+            )
+            _update_status(
+                status="done", sheets_done=stats.sheets, sheets_failed=stats.failed,
+                finished_at=datetime.now(timezone.utc)
+            )
+        except Exception as exc:
+            logger.exception("Rianalisi fallita")
+            _update_status(status="failed", error=str(exc), finished_at=datetime.now(timezone.utc))
+        finally:
+            db.close()
+    
+    threading.Thread(target=run, name="reprocess", daemon=True).start()
+    return True
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", action="append", dest="dataset_ids", help="dataset da rielaborare (ripetibile; default tutti)")
+    parser.add_argument("--force", action="store_true", help="rielabora anche i fogli già alla versione corrente")
+    parser.add_argument("--reparse", action="store_true", help="rilegge i file originali invece di rianalizzare le celle")
+    parser.add_argument("--workers", type=int, default=REPROCESS_WORKERS, help="processi per la rianalisi")
+    parser.add_argument("--batch-size", type=int, default=REPROCESS_BATCH_SIZE, help="fogli per transazione")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    
+    # Schema aggiornato come all'avvio del server (colonna detector_version)
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    create_search_index(engine)
+    
+    db = SessionLocal()
+    try:
+        if not args.reparse:
+            reanalyze_sheets(
+                db, args.dataset_ids, args.force, args.workers, args.batch_size,
+                progress=lambda done, failed, total: print(f"{done + failed}/{total} fogli ({failed} falliti)", flush=True)
+            )
+            return
+        
+        # Job rimasti incompleti da un'esecuzione interrotta: sono ripresi
+        pending = db.query(models.Job).filter(models.Job.status.in_(jobs.ACTIVE_STATES))
+        if args.dataset_ids is not None:
+            pending = pending.filter(models.Job.dataset_id.in_(args.dataset_ids))
+        to_run = [(job.id, job.dataset_id) for job in pending]
+        
+        result = reparse_datasets(db, args.dataset_ids, args.force, submit=False)
+        resumed = {dataset_id for _, dataset_id in to_run}
+        for dataset_id, reason in result.skipped.items():
+            if dataset_id not in resumed:
+                print(f"{dataset_id}: saltato ({reason})")
+        to_run += [(job.id, job.dataset_id) for job in result.jobs]
+        
+        for idx, (job_id, dataset_id) in enumerate(to_run, start=1):
+            jobs.run_ingestion_job(job_id)
+            db.expire_all()
+            job = jobs.get_job(db, job_id)
+            print(f"{idx}/{len(to_run)} {dataset_id}: {job.status} {job.error or ''}".rstrip(), flush=True)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import List, Optional, Any
+from typing import Dict, List, Optional, Any
 
 class DatasetBase(BaseModel):
     filename: str
@@ -14,7 +14,9 @@ class DatasetResponse(BaseModel):
     sha256: str
     upload_date: datetime
     file_size: int
+    reader_engine: Optional[str] = None
     sheet_count: Optional[int] = 0
+    job_id: Optional[str] = None
     
     class Config:
         from_attributes = True
@@ -25,7 +27,28 @@ class SheetResponse(BaseModel):
     n_rows: int
     n_cols: int
     merged_cells_count: int
+    merged_ranges: List[List[int]] = []
     analysis_json: Optional[str] = None
+    detector_version: Optional[int] = None
+    truncated_cells: int = 0
+    
+    class Config:
+        from_attributes = True
+
+class JobResponse(BaseModel):
+    id: str
+    dataset_id: str
+    status: str
+    sheets_total: int
+    sheets_done: int
+    current_sheet: Optional[str] = None
+    cells_loaded: Optional[int] = None
+    cells_per_sec: Optional[float] = None
+    cells_truncated: Optional[int] = None
+    profile: Optional[bool] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -34,6 +57,36 @@ class DatasetDetailResponse(BaseModel):
     dataset: DatasetResponse
     sheets: List[SheetResponse]
 
+class SearchHitResponse(BaseModel):
+    dataset_id: str
+    filename: str
+    sheet_name: str
+    row: int
+    col: int
+    value: str
+    snippet: str
+
+class ReprocessRequest(BaseModel):
+    # Dataset da rielaborare (default tutti)
+    dataset_ids: Optional[List[str]] = None
+    # Anche i fogli già analizzati dalla versione corrente del rilevamento
+    force: bool = False
+
+class ReprocessStatusResponse(BaseModel):
+    status: str
+    detector_version: Optional[int] = None
+    sheets_total: Optional[int] = None
+    sheets_done: int = 0
+    sheets_failed: int = 0
+    error: Optional[str] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class ReparseResponse(BaseModel):
+    job_ids: List[str]
+    # dataset_id -> motivo
+    skipped: Dict[str, str] = {}
+
 class GridPreviewResponse(BaseModel):
     mode: str = "grid"
     data: List[List[str]]
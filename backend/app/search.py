@@ -0,0 +1,203 @@
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import models
+from .cell_store import get_cell_store
+
+# Chiave di una cella nell'indice: sheet_id, riga e colonna in un solo intero
+# (righe fino a 2^21 e colonne fino a 2^15 coprono i limiti di Excel). Le celle
+# di un foglio occupano un intervallo contiguo di chiavi: eliminazione e
+# filtri per foglio sono intervalli sulla chiave
+ROW_BITS = 21
+COL_BITS = 15
+SHEET_SHIFT = ROW_BITS + COL_BITS
+
+# Marcatori dei termini trovati nello snippet
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+
+# SQLite: indice FTS5 con il testo delle celle e la chiave come rowid. Senza
+# indici di prefisso: con 1M di celle un prefisso di un carattere costa ~25 ms
+# e gli indici rallenterebbero la costruzione, già dominata dalla tokenizzazione
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS cell_search USING fts5("
+    "value_text, tokenize='unicode61 remove_diacritics 2')",
+)
+
+# PostgreSQL: tabella con indice GIN sul tsvector del testo (configurazione
+# 'simple': nessuno stemming, adatta a codici e nomi). La punteggiatura è
+# sostituita da spazi come nel tokenizer di FTS5, altrimenti il parser di
+# PostgreSQL legge "C-12345" come "C" e il numero negativo "-12345"
+POSTGRES_TSVECTOR = "to_tsvector('simple', regexp_replace(value_text, '\\W+', ' ', 'g'))"
+POSTGRES_DDL = (
+    "CREATE TABLE IF NOT EXISTS cell_search (key BIGINT PRIMARY KEY, value_text TEXT NOT NULL)",
+    f"CREATE INDEX IF NOT EXISTS ix_cell_search_tsv ON cell_search USING GIN (({POSTGRES_TSVECTOR}))",
+)
+
+class SearchHit(NamedTuple):
+    dataset_id: str
+    filename: str
+    sheet_name: str
+    row: int
+    col: int
+    value: str
+    snippet: str
+
+class SearchQueryError(ValueError):
+    pass
+
+def cell_key(sheet_id: int, row: int, col: int) -> int:
+    return (sheet_id << SHEET_SHIFT) | (row << COL_BITS) | col
+
+def split_key(key: int) -> Tuple[int, int, int]:
+    """(sheet_id, row, col) di una chiave dell'indice."""
+    return key >> SHEET_SHIFT, (key >> COL_BITS) & ((1 << ROW_BITS) - 1), key & ((1 << COL_BITS) - 1)
+
+def sheet_key_range(sheet_id: int) -> Tuple[int, int]:
+    """Prima e ultima chiave (incluse) delle celle di un foglio."""
+    return sheet_id << SHEET_SHIFT, ((sheet_id + 1) << SHEET_SHIFT) - 1
+
+def create_search_index(engine: Engine):
+    """Crea l'indice di ricerca se assente (non è un modello SQLAlchemy)."""
+    ddl = POSTGRES_DDL if engine.dialect.name == "postgresql" else SQLITE_DDL
+    with engine.begin() as conn:
+        for statement in ddl:
+            conn.execute(text(statement))
+
+def _key_sql(dialect: str) -> str:
+    # Stessa codifica di cell_key, calcolata dal database (su PostgreSQL le
+    # colonne sono integer a 32 bit)
+    if dialect == "postgresql":
+        return f"(CAST(sheet_id AS BIGINT) << {SHEET_SHIFT}) | (CAST(row AS BIGINT) << {COL_BITS}) | col"
+    return f"(sheet_id << {SHEET_SHIFT}) | (row << {COL_BITS}) | col"
+
+def _key_column(dialect: str) -> str:
+    return "key" if dialect == "postgresql" else "rowid"
+
+def index_sheet(db: Session, sheet: models.Sheet):
+    """
+    Aggiunge all'indice le celle del foglio appena scritte. Le celle nella
+    tabella `cells` sono copiate con un solo INSERT ... SELECT, quelle degli
+    altri cell store sono rilette dallo store a blocchi (un executemany per
+    blocco). Non esegue commit: l'indice fa parte della transazione del foglio.
+    """
+    dialect = db.get_bind().dialect.name
+    key_column = _key_column(dialect)
+    
+    if sheet.cell_store == "sqlite":
+        db.execute(
+            text(
+                f"INSERT INTO cell_search ({key_column}, value_text) "
+                f"SELECT {_key_sql(dialect)}, value_text FROM cells WHERE sheet_id = :sheet_id"
+            ),
+            {"sheet_id": sheet.id}
+        )
+        return
+    
+    insert_sql = text(f"INSERT INTO cell_search ({key_column}, value_text) VALUES (:key, :value_text)")
+    for chunk in get_cell_store(sheet.cell_store).iter_chunks(db, sheet):
+        if chunk:
+            db.execute(
+                insert_sql,
+                [{"key": cell_key(sheet.id, c.row, c.col), "value_text": c.value_text} for c in chunk]
+            )
+
+def delete_sheets(db: Session, sheet_ids: Iterable[int]):
+    """Rimuove dall'indice le celle dei fogli (un intervallo di chiavi per foglio)."""
+    key_column = _key_column(db.get_bind().dialect.name)
+    for sheet_id in sheet_ids:
+        first, last = sheet_key_range(sheet_id)
+        db.execute(
+            text(f"DELETE FROM cell_search WHERE {key_column} BETWEEN :first AND :last"),
+            {"first": first, "last": last}
+        )
+
+def query_terms(query: str) -> List[str]:
+    """Termini della query (parole e numeri); ognuno è cercato come prefisso."""
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        raise SearchQueryError("La ricerca deve contenere almeno una parola o un numero")
+    return terms
+
+def search_cells(
+    db: Session,
+    query: str,
+    dataset_id: Optional[str] = None,
+    limit: int = 50,
+    cursor: Optional[int] = None
+) -> Tuple[List[SearchHit], Optional[int]]:
+    """
+    Celle che contengono tutti i termini della query come prefissi di parole
+    (es. "cli 12" trova "Cliente C-1234"), in ordine di foglio, riga e colonna.
+    
+    La paginazione è per chiave (keyset): `cursor` è la chiave dell'ultima
+    cella della pagina precedente. Restituisce (risultati, cursore della
+    pagina successiva o None).
+    """
+    terms = query_terms(query)
+    dialect = db.get_bind().dialect.name
+    key_column = _key_column(dialect)
+    params: Dict[str, Any] = {"limit": limit + 1}
+    conditions = []
+    
+    if dialect == "postgresql":
+        params["query"] = " & ".join(f"{term}:*" for term in terms)
+        conditions.append(f"{POSTGRES_TSVECTOR} @@ to_tsquery('simple', :query)")
+        snippet = (
+            "ts_headline('simple', value_text, to_tsquery('simple', :query), "
+            f"'StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MinWords=5, MaxWords=16')"
+        )
+    else:
+        # Ogni termine tra virgolette (nessun operatore FTS5 dalla query) con prefisso
+        params["query"] = " ".join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+        conditions.append("cell_search MATCH :query")
+        snippet = f"snippet(cell_search, 0, '{SNIPPET_START}', '{SNIPPET_END}', '…', 16)"
+    
+    sheet_names: Dict[int, Tuple[str, str, str]] = {}
+    if dataset_id is not None:
+        sheet_names = _sheet_names(db, models.Sheet.dataset_id == dataset_id)
+        if not sheet_names:
+            return [], None
+        # Intervallo delle chiavi dei fogli del dataset, poi i singoli fogli
+        params["first"] = sheet_key_range(min(sheet_names))[0]
+        params["last"] = sheet_key_range(max(sheet_names))[1]
+        conditions.append(f"{key_column} BETWEEN :first AND :last")
+        conditions.append(f"({key_column} >> {SHEET_SHIFT}) IN ({','.join(str(i) for i in sheet_names)})")
+    if cursor is not None:
+        params["cursor"] = cursor
+        conditions.append(f"{key_column} > :cursor")
+    
+    rows = db.execute(
+        text(
+            f"SELECT {key_column}, value_text, {snippet} FROM cell_search "
+            f"WHERE {' AND '.join(conditions)} ORDER BY {key_column} LIMIT :limit"
+        ),
+        params
+    ).all()
+    
+    next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+    rows = rows[:limit]
+    
+    missing = {split_key(key)[0] for key, _, _ in rows} - sheet_names.keys()
+    if missing:
+        sheet_names.update(_sheet_names(db, models.Sheet.id.in_(missing)))
+    
+    hits = []
+    for key, value_text, snippet_text in rows:
+        sheet_id, row, col = split_key(key)
+        names = sheet_names.get(sheet_id)
+        if names is None:
+            continue
+        hits.append(SearchHit(*names, row=row, col=col, value=value_text, snippet=snippet_text))
+    return hits, next_cursor
+
+def _sheet_names(db: Session, condition) -> Dict[int, Tuple[str, str, str]]:
+    """sheet_id -> (dataset_id, filename, sheet_name) dei fogli che soddisfano la condizione."""
+    rows = db.query(
+        models.Sheet.id, models.Dataset.id, models.Dataset.filename, models.Sheet.sheet_name
+    ).join(models.Dataset, models.Dataset.id == models.Sheet.dataset_id).filter(condition)
+    return {sheet_id: (dataset_id, filename, sheet_name) for sheet_id, dataset_id, filename, sheet_name in rows}
@@ -1,180 +1,295 @@
 import json
-from typing import List, Dict, Any, Tuple
-from sqlalchemy.orm import Session
+from array import array
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
 from . import models
+from .metrics import span
+
+# Versione dell'output dell'analisi, salvata con ogni foglio: va incrementata
+# quando cambia il rilevamento, così la rielaborazione (reprocess.py) rianalizza
+# solo i fogli analizzati da una versione precedente
+DETECTOR_VERSION = 1
 
-def analyze_sheet_structure(cells: List[models.Cell]) -> str:
+# Intervallo unito: (row_start, col_start, row_end, col_end), estremi inclusi
+MergedRange = Tuple[int, int, int, int]
+
+# Segmentazione: righe/colonne vuote consecutive che separano due blocchi,
+# celle minime di un blocco candidato (un titolo isolato non è una tabella)
+# e numero massimo di candidati restituiti
+MIN_GUTTER = 1
+MIN_BLOCK_CELLS = 2
+MAX_CANDIDATES = 10
+
+class SheetAnalyzer:
     """
-    Analizza la struttura di un foglio e rileva candidati tabella.
-    Restituisce JSON con candidati, confidence e header row.
+    Accumulatore incrementale per l'analisi di struttura.
+    
+    Riceve le celle durante la lettura del foglio (in qualsiasi ordine) e
+    conserva solo le coordinate e il peso come intestazione di ogni cella
+    (9 byte per cella): bounding box, densità e intestazioni sono calcolati
+    alla fine senza rileggere le celle.
+    
+    Gli intervalli uniti del foglio (`merged_ranges`), se noti prima di
+    `to_json`, sono usati per le intestazioni su più righe.
     """
-    if not cells:
-        return json.dumps({"candidates": []})
-    
-    # Step 1: Calcola bounding box
-    rows = [c.row for c in cells]
-    cols = [c.col for c in cells]
-    min_row, max_row = min(rows), max(rows)
-    min_col, max_col = min(cols), max(cols)
-    
-    # Crea mappa celle per lookup veloce
-    cell_map = {(c.row, c.col): c.value_text for c in cells}
-    
-    # Step 2: Calcola densità per riga e colonna
-    row_density = {}
-    col_density = {}
-    total_cols = max_col - min_col + 1
-    total_rows = max_row - min_row + 1
-    
-    for row in range(min_row, max_row + 1):
-        filled = sum(1 for col in range(min_col, max_col + 1) if (row, col) in cell_map)
-        row_density[row] = filled / total_cols if total_cols > 0 else 0
-    
-    for col in range(min_col, max_col + 1):
-        filled = sum(1 for row in range(min_row, max_row + 1) if (row, col) in cell_map)
-        col_density[col] = filled / total_rows if total_rows > 0 else 0
-    
-    # Step 3: Trova rettangoli densi
-    candidates = find_dense_rectangles(
-        cell_map, min_row, max_row, min_col, max_col, 
-        row_density, col_density
-    )
-    
-    # Step 4: Per ogni candidato, trova header row
-    for candidate in candidates:
-        header_row = detect_header_row(
-            cell_map, 
-            candidate["row_start"], 
-            candidate["row_end"],
-            candidate["col_start"],
-            candidate["col_end"]
-        )
-        candidate["header_row"] = header_row
+    
+    def __init__(self):
+        self.rows = array("i")
+        self.cols = array("i")
+        self.weights = array("b")
+        self.merged_ranges: List[MergedRange] = []
+    
+    def add(self, row: int, col: int, value_text: str):
+        self.rows.append(row)
+        self.cols.append(col)
+        self.weights.append(header_weight(value_text))
+    
+    def observe(self, cells: Iterable[tuple]) -> Iterator[tuple]:
+        """
+        Registra le celle (row, col, value_text, value_type, valore) mentre le
+        inoltra (da usare tra lettura e scrittura).
+        """
+        add_row, add_col, add_weight = self.rows.append, self.cols.append, self.weights.append
+        for cell in cells:
+            row, col, value_text, _, _ = cell
+            add_row(row)
+            add_col(col)
+            add_weight(header_weight(value_text))
+            yield cell
+    
+    def to_json(self) -> str:
+        """
+        Rileva candidati tabella.
+        Restituisce JSON con candidati, confidence e header row.
+        """
+        with span("analyze"):
+            return self._analyze()
+    
+    def _analyze(self) -> str:
+        if not self.rows:
+            return json.dumps({"candidates": []})
         
-        # Calcola confidence
-        density_score = calculate_density_score(
-            cell_map,
-            candidate["row_start"],
-            candidate["row_end"],
-            candidate["col_start"],
-            candidate["col_end"]
-        )
+        # Step 1: Coordinate e bounding box
+        rows = np.frombuffer(self.rows, dtype=np.int32).astype(np.int64)
+        cols = np.frombuffer(self.cols, dtype=np.int32).astype(np.int64)
+        weights = np.frombuffer(self.weights, dtype=np.int8)
         
-        has_good_header = header_row is not None
-        candidate["score"] = density_score
+        # Step 2: Blocchi separati da righe/colonne vuote, ordinati per rilevanza
+        candidates = []
+        for idx, candidate in find_table_blocks(rows, cols):
+            # Step 3: Per ogni candidato, trova le righe di intestazione
+            # (header_row è l'ultima: i dati iniziano dalla riga successiva)
+            if idx is None:
+                block_rows, block_cols, block_weights = rows, cols, weights
+            else:
+                block_rows, block_cols, block_weights = rows[idx], cols[idx], weights[idx]
+            header_row_start, header_row = detect_header_row(
+                block_rows, block_cols, block_weights,
+                candidate["row_start"],
+                candidate["row_end"],
+                candidate["col_start"],
+                candidate["col_end"],
+                self.merged_ranges
+            )
+            candidate["header_row_start"] = header_row_start
+            candidate["header_row"] = header_row
+            
+            # Calcola confidence
+            density_score = candidate["score"]
+            has_good_header = header_row is not None
+            
+            if density_score > 0.7 and has_good_header:
+                candidate["confidence"] = "high"
+            elif density_score > 0.4:
+                candidate["confidence"] = "medium"
+            else:
+                candidate["confidence"] = "low"
+            candidates.append(candidate)
         
-        if density_score > 0.7 and has_good_header:
-            candidate["confidence"] = "high"
-        elif density_score > 0.4:
-            candidate["confidence"] = "medium"
-        else:
-            candidate["confidence"] = "low"
-    
-    return json.dumps({"candidates": candidates})
+        return json.dumps({"candidates": candidates})
 
-def find_dense_rectangles(
-    cell_map: Dict[Tuple[int, int], str],
-    min_row: int, max_row: int,
-    min_col: int, max_col: int,
-    row_density: Dict[int, float],
-    col_density: Dict[int, float],
-    threshold: float = 0.3
-) -> List[Dict[str, Any]]:
-    """Trova fino a 3 rettangoli densi."""
-    
-    candidates = []
-    
-    # Candidato 1: Tutto il bounding box
-    candidates.append({
-        "row_start": min_row,
-        "row_end": max_row,
-        "col_start": min_col,
-        "col_end": max_col
-    })
-    
-    # Candidato 2: Rimuovi righe/colonne sparse all'inizio
-    dense_row_start = min_row
-    for row in range(min_row, max_row + 1):
-        if row_density.get(row, 0) >= threshold:
-            dense_row_start = row
-            break
+def analyze_sheet_structure(cells: Iterable[models.Cell]) -> str:
+    """
+    Analizza la struttura di un foglio e rileva candidati tabella.
+    Restituisce JSON con candidati, confidence e header row.
+    """
+    analyzer = SheetAnalyzer()
+    for c in cells:
+        analyzer.add(c.row, c.col, c.value_text)
+    return analyzer.to_json()
+
+def segment_blocks(rows: np.ndarray, cols: np.ndarray, min_gap: int = MIN_GUTTER) -> np.ndarray:
+    """
+    Segmenta il foglio in blocchi separati da righe o colonne vuote (XY-cut)
+    e restituisce l'etichetta di blocco di ogni cella (0..n_blocchi-1).
     
-    dense_col_start = min_col
-    for col in range(min_col, max_col + 1):
-        if col_density.get(col, 0) >= threshold:
-            dense_col_start = col
-            break
+    Tutti i blocchi sono divisi insieme, alternando righe e colonne: a ogni
+    passata le celle sono ordinate per (blocco, coordinata) e un nuovo blocco
+    inizia dove cambia il blocco o ci sono almeno `min_gap` righe/colonne
+    vuote. Si termina quando nessun blocco è più divisibile in nessuna
+    direzione; ogni passata costa O(celle log celle) ed è vettoriale, anche
+    per fogli sparsi divisi in moltissimi blocchi.
+    """
+    labels = np.zeros(len(rows), dtype=np.int64)
+    n_blocks = 1
+    unchanged = 0
+    axis = 0
+    while unchanged < 2 and len(rows):
+        coords = rows if axis == 0 else cols
+        # Ordine per (blocco, coordinata) con una sola chiave intera
+        order = np.argsort(labels * (int(coords.max()) + 1) + coords)
+        sorted_labels = labels[order]
+        starts = np.empty(len(order), dtype=bool)
+        starts[0] = True
+        starts[1:] = (sorted_labels[1:] != sorted_labels[:-1]) | (np.diff(coords[order]) > min_gap)
+        labels = np.empty_like(labels)
+        labels[order] = np.cumsum(starts) - 1
+        count = int(labels.max()) + 1
+        unchanged = unchanged + 1 if count == n_blocks else 0
+        n_blocks = count
+        axis = 1 - axis
+    return labels
+
+def rectangle_area(candidate: Dict[str, Any]) -> int:
+    return (candidate["row_end"] - candidate["row_start"] + 1) * (candidate["col_end"] - candidate["col_start"] + 1)
+
+def find_table_blocks(
+    rows: np.ndarray,
+    cols: np.ndarray,
+    min_gap: int = MIN_GUTTER,
+    max_candidates: int = MAX_CANDIDATES
+) -> List[Tuple[Optional[np.ndarray], Dict[str, Any]]]:
+    """
+    Candidati tabella: i blocchi del foglio (vedi segment_blocks) con almeno
+    MIN_BLOCK_CELLS celle, ordinati per celle piene x densità, così le
+    tabelle grandi e compatte precedono titoli e note. Con più blocchi
+    l'intero bounding box è l'ultimo candidato (tabelle con una colonna o
+    una riga vuota al loro interno).
     
-    if dense_row_start > min_row or dense_col_start > min_col:
-        candidates.append({
-            "row_start": dense_row_start,
-            "row_end": max_row,
-            "col_start": dense_col_start,
-            "col_end": max_col
-        })
+    Restituisce (indici delle celle o None per tutte, candidato con
+    estremi e `score` = densità).
+    """
+    
+    labels = segment_blocks(rows, cols, min_gap)
+    
+    # Celle e bounding box di ogni blocco, senza cicli Python sui blocchi
+    order = np.argsort(labels, kind="stable")
+    bounds = np.flatnonzero(np.r_[True, np.diff(labels[order]) != 0])
+    counts = np.diff(np.r_[bounds, len(order)])
+    block_rows, block_cols = rows[order], cols[order]
+    row_start = np.minimum.reduceat(block_rows, bounds)
+    row_end = np.maximum.reduceat(block_rows, bounds)
+    col_start = np.minimum.reduceat(block_cols, bounds)
+    col_end = np.maximum.reduceat(block_cols, bounds)
+    density = counts / ((row_end - row_start + 1) * (col_end - col_start + 1))
     
-    # Candidato 3: Area centrale più densa
-    if max_row - min_row > 10:
-        mid_start = min_row + 2
-        mid_end = min(min_row + 100, max_row)
-        candidates.append({
-            "row_start": mid_start,
-            "row_end": mid_end,
-            "col_start": dense_col_start,
-            "col_end": max_col
+    # Ordine per peso decrescente; a parità dall'alto in basso, da sinistra a destra
+    ranked = np.lexsort((col_start, row_start, -(counts * density)))
+    ranked = ranked[counts[ranked] >= MIN_BLOCK_CELLS][:max_candidates]
+    blocks = [
+        (order[bounds[b]:bounds[b] + counts[b]], {
+            "row_start": int(row_start[b]),
+            "row_end": int(row_end[b]),
+            "col_start": int(col_start[b]),
+            "col_end": int(col_end[b]),
+            "score": float(density[b]),
         })
+        for b in ranked.tolist()
+    ]
     
-    return candidates[:3]
+    bounding_box = {
+        "row_start": int(rows.min()),
+        "row_end": int(rows.max()),
+        "col_start": int(cols.min()),
+        "col_end": int(cols.max()),
+    }
+    if len(counts) == 1 and len(blocks) == 1:
+        return [(None, blocks[0][1])]
+    
+    bounding_box["score"] = len(rows) / rectangle_area(bounding_box)
+    return blocks + [(None, bounding_box)]
+
+def header_weight(value: str) -> int:
+    """Peso di una cella come possibile intestazione: 2 se testuale, 1 se numerica."""
+    if not value.strip():
+        return 0
+    # Preferisci stringhe non numeriche
+    if not value.replace(".", "").replace(",", "").replace("-", "").strip().isdigit():
+        return 2
+    return 1
 
 def detect_header_row(
-    cell_map: Dict[Tuple[int, int], str],
+    rows: np.ndarray,
+    cols: np.ndarray,
+    weights: np.ndarray,
     row_start: int, row_end: int,
-    col_start: int, col_end: int
-) -> int:
-    """Rileva la riga header più probabile (prime 3 righe)."""
+    col_start: int, col_end: int,
+    merged_ranges: Sequence[MergedRange] = ()
+) -> Tuple[int, int]:
+    """
+    Rileva le righe header più probabili (prime 3 righe): restituisce
+    (prima, ultima), uguali per un'intestazione su una sola riga.
+    
+    Una cella unita conta come intestazione su tutte le celle che copre;
+    se la riga scelta contiene celle unite che si estendono in orizzontale
+    o verso il basso, anche le righe seguenti con punteggio da intestazione
+    fanno parte dell'header (es. "Vendite 2023" sopra "Q1", "Q2", "Q3").
+    """
+    
+    last_row = min(row_start + 3, row_end + 1) - 1
+    total_cols = col_end - col_start + 1
+    if last_row < row_start or total_cols <= 0:
+        return row_start, row_start
+    
+    # Somma dei pesi come intestazione delle celle di ogni riga candidata
+    in_window = (rows >= row_start) & (rows <= last_row) & (cols >= col_start) & (cols <= col_end)
+    scores = np.bincount(
+        rows[in_window] - row_start,
+        weights=weights[in_window],
+        minlength=last_row - row_start + 1
+    ).astype(np.float64)
+    
+    # Intervalli uniti che toccano la finestra, con il peso della cella di ancoraggio
+    window_weights = dict(zip(
+        zip(rows[in_window].tolist(), cols[in_window].tolist()),
+        weights[in_window].tolist()
+    ))
+    merged = []
+    for r0, c0, r1, c1 in merged_ranges:
+        anchor_weight = window_weights.get((r0, c0))
+        if anchor_weight is None or c1 < col_start or c0 > col_end:
+            continue
+        merged.append((r0, c0, r1, c1))
+        covered_cols = min(c1, col_end) - max(c0, col_start) + 1
+        for row in range(r0, min(r1, last_row) + 1):
+            # L'ancoraggio è già contato
+            scores[row - row_start] += anchor_weight * (covered_cols - (row == r0))
     
     best_row = None
     best_score = 0
     
-    for test_row in range(row_start, min(row_start + 3, row_end + 1)):
-        score = 0
-        filled_count = 0
-        
-        for col in range(col_start, col_end + 1):
-            value = cell_map.get((test_row, col), "")
-            if value.strip():
-                filled_count += 1
-                # Preferisci stringhe non numeriche
-                if not value.replace(".", "").replace(",", "").replace("-", "").strip().isdigit():
-                    score += 2
-                else:
-                    score += 1
-        
+    for offset, score in enumerate(scores.tolist()):
         # Normalizza score
-        total_cols = col_end - col_start + 1
-        if total_cols > 0:
-            normalized_score = score / total_cols
-            if normalized_score > best_score:
-                best_score = normalized_score
-                best_row = test_row
-    
-    return best_row if best_score > 0.5 else row_start
-
-def calculate_density_score(
-    cell_map: Dict[Tuple[int, int], str],
-    row_start: int, row_end: int,
-    col_start: int, col_end: int
-) -> float:
-    """Calcola densità del rettangolo."""
+        normalized_score = score / total_cols
+        if normalized_score > best_score:
+            best_score = normalized_score
+            best_row = row_start + offset
     
-    total_cells = (row_end - row_start + 1) * (col_end - col_start + 1)
-    if total_cells == 0:
-        return 0.0
+    if best_score <= 0.5:
+        return row_start, row_start
     
-    filled = 0
-    for row in range(row_start, row_end + 1):
-        for col in range(col_start, col_end + 1):
-            if (row, col) in cell_map:
-                filled += 1
+    # Header su più righe: celle unite che proseguono oltre la riga corrente
+    # e riga successiva ancora da intestazione (resta almeno una riga di dati)
+    header_end = best_row
+    while header_end < min(last_row, row_end - 1):
+        spans = any(
+            r0 <= header_end <= r1 and (c1 > c0 or r1 > header_end)
+            for r0, c0, r1, c1 in merged
+        )
+        if not spans or scores[header_end + 1 - row_start] / total_cols <= 0.5:
+            break
+        header_end += 1
     
-    return filled / total_cells
+    return best_row, header_end
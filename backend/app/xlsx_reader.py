@@ -0,0 +1,286 @@
+import posixpath
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from xml.etree.ElementTree import iterparse, parse
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import column_index_from_string, range_boundaries
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+
+# Namespace SpreadsheetML: transitional (quasi tutti i file) e strict
+SHEET_NAMESPACES = (
+    "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "http://purl.oclc.org/ooxml/spreadsheetml/main",
+)
+REL_NAMESPACES = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "http://purl.oclc.org/ooxml/officeDocument/relationships",
+)
+PACKAGE_RELS_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+# Intervallo unito: (row_start, col_start, row_end, col_end), estremi inclusi
+MergedRange = Tuple[int, int, int, int]
+
+def _local(tag: str) -> str:
+    return tag.rpartition("}")[2]
+
+def _rel_id(element) -> Optional[str]:
+    for ns in REL_NAMESPACES:
+        value = element.get(f"{{{ns}}}id")
+        if value:
+            return value
+    return None
+
+def _string_content(element) -> str:
+    """Testo di <si> o <is>: <t> diretti e <r><t> (rich text), escluse le letture fonetiche."""
+    parts = []
+    for child in element:
+        tag = _local(child.tag)
+        if tag == "t":
+            parts.append(child.text or "")
+        elif tag == "r":
+            for sub in child:
+                if _local(sub.tag) == "t":
+                    parts.append(sub.text or "")
+    return "".join(parts)
+
+class XlsxReader:
+    """
+    Lettore in streaming di un file xlsx, alternativo alla modalità read_only
+    di openpyxl: ogni foglio è letto con iterparse in un solo passaggio, che
+    restituisce i valori delle celle (con le stesse conversioni di openpyxl
+    in data_only) e raccoglie gli intervalli uniti (<mergeCell>), che
+    openpyxl in read_only non espone.
+    """
+    
+    def __init__(self, file_path: Path):
+        self.archive = zipfile.ZipFile(file_path)
+        try:
+            self._read_workbook()
+        except Exception:
+            self.archive.close()
+            raise
+    
+    def close(self):
+        self.archive.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    @property
+    def sheetnames(self) -> List[str]:
+        return list(self._sheet_paths)
+    
+    def sheet(self, name: str) -> "XlsxSheet":
+        return XlsxSheet(self, self._sheet_paths[name])
+    
+    def _read_workbook(self):
+        workbook_path = "xl/workbook.xml"
+        package_rels = self._read_rels("_rels/.rels", "")
+        for rel_type, target in package_rels.values():
+            if rel_type.endswith("/officeDocument"):
+                workbook_path = target
+        
+        base = posixpath.dirname(workbook_path)
+        rels = self._read_rels(posixpath.join(base, "_rels", posixpath.basename(workbook_path) + ".rels"), base)
+        root = parse(self.archive.open(workbook_path)).getroot()
+        
+        self.epoch = CALENDAR_WINDOWS_1900
+        self._sheet_paths: Dict[str, str] = {}
+        for element in root.iter():
+            tag = _local(element.tag)
+            if tag == "workbookPr" and element.get("date1904") in ("1", "true"):
+                self.epoch = CALENDAR_MAC_1904
+            elif tag == "sheet":
+                rel = rels.get(_rel_id(element))
+                # Solo i fogli di lavoro (non i chartsheet)
+                if rel and rel[0].endswith("/worksheet"):
+                    self._sheet_paths[element.get("name")] = rel[1]
+        
+        shared_strings_path = styles_path = None
+        for rel_type, target in rels.values():
+            if rel_type.endswith("/sharedStrings"):
+                shared_strings_path = target
+            elif rel_type.endswith("/styles"):
+                styles_path = target
+        
+        self.shared_strings = self._read_shared_strings(shared_strings_path)
+        self.date_styles, self.timedelta_styles = self._read_date_styles(styles_path)
+    
+    def _read_rels(self, path: str, base: str) -> Dict[str, Tuple[str, str]]:
+        """Relazioni {id: (tipo, percorso nell'archivio)}."""
+        if path not in self.archive.NameToInfo:
+            return {}
+        rels = {}
+        for element in parse(self.archive.open(path)).getroot():
+            if element.tag != f"{{{PACKAGE_RELS_NS}}}Relationship" or element.get("TargetMode") == "External":
+                continue
+            target = element.get("Target")
+            if target.startswith("/"):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join(base, target))
+            rels[element.get("Id")] = (element.get("Type"), target)
+        return rels
+    
+    def _read_shared_strings(self, path: Optional[str]) -> List[str]:
+        strings = []
+        if not path or path not in self.archive.NameToInfo:
+            return strings
+        for _, element in iterparse(self.archive.open(path)):
+            if _local(element.tag) == "si":
+                strings.append(_string_content(element).replace("x005F_", ""))
+                element.clear()
+        return strings
+    
+    def _read_date_styles(self, path: Optional[str]) -> Tuple[Set[int], Set[int]]:
+        """Indici degli stili di cella (cellXfs) con formato data e durata."""
+        date_styles, timedelta_styles = set(), set()
+        if not path or path not in self.archive.NameToInfo:
+            return date_styles, timedelta_styles
+        
+        root = parse(self.archive.open(path)).getroot()
+        custom = {}
+        for element in root.iter():
+            if _local(element.tag) == "numFmt":
+                custom[int(element.get("numFmtId"))] = element.get("formatCode")
+        
+        for element in root:
+            if _local(element.tag) != "cellXfs":
+                continue
+            for idx, xf in enumerate(element):
+                fmt_id = int(xf.get("numFmtId", 0))
+                fmt = custom.get(fmt_id) or BUILTIN_FORMATS.get(fmt_id)
+                if fmt and is_date_format(fmt):
+                    date_styles.add(idx)
+                if fmt and is_timedelta_format(fmt):
+                    timedelta_styles.add(idx)
+        return date_styles, timedelta_styles
+
+class XlsxSheet:
+    """
+    Un foglio del workbook. Le dimensioni dichiarate (<dimension>) sono lette
+    all'apertura; gli intervalli uniti, che nell'XML seguono i dati, sono
+    disponibili in `merged_ranges` dopo aver consumato `iter_cells`.
+    """
+    
+    def __init__(self, reader: XlsxReader, path: str):
+        self.reader = reader
+        self.merged_ranges: List[MergedRange] = []
+        self.max_row = 0
+        self.max_col = 0
+        self._events = iterparse(reader.archive.open(path), events=("start", "end"))
+        self._sheet_data = None
+        
+        # Avanza fino all'inizio di <sheetData>, leggendo <dimension>
+        for event, element in self._events:
+            tag = _local(element.tag)
+            if event == "start" and tag == "sheetData":
+                self._sheet_data = element
+                break
+            if event == "end" and tag == "dimension":
+                self._read_dimension(element.get("ref"))
+    
+    def _read_dimension(self, ref: Optional[str]):
+        try:
+            _, _, max_col, max_row = range_boundaries(ref)
+        except (TypeError, ValueError):
+            return
+        self.max_row = max_row or 0
+        self.max_col = max_col or 0
+    
+    def iter_cells(self) -> Iterator[Tuple[int, int, Any]]:
+        """
+        Genera (row, col, valore) delle celle con un valore, in ordine di riga.
+        I valori sono quelli di openpyxl in data_only: str, int, float, bool,
+        datetime/timedelta per gli stili data, stringa per gli errori.
+        Ogni riga è scartata dall'albero XML appena letta.
+        """
+        
+        reader = self.reader
+        shared_strings = reader.shared_strings
+        date_styles = reader.date_styles
+        timedelta_styles = reader.timedelta_styles
+        epoch = reader.epoch
+        column_cache: Dict[str, int] = {}
+        
+        seen_row = seen_col = 0
+        row_idx = 0
+        
+        if self._sheet_data is not None:
+            for event, element in self._events:
+                if event != "end":
+                    continue
+                tag = _local(element.tag)
+                if tag == "row":
+                    row_ref = element.get("r")
+                    row_idx = int(row_ref) if row_ref else row_idx + 1
+                    col_idx = 0
+                    for cell in element:
+                        if _local(cell.tag) != "c":
+                            continue
+                        ref = cell.get("r")
+                        if ref:
+                            letters = ref.rstrip("0123456789")
+                            col_idx = column_cache.get(letters)
+                            if col_idx is None:
+                                col_idx = column_cache[letters] = column_index_from_string(letters)
+                        else:
+                            col_idx += 1
+                        
+                        data_type = cell.get("t", "n")
+                        value = None
+                        if data_type == "inlineStr":
+                            for child in cell:
+                                if _local(child.tag) == "is":
+                                    value = _string_content(child)
+                        else:
+                            for child in cell:
+                                if _local(child.tag) == "v":
+                                    value = child.text or None
+                            if value is None:
+                                continue
+                            if data_type == "n":
+                                value = float(value) if ("." in value or "E" in value or "e" in value) else int(value)
+                                style = int(cell.get("s", 0))
+                                if style in date_styles:
+                                    try:
+                                        value = from_excel(value, epoch, timedelta=style in timedelta_styles)
+                                    except (OverflowError, ValueError):
+                                        value = "#VALUE!"
+                            elif data_type == "s":
+                                value = shared_strings[int(value)]
+                            elif data_type == "b":
+                                value = bool(int(value))
+                            elif data_type == "d":
+                                value = from_ISO8601(value)
+                        
+                        if value is None:
+                            continue
+                        if col_idx > seen_col:
+                            seen_col = col_idx
+                        seen_row = row_idx
+                        yield row_idx, col_idx, value
+                    
+                    element.clear()
+                    # Le righe già lette non restano figlie di <sheetData>
+                    self._sheet_data.clear()
+                elif tag == "sheetData":
+                    break
+        
+        # Dopo i dati: intervalli uniti
+        for event, element in self._events:
+            if event == "end" and _local(element.tag) == "mergeCell":
+                try:
+                    col_start, row_start, col_end, row_end = range_boundaries(element.get("ref"))
+                except (TypeError, ValueError):
+                    continue
+                self.merged_ranges.append((row_start, col_start, row_end, col_end))
+        
+        # Senza <dimension> valgono le celle effettivamente lette
+        self.max_row = max(self.max_row, seen_row)
+        self.max_col = max(self.max_col, seen_col)
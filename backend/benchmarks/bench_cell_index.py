@@ -0,0 +1,130 @@
+"""
+Benchmark delle query per intervallo sulla tabella `cells`.
+
+Confronta il vecchio schema (dataset_id + sheet_name su ogni riga, id
+autoincrement, indici separati su dataset_id, sheet_name e (row, col)) con
+lo schema attuale (chiave primaria (sheet_id, row, col), WITHOUT ROWID).
+
+Uso:
+    python benchmarks/bench_cell_index.py --rows 200000 --cols 10 --sheets 3
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+import uuid
+
+LEGACY_DDL = [
+    "CREATE TABLE cells (id INTEGER PRIMARY KEY AUTOINCREMENT, dataset_id VARCHAR NOT NULL, "
+    "sheet_name VARCHAR NOT NULL, row INTEGER NOT NULL, col INTEGER NOT NULL, value_text VARCHAR(2000) NOT NULL)",
+    "CREATE INDEX ix_cell_dataset ON cells (dataset_id)",
+    "CREATE INDEX ix_cell_sheet ON cells (sheet_name)",
+    "CREATE INDEX ix_cell_position ON cells (row, col)",
+]
+
+LEGACY_QUERY = (
+    "SELECT row, col, value_text FROM cells WHERE dataset_id = ? AND sheet_name = ? "
+    "AND row >= ? AND row <= ? AND col >= ? AND col <= ?"
+)
+
+CURRENT_DDL = [
+    "CREATE TABLE cells (sheet_id INTEGER NOT NULL, row INTEGER NOT NULL, col INTEGER NOT NULL, "
+    "value_text VARCHAR(2000) NOT NULL, PRIMARY KEY (sheet_id, row, col)) WITHOUT ROWID",
+]
+
+CURRENT_QUERY = (
+    "SELECT row, col, value_text FROM cells WHERE sheet_id = ? "
+    "AND row >= ? AND row <= ? AND col >= ? AND col <= ?"
+)
+
+
+def build_legacy(path, sheets, rows, cols):
+    conn = sqlite3.connect(path)
+    for statement in LEGACY_DDL:
+        conn.execute(statement)
+    keys = []
+    for sheet_idx in range(sheets):
+        dataset_id = str(uuid.uuid4())
+        sheet_name = f"Sheet{sheet_idx + 1}"
+        keys.append((dataset_id, sheet_name))
+        conn.executemany(
+            "INSERT INTO cells (dataset_id, sheet_name, row, col, value_text) VALUES (?, ?, ?, ?, ?)",
+            ((dataset_id, sheet_name, r, c, f"v{r}_{c}") for r in range(1, rows + 1) for c in range(1, cols + 1))
+        )
+    conn.commit()
+    return conn, keys
+
+
+def build_current(path, sheets, rows, cols):
+    conn = sqlite3.connect(path)
+    for statement in CURRENT_DDL:
+        conn.execute(statement)
+    keys = []
+    for sheet_id in range(1, sheets + 1):
+        keys.append((sheet_id,))
+        conn.executemany(
+            "INSERT INTO cells (sheet_id, row, col, value_text) VALUES (?, ?, ?, ?)",
+            ((sheet_id, r, c, f"v{r}_{c}") for r in range(1, rows + 1) for c in range(1, cols + 1))
+        )
+    conn.commit()
+    return conn, keys
+
+
+def run_queries(conn, query, keys, rows, cols, n_queries, window_rows, window_cols, seed):
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(n_queries):
+        key = rng.choice(keys)
+        row_start = rng.randint(1, max(1, rows - window_rows))
+        col_start = rng.randint(1, max(1, cols - window_cols))
+        params = key + (row_start, row_start + window_rows - 1, col_start, col_start + window_cols - 1)
+        start = time.perf_counter()
+        conn.execute(query, params).fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(label, latencies, db_path, n_cells):
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    size = os.path.getsize(db_path)
+    print(
+        f"{label:8s}  p50 {statistics.median(latencies):8.3f} ms  p99 {p99:8.3f} ms  "
+        f"db {size / 1024 / 1024:8.1f} MB  ({size / n_cells:.1f} byte/cella)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sheets", type=int, default=3)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--window-rows", type=int, default=50)
+    parser.add_argument("--window-cols", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    n_cells = args.sheets * args.rows * args.cols
+    print(f"{args.sheets} fogli x {args.rows} righe x {args.cols} colonne = {n_cells} celle")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, build, query in (
+            ("legacy", build_legacy, LEGACY_QUERY),
+            ("current", build_current, CURRENT_QUERY),
+        ):
+            db_path = os.path.join(tmp, f"{label}.db")
+            conn, keys = build(db_path, args.sheets, args.rows, args.cols)
+            latencies = run_queries(
+                conn, query, keys, args.rows, args.cols,
+                args.queries, args.window_rows, args.window_cols, args.seed
+            )
+            conn.close()
+            report(label, latencies, db_path, n_cells)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Benchmark di carico sulle preview con client concorrenti.
+
+Confronta gli handler attuali (sincroni, eseguiti nel threadpool con sessioni
+di sola lettura) con handler `async def` che eseguono le stesse query
+direttamente nell'event loop, come prima dello spostamento nel threadpool.
+Oltre a throughput e latenze delle preview misura la latenza di /health
+durante il carico: con query nell'event loop anche le richieste banali
+attendono la fine di ogni query.
+
+Il server gira in un processo separato (uvicorn, un worker) per non
+condividere il GIL con i client. La cache delle preview è disabilitata per
+misurare l'accesso al database.
+
+Uso:
+    python benchmarks/bench_concurrent_preview.py --rows 50000 --cols 10 --clients 1 8 32 --requests 400
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+import uvicorn
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(BACKEND_DIR / "benchmarks"))
+
+from workbook_gen import generate_multi_sheet_workbook  # noqa: E402
+
+WINDOW_ROWS = 50
+WINDOW_COLS = 10
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def prepare_dataset(tmp: Path, rows: int, cols: int) -> str:
+    """Crea il database (nella directory corrente) e vi carica un workbook di un foglio."""
+    from app import crud, models
+    from app.database import Base, SessionLocal, engine
+    
+    Path("storage/uploads").mkdir(parents=True, exist_ok=True)
+    Base.metadata.create_all(bind=engine)
+    
+    file_path = generate_multi_sheet_workbook(tmp / "bench.xlsx", 1, rows, cols)
+    db = SessionLocal()
+    try:
+        dataset = models.Dataset(
+            id=str(uuid.uuid4()), filename=file_path.name, sha256="bench",
+            file_path=str(file_path), file_size=file_path.stat().st_size
+        )
+        db.add(dataset)
+        db.commit()
+        crud.process_excel_file(db, dataset.id, file_path)
+        return dataset.id
+    finally:
+        db.close()
+
+
+def add_blocking_routes(app):
+    """Endpoint equivalenti alle preview con le query eseguite nell'event loop."""
+    from fastapi import Depends
+    from sqlalchemy.orm import Session
+    
+    from app import crud
+    from app.database import get_read_db
+    
+    @app.get("/bench/blocking/{dataset_id}/{sheet_name}/preview")
+    async def blocking_preview(
+        dataset_id: str, sheet_name: str, row_start: int, row_end: int,
+        col_start: int, col_end: int, db: Session = Depends(get_read_db)
+    ):
+        crud.get_sheet(db, dataset_id, sheet_name)
+        return crud.get_grid_preview(db, dataset_id, sheet_name, row_start, row_end, col_start, col_end)
+
+
+async def run_load(base_url: str, path: str, rows: int, cols: int, clients: int, n_requests: int):
+    """Esegue `n_requests` preview di finestre casuali con `clients` client concorrenti."""
+    rng = random.Random(0)
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(n_requests):
+        row_start = rng.randint(1, max(1, rows - WINDOW_ROWS))
+        col_start = rng.randint(1, max(1, cols - WINDOW_COLS + 1))
+        queue.put_nowait({
+            "row_start": row_start, "row_end": row_start + WINDOW_ROWS - 1,
+            "col_start": col_start, "col_end": col_start + WINDOW_COLS - 1,
+        })
+    
+    latencies = []
+    health = []
+    done = asyncio.Event()
+    
+    limits = httpx.Limits(max_connections=clients + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        async def worker():
+            while not queue.empty():
+                params = queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.get(path, params=params)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+        
+        async def probe():
+            # Latenza di una richiesta senza database durante il carico
+            while not done.is_set():
+                start = time.perf_counter()
+                (await client.get("/health")).raise_for_status()
+                health.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+        
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+    
+    return elapsed, latencies, health
+
+
+def serve(port: int):
+    """Processo server: applicazione con in più gli endpoint bloccanti."""
+    from app.main import app
+    
+    add_blocking_routes(app)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def wait_until_ready(base_url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            httpx.get(f"{base_url}/health").raise_for_status()
+            return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.serve:
+        serve(args.serve)
+        return
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        # L'applicazione usa percorsi relativi (storage/...) e legge la
+        # configurazione all'import: entrambi vanno impostati prima
+        os.chdir(tmp)
+        os.environ["PREVIEW_CACHE_SIZE"] = "0"
+        dataset_id = prepare_dataset(tmp, args.rows, args.cols)
+        
+        port = free_port()
+        server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(port)])
+        base_url = f"http://127.0.0.1:{port}"
+        wait_until_ready(base_url)
+        
+        variants = {
+            "event loop": f"/bench/blocking/{dataset_id}/Foglio1/preview",
+            "threadpool": f"/api/datasets/{dataset_id}/sheets/Foglio1/preview",
+        }
+        print(f"{args.rows} righe x {args.cols} colonne, finestre {WINDOW_ROWS}x{WINDOW_COLS}, "
+              f"{args.requests} richieste")
+        try:
+            for clients in args.clients:
+                for name, path in variants.items():
+                    elapsed, latencies, health = asyncio.run(
+                        run_load(base_url, path, args.rows, args.cols, clients, args.requests)
+                    )
+                    print(f"client {clients:3d}  {name:10s}  {len(latencies) / elapsed:8.1f} req/s  "
+                          f"p50 {percentile(latencies, 0.5) * 1000:7.1f} ms  "
+                          f"p95 {percentile(latencies, 0.95) * 1000:7.1f} ms  "
+                          f"/health p95 {percentile(health, 0.95) * 1000:7.1f} ms "
+                          f"(media {statistics.mean(health) * 1000:.1f} ms)")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark dell'ingestione di workbook multi-foglio con parsing sequenziale
+e con parsing parallelo per foglio (pool di processi).
+
+Uso:
+    python benchmarks/bench_parallel_sheets.py --sheets 20 --rows 5000 --cols 10 --workers 1 4 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import crud, models  # noqa: E402
+from app.database import Base, set_sqlite_pragma  # noqa: E402
+from workbook_gen import generate_multi_sheet_workbook  # noqa: E402
+
+
+def ingest(file_path: Path, db_path: Path, workers: int) -> float:
+    engine = create_engine(f"sqlite:///{db_path}")
+    event.listen(engine, "connect", set_sqlite_pragma)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        dataset = models.Dataset(
+            id=str(uuid.uuid4()), filename=file_path.name, sha256="bench",
+            file_path=str(file_path), file_size=file_path.stat().st_size
+        )
+        db.add(dataset)
+        db.commit()
+        
+        start = time.perf_counter()
+        crud.process_excel_file(db, dataset.id, file_path, workers=workers)
+        return time.perf_counter() - start
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sheets", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    
+    n_cells = args.sheets * (args.rows + 1) * args.cols
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        file_path = generate_multi_sheet_workbook(tmp / "bench.xlsx", args.sheets, args.rows, args.cols)
+        print(f"{args.sheets} fogli x {args.rows} righe x {args.cols} colonne = {n_cells} celle, "
+              f"{file_path.stat().st_size / 1024 / 1024:.1f} MB")
+        
+        baseline = None
+        for workers in args.workers:
+            elapsed = ingest(file_path, tmp / f"bench_{workers}.db", workers)
+            baseline = baseline or elapsed
+            print(f"workers {workers:2d}  {elapsed:7.2f} s  {n_cells / elapsed:10.0f} celle/s  "
+                  f"speedup {baseline / elapsed:4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
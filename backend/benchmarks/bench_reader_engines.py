@@ -0,0 +1,63 @@
+"""
+Benchmark degli engine di lettura dei workbook (readers.py): tempo per
+leggere tutte le celle di workbook sintetici di dimensioni crescenti, con
+la stessa conversione in (testo, tipo, valore) dell'ingestione.
+Il rapporto è rispetto al primo engine (openpyxl). Gli engine non
+installati (calamine) sono saltati.
+
+Uso:
+    python benchmarks/bench_reader_engines.py --cells 10000 100000 1000000 --cols 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.crud import iter_sheet_cells  # noqa: E402
+from app.readers import ENGINE_CALAMINE, ENGINE_OPENPYXL, ENGINE_STREAM, READER_ENGINES, engine_available, open_workbook  # noqa: E402
+from workbook_gen import generate_multi_sheet_workbook  # noqa: E402
+
+
+def read_all(file_path: Path, engine: str) -> int:
+    count = 0
+    with open_workbook(file_path, engine) as reader:
+        for name in reader.sheetnames:
+            for _ in iter_sheet_cells(reader.sheet(name)):
+                count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cells", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--engines", nargs="+", choices=READER_ENGINES,
+                        default=[ENGINE_OPENPYXL, ENGINE_STREAM, ENGINE_CALAMINE])
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_cells in args.cells:
+            rows = max(1, n_cells // args.cols - 1)
+            file_path = generate_multi_sheet_workbook(Path(tmp) / f"bench_{n_cells}.xlsx", 1, rows, args.cols)
+            print(f"{n_cells} celle ({rows + 1} righe x {args.cols} colonne, "
+                  f"{file_path.stat().st_size / 1024 / 1024:.1f} MB)")
+            
+            baseline = None
+            for engine in args.engines:
+                if not engine_available(engine):
+                    print(f"  {engine:10s}  non installato")
+                    continue
+                start = time.perf_counter()
+                count = read_all(file_path, engine)
+                elapsed = time.perf_counter() - start
+                baseline = baseline or elapsed
+                print(f"  {engine:10s}  {elapsed:6.2f} s  {count / elapsed:10.0f} celle/s  "
+                      f"x{baseline / elapsed:.1f}")
+
+
+if __name__ == "__main__":
+    main()
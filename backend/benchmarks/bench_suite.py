@@ -0,0 +1,230 @@
+"""
+Suite di benchmark end-to-end dell'ingestione e delle preview su workbook
+sintetici realistici (vedi workbook_gen.py). Per ogni scenario misura:
+
+- upload_to_ready_s: dall'upload via API al job completato
+- cells_per_sec: celle lette e inserite al secondo durante l'ingestione (dal job)
+- analyze_s: analisi della struttura (analyze_sheet_structure) su tutte
+  le celle dei fogli, rilette dal database
+- preview_p50_ms / preview_p99_ms: latenza delle preview (griglia e tabella)
+  su finestre casuali, con la cache delle preview disabilitata
+- bytes_per_cell: crescita del database (e dello storage su file) per cella
+
+I risultati possono essere salvati come baseline (JSON) e confrontati con
+una baseline precedente: una metrica peggiorata oltre la tolleranza è una
+regressione e lo script termina con codice 1.
+
+Uso:
+    python benchmarks/bench_suite.py --scenarios small
+    python benchmarks/bench_suite.py --save-baseline benchmarks/baselines/main.json
+    python benchmarks/bench_suite.py --compare benchmarks/baselines/main.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(BACKEND_DIR / "benchmarks"))
+
+from workbook_gen import (  # noqa: E402
+    generate_multi_sheet_workbook, generate_report_workbook, generate_wide_sparse_workbook
+)
+
+# Scenari: generatore del workbook (il seed cambia a ogni ripetizione, così
+# l'upload non è deduplicato per SHA256)
+SCENARIOS = {
+    # ~60k celle: veloce, adatto a ogni modifica
+    "small": lambda path, seed: generate_report_workbook(path, sheets=2, rows=2500, cols=12, seed=seed),
+    # ~1.2M celle su 40 fogli con blocchi di titolo e intestazioni unite
+    "many_sheets": lambda path, seed: generate_report_workbook(path, sheets=40, rows=2500, cols=12, seed=seed),
+    # 3000 x 400 con il 3% di celle piene (~36k celle su 1.2M di bounding box)
+    "wide_sparse": lambda path, seed: generate_wide_sparse_workbook(path, rows=3000, cols=400, density=0.03, seed=seed),
+    # ~1.2M celle in un solo foglio denso
+    "large": lambda path, seed: generate_multi_sheet_workbook(path, sheets=1, rows=120_000, cols=10, seed=seed),
+}
+
+# Metriche confrontate con la baseline: True se più alto è meglio
+METRICS = {
+    "upload_to_ready_s": False,
+    "cells_per_sec": True,
+    "analyze_s": False,
+    "preview_p50_ms": False,
+    "preview_p99_ms": False,
+    "bytes_per_cell": False,
+}
+
+PREVIEW_WINDOW_ROWS = 50
+PREVIEW_WINDOW_COLS = 20
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def storage_size(engine) -> int:
+    """Dimensione del database (dopo il checkpoint del WAL su SQLite) più lo storage su file."""
+    from sqlalchemy import text
+    
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            size = conn.execute(text("SELECT pg_database_size(current_database())")).scalar()
+        else:
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+            size = Path(engine.url.database).stat().st_size
+    
+    uploads = Path("storage/uploads")
+    return size + sum(f.stat().st_size for f in uploads.rglob("*") if f.is_file())
+
+
+def measure_analysis(dataset_id: str) -> float:
+    """Tempo di analyze_sheet_structure su tutte le celle dei fogli del dataset."""
+    from app import crud
+    from app.database import SessionLocal
+    from app.table_detection import analyze_sheet_structure
+    
+    db = SessionLocal()
+    try:
+        elapsed = 0.0
+        for sheet in crud.get_sheets_by_dataset(db, dataset_id):
+            cells = crud.get_cells_in_range(db, sheet, 1, sheet.n_rows, 1, sheet.n_cols)
+            start = time.perf_counter()
+            analyze_sheet_structure(cells)
+            elapsed += time.perf_counter() - start
+        return elapsed
+    finally:
+        db.close()
+
+
+def measure_previews(client, dataset_id: str, n_requests: int, rng: random.Random):
+    """Latenze (s) di preview griglia e tabella su finestre casuali dei fogli."""
+    sheets = client.get(f"/api/datasets/{dataset_id}").json()["sheets"]
+    latencies = []
+    for i in range(n_requests):
+        sheet = rng.choice(sheets)
+        row_start = rng.randint(1, max(1, sheet["n_rows"] - PREVIEW_WINDOW_ROWS))
+        col_start = rng.randint(1, max(1, sheet["n_cols"] - PREVIEW_WINDOW_COLS))
+        if i % 2:
+            params = {"mode": "table"}
+        else:
+            params = {
+                "mode": "grid",
+                "row_start": row_start, "row_end": row_start + PREVIEW_WINDOW_ROWS - 1,
+                "col_start": col_start, "col_end": col_start + PREVIEW_WINDOW_COLS - 1,
+            }
+        start = time.perf_counter()
+        response = client.get(f"/api/datasets/{dataset_id}/sheets/{sheet['sheet_name']}/preview", params=params)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return latencies
+
+
+def run_scenario(client, name: str, tmp: Path, n_previews: int, seed: int) -> dict:
+    from app.database import engine
+    
+    file_path = SCENARIOS[name](tmp / f"{name}_{seed}.xlsx", seed)
+    size_before = storage_size(engine)
+    
+    start = time.perf_counter()
+    with open(file_path, "rb") as f:
+        response = client.post("/api/datasets", files={"file": (file_path.name, f, "application/octet-stream")})
+    response.raise_for_status()
+    data = response.json()
+    while True:
+        job = client.get(f"/api/jobs/{data['job_id']}").json()
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.05)
+    upload_to_ready = time.perf_counter() - start
+    if job["status"] != "done":
+        raise RuntimeError(f"Scenario {name}: ingestione fallita ({job['error']})")
+    
+    cells = job["cells_loaded"]
+    latencies = measure_previews(client, data["id"], n_previews, random.Random(seed))
+    return {
+        "cells": cells,
+        "sheets": job["sheets_total"],
+        "file_mb": round(file_path.stat().st_size / 1024 / 1024, 2),
+        "upload_to_ready_s": round(upload_to_ready, 3),
+        "cells_per_sec": job["cells_per_sec"],
+        "analyze_s": round(measure_analysis(data["id"]), 3),
+        "preview_p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "preview_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "bytes_per_cell": round((storage_size(engine) - size_before) / max(cells, 1), 1),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """Stampa il confronto con la baseline; restituisce False se ci sono regressioni."""
+    ok = True
+    for name, metrics in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            print(f"{name}: assente nella baseline")
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = base.get(metric), metrics[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = "REGRESSIONE" if worse > tolerance else ""
+            ok = ok and not flag
+            print(f"{name:12s} {metric:18s} {old:12.2f} -> {new:12.2f}  {change:+7.1%}  {flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=["small", "many_sheets", "wide_sparse", "large"])
+    parser.add_argument("--previews", type=int, default=200, help="preview misurate per scenario")
+    parser.add_argument("--repeat", type=int, default=3, help="ripetizioni per scenario (si tiene la mediana)")
+    parser.add_argument("--save-baseline", type=Path, help="salva i risultati come baseline JSON")
+    parser.add_argument("--compare", type=Path, help="baseline JSON con cui confrontare i risultati")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="peggioramento relativo tollerato (default 15%%)")
+    args = parser.parse_args()
+    
+    save_path = args.save_baseline.resolve() if args.save_baseline else None
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        # L'applicazione usa percorsi relativi (storage/...) e legge la
+        # configurazione all'import: entrambi vanno impostati prima
+        os.chdir(tmp)
+        os.environ["PREVIEW_CACHE_SIZE"] = "0"
+        
+        from fastapi.testclient import TestClient
+        from app.main import app
+        
+        results = {}
+        with TestClient(app) as client:
+            for name in args.scenarios:
+                runs = [run_scenario(client, name, tmp, args.previews, seed) for seed in range(args.repeat)]
+                results[name] = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+                print(f"{name:12s} " + "  ".join(f"{k} {v}" for k, v in results[name].items()), flush=True)
+    
+    if save_path:
+        save_path.parent.mkdir(parents=True, exist_ok=True)
+        save_path.write_text(json.dumps({
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "scenarios": results,
+        }, indent=2))
+        print(f"Baseline salvata in {save_path}")
+    
+    if baseline and not compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
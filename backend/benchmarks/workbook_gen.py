@@ -0,0 +1,111 @@
+"""Generatore di workbook sintetici per i benchmark."""
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+
+def generate_multi_sheet_workbook(path: Path, sheets: int, rows: int, cols: int, seed: int = 42) -> Path:
+    """Workbook con `sheets` fogli, ognuno con un'intestazione e `rows` righe di dati misti."""
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    
+    for sheet_idx in range(sheets):
+        ws = wb.create_sheet(f"Foglio{sheet_idx + 1}")
+        ws.append([f"Colonna {c + 1}" for c in range(cols)])
+        for r in range(rows):
+            ws.append([
+                rng.randint(0, 100_000) if c % 3 == 0
+                else round(rng.random() * 1000, 2) if c % 3 == 1
+                else f"Testo {r}-{c}"
+                for c in range(cols)
+            ])
+    
+    wb.save(path)
+    return Path(path)
+
+
+REGIONS = ["Nord", "Centro", "Sud", "Isole"]
+PRODUCTS = ["Bulloni", "Viti", "Dadi", "Rondelle", "Staffe", "Tasselli"]
+
+
+def generate_report_workbook(
+    path: Path,
+    sheets: int,
+    rows: int,
+    cols: int,
+    empty_ratio: float = 0.05,
+    seed: int = 42
+) -> Path:
+    """
+    Workbook con l'aspetto di un report gestionale: per ogni foglio un blocco
+    di titolo (unito) sopra la tabella, un'intestazione su due righe con
+    gruppi di colonne uniti, `rows` righe di dati misti (testi, interi,
+    importi, date) con una quota `empty_ratio` di celle vuote, una riga di
+    totali e note in fondo.
+    """
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    cols = max(cols, 4)
+    start = datetime(2023, 1, 1)
+    
+    for sheet_idx in range(sheets):
+        ws = wb.create_sheet(f"Report{sheet_idx + 1}")
+        ws.append([f"Report vendite - Filiale {sheet_idx + 1}"])
+        ws.merged_cells.add(f"A1:{get_column_letter(cols)}1")
+        ws.append(["Periodo:", "01/01/2023 - 31/12/2023", None, "Valuta:", "EUR"])
+        ws.append([])
+        
+        # Intestazione su due righe: "Anagrafica" (3 colonne) e gruppi di importi per trimestre
+        group_row = ["Anagrafica", None, None]
+        detail_row = ["Codice", "Regione", "Data"]
+        for c in range(3, cols):
+            quarter = (c - 3) // 4
+            group_row.append(f"Trimestre {quarter + 1}" if (c - 3) % 4 == 0 else None)
+            detail_row.append(f"Importo {c - 2}")
+        ws.append(group_row)
+        ws.append(detail_row)
+        ws.merged_cells.add("A4:C4")
+        for c in range(3, cols, 4):
+            last = min(c + 3, cols - 1)
+            if last > c:
+                ws.merged_cells.add(f"{get_column_letter(c + 1)}4:{get_column_letter(last + 1)}4")
+        
+        for r in range(rows):
+            row = [
+                f"{rng.choice(PRODUCTS)}-{r:06d}",
+                rng.choice(REGIONS),
+                start + timedelta(days=rng.randrange(365)),
+            ]
+            row += [
+                rng.randint(0, 10_000) if c % 2 else round(rng.random() * 5000, 2)
+                for c in range(3, cols)
+            ]
+            ws.append([None if rng.random() < empty_ratio else value for value in row])
+        
+        ws.append(["Totale", None, None] + [round(rng.random() * 1e6, 2) for _ in range(3, cols)])
+        ws.append([])
+        ws.append(["Note: importi al netto di IVA"])
+    
+    wb.save(path)
+    return Path(path)
+
+
+def generate_wide_sparse_workbook(path: Path, rows: int, cols: int, density: float = 0.05, seed: int = 42) -> Path:
+    """
+    Foglio largo e sparso (es. una matrice di pianificazione): etichette nella
+    prima riga e colonna, valori sparsi con densità `density`.
+    """
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Matrice")
+    ws.append(["Articolo"] + [f"Settimana {c}" for c in range(1, cols)])
+    for r in range(rows):
+        ws.append([f"ART{r:05d}"] + [
+            rng.randint(1, 500) if rng.random() < density else None
+            for _ in range(1, cols)
+        ])
+    wb.save(path)
+    return Path(path)
@@ -2,8 +2,10 @@ import pytest
 from fastapi.testclient import TestClient
 from openpyxl import Workbook
 from io import BytesIO
+import hashlib
 import os
 import sys
+import time
 
 # Add app to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -12,9 +14,12 @@ from app.main import app
 
 client = TestClient(app)
 
-def create_test_xlsx():
+def create_test_xlsx(title=None):
     """Crea un file Excel di test in memoria."""
     wb = Workbook()
+    if title:
+        # Cambia i metadati (e quindi lo SHA256) senza toccare le celle
+        wb.properties.title = title
     ws = wb.active
     ws.title = "TestSheet"
     
@@ -43,6 +48,18 @@ def create_test_xlsx():
     
     return xlsx_file
 
+def wait_for_job(job_id, timeout=10):
+    """Attende il completamento di un job di ingestione."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = client.get(f"/api/jobs/{job_id}")
+        assert response.status_code == 200
+        job = response.json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} non completato entro {timeout}s")
+
 def test_health_endpoint():
     """Test health check endpoint."""
     response = client.get("/health")
@@ -52,6 +69,7 @@ def test_health_endpoint():
 def test_upload_xlsx():
     """Test upload di un file Excel."""
     xlsx_file = create_test_xlsx()
+    expected_sha256 = hashlib.sha256(xlsx_file.getvalue()).hexdigest()
     
     response = client.post(
         "/api/datasets",
@@ -63,8 +81,14 @@ def test_upload_xlsx():
     
     assert "id" in data
     assert data["filename"] == "test.xlsx"
-    assert "sha256" in data
-    assert data["sheet_count"] >= 1
+    assert data["sha256"] == expected_sha256
+    assert data["job_id"]
+    
+    job = wait_for_job(data["job_id"])
+    assert job["status"] == "done"
+    assert job["sheets_done"] == job["sheets_total"] == 1
+    assert job["cells_loaded"] == 12
+    assert job["cells_per_sec"] > 0
     
     # Test GET dataset detail
     dataset_id = data["id"]
@@ -73,6 +97,7 @@ def test_upload_xlsx():
     assert response.status_code == 200
     detail = response.json()
     
+    assert detail["dataset"]["sheet_count"] >= 1
     assert "dataset" in detail
     assert "sheets" in detail
     assert len(detail["sheets"]) >= 1
@@ -90,11 +115,632 @@ def test_upload_xlsx():
     assert "data" in preview
     assert len(preview["data"]) > 0
 
+def test_upload_duplicate_reuses_content():
+    """Test deduplicazione: lo stesso file caricato due volte non viene rielaborato."""
+    content = create_test_xlsx(title=f"dup-{time.time()}").getvalue()
+    
+    def upload():
+        response = client.post(
+            "/api/datasets",
+            files={"file": ("dup.xlsx", BytesIO(content), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+        )
+        assert response.status_code == 200
+        return response.json()
+    
+    first = upload()
+    assert wait_for_job(first["job_id"])["status"] == "done"
+    
+    second = upload()
+    assert second["sha256"] == first["sha256"]
+    assert second["sheet_count"] >= 1
+    assert client.get(f"/api/jobs/{second['job_id']}").json()["status"] == "done"
+    
+    first_detail = client.get(f"/api/datasets/{first['id']}").json()
+    second_detail = client.get(f"/api/datasets/{second['id']}").json()
+    assert [s["sheet_name"] for s in second_detail["sheets"]] == [s["sheet_name"] for s in first_detail["sheets"]]
+    
+    sheet_name = second_detail["sheets"][0]["sheet_name"]
+    first_grid = client.get(f"/api/datasets/{first['id']}/sheets/{sheet_name}/preview").json()
+    second_grid = client.get(f"/api/datasets/{second['id']}/sheets/{sheet_name}/preview").json()
+    assert second_grid["data"] == first_grid["data"]
+    
+    # Il contenuto è riusato solo se letto con lo stesso engine (NULL = default)
+    from app import crud, models
+    from app.config import XLSX_READER_ENGINE
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        same = models.Dataset(id="probe", sha256=first["sha256"], reader_engine=XLSX_READER_ENGINE)
+        other = models.Dataset(id="probe", sha256=first["sha256"], reader_engine="calamine" if XLSX_READER_ENGINE != "calamine" else "stream")
+        assert crud.find_processed_duplicate(db, same) is not None
+        assert crud.find_processed_duplicate(db, other) is None
+    finally:
+        db.close()
+    
+    # Il file è condiviso: eliminare un dataset non tocca l'altro
+    assert client.delete(f"/api/datasets/{first['id']}").status_code == 204
+    assert client.get(f"/api/datasets/{first['id']}").status_code == 404
+    assert client.get(f"/api/datasets/{second['id']}").status_code == 200
+    
+    blob_file = crud.blob_path(second["sha256"])
+    assert blob_file.exists()
+    assert client.delete(f"/api/datasets/{second['id']}").status_code == 204
+    assert not blob_file.exists()
+
+def test_upload_with_columnar_cell_store(monkeypatch):
+    """Test ingestione e preview con il backend colonnare."""
+    from app import crud
+    monkeypatch.setattr(crud, "CELL_STORE", "columnar")
+    
+    xlsx_file = create_test_xlsx(title=f"columnar-{time.time()}")
+    response = client.post(
+        "/api/datasets",
+        files={"file": ("columnar.xlsx", xlsx_file, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+    )
+    data = response.json()
+    assert wait_for_job(data["job_id"])["status"] == "done"
+    
+    response = client.get(
+        f"/api/datasets/{data['id']}/sheets/TestSheet/preview",
+        params={"mode": "grid", "row_end": 4, "col_end": 3}
+    )
+    assert response.json()["data"] == [
+        ["Nome", "Età", "Città"],
+        ["Mario", "30", "Roma"],
+        ["Laura", "25", "Milano"],
+        ["Giuseppe", "35", "Napoli"],
+    ]
+    
+    response = client.get(
+        f"/api/datasets/{data['id']}/sheets/TestSheet/preview",
+        params={"mode": "table"}
+    )
+    assert response.json()["headers"] == ["Nome", "Età", "Città"]
+    
+    assert client.delete(f"/api/datasets/{data['id']}").status_code == 204
+    assert not (crud.UPLOAD_DIR / data["id"]).exists()
+
+def test_upload_with_parallel_sheet_workers(monkeypatch):
+    """Test parsing dei fogli in un pool di processi: stesso risultato del percorso sequenziale."""
+    from app import crud
+    monkeypatch.setattr(crud, "SHEET_WORKERS", 2)
+    
+    wb = Workbook()
+    wb.properties.title = f"parallel-{time.time()}"
+    for idx in range(3):
+        ws = wb.active if idx == 0 else wb.create_sheet()
+        ws.title = f"Foglio{idx + 1}"
+        ws.append(["Codice", "Valore"])
+        for r in range(5):
+            ws.append([f"F{idx}-R{r}", r * (idx + 1)])
+    xlsx_file = BytesIO()
+    wb.save(xlsx_file)
+    xlsx_file.seek(0)
+    
+    response = client.post(
+        "/api/datasets",
+        files={"file": ("parallel.xlsx", xlsx_file, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+    )
+    data = response.json()
+    job = wait_for_job(data["job_id"], timeout=60)
+    assert job["status"] == "done"
+    assert job["sheets_total"] == 3
+    
+    detail = client.get(f"/api/datasets/{data['id']}").json()
+    assert [s["sheet_name"] for s in detail["sheets"]] == ["Foglio1", "Foglio2", "Foglio3"]
+    
+    response = client.get(
+        f"/api/datasets/{data['id']}/sheets/Foglio3/preview",
+        params={"mode": "grid", "row_end": 3, "col_end": 2}
+    )
+    assert response.json()["data"] == [["Codice", "Valore"], ["F2-R0", "0"], ["F2-R1", "3"]]
+
+def test_concurrent_ingestions_wait_for_write_lock(monkeypatch):
+    """Due job in parallelo: il secondo attende il lock di scrittura del foglio in corso."""
+    import threading
+    from app import crud
+    
+    # Entrambi i job creano il foglio insieme; il primo tiene la transazione
+    # oltre i 5 secondi di attesa predefiniti del driver SQLite
+    both_parsing = threading.Barrier(2, timeout=30)
+    first_index = threading.Lock()
+    create_sheet = crud.create_sheet
+    index_sheet_for_search = crud.index_sheet_for_search
+    
+    def synced_create_sheet(*args, **kwargs):
+        both_parsing.wait()
+        return create_sheet(*args, **kwargs)
+    
+    def slow_index_sheet_for_search(db, sheet):
+        index_sheet_for_search(db, sheet)
+        if first_index.acquire(blocking=False):
+            time.sleep(6)
+    
+    monkeypatch.setattr(crud, "create_sheet", synced_create_sheet)
+    monkeypatch.setattr(crud, "index_sheet_for_search", slow_index_sheet_for_search)
+    
+    uploads = []
+    for idx in range(2):
+        response = client.post(
+            "/api/datasets",
+            files={"file": (f"concurrent{idx}.xlsx", create_test_xlsx(title=f"concurrent-{idx}-{time.time()}"), "application/octet-stream")}
+        )
+        uploads.append(response.json())
+    
+    for data in uploads:
+        job = wait_for_job(data["job_id"], timeout=60)
+        assert job["status"] == "done", job["error"]
+        assert client.get(f"/api/datasets/{data['id']}").json()["sheets"][0]["n_rows"] == 4
+    
+    for data in uploads:
+        client.delete(f"/api/datasets/{data['id']}")
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_ingestion_progress_outside_sheet_transaction(workers):
+    """Lo stato del job è salvato solo tra un foglio e l'altro: ogni foglio è un'unica transazione."""
+    from pathlib import Path
+    from app import crud
+    from app.database import SessionLocal
+    
+    wb = Workbook()
+    wb.properties.title = f"progress-{time.time()}"
+    for idx in range(2):
+        ws = wb.active if idx == 0 else wb.create_sheet()
+        ws.title = f"Foglio{idx + 1}"
+        ws.append(["Codice", "Valore"])
+        ws.append([f"F{idx}", idx])
+    xlsx_file = BytesIO()
+    wb.save(xlsx_file)
+    xlsx_file.seek(0)
+    
+    response = client.post("/api/datasets", files={"file": ("progress.xlsx", xlsx_file, "application/octet-stream")})
+    data = response.json()
+    assert wait_for_job(data["job_id"], timeout=60)["status"] == "done"
+    
+    calls = []
+    db = SessionLocal()
+    try:
+        crud.clear_dataset_content(db, data["id"])
+        dataset = crud.get_dataset(db, data["id"])
+        file_path = Path(dataset.file_path)
+        db.commit()
+        
+        def progress(status, sheet_name, sheets_done, sheets_total):
+            calls.append((status, sheet_name, db.in_transaction()))
+        
+        crud.process_excel_file(db, data["id"], file_path, progress=progress, workers=workers)
+        sheets = crud.get_sheets_by_dataset(db, data["id"])
+        assert all(sheet.analysis_json and sheet.detector_version for sheet in sheets)
+    finally:
+        db.close()
+    
+    assert calls == [
+        ("parsing", "Foglio1", False), ("analyzing", "Foglio1", False),
+        ("parsing", "Foglio2", False), ("analyzing", "Foglio2", False),
+    ]
+    client.delete(f"/api/datasets/{data['id']}")
+
+def test_ingestion_failure_closes_reader(monkeypatch, tmp_path):
+    """Il workbook è chiuso anche quando l'ingestione di un foglio fallisce."""
+    from app import crud
+    
+    readers = []
+    open_workbook = crud.open_workbook
+    
+    def tracked_open_workbook(*args, **kwargs):
+        reader = open_workbook(*args, **kwargs)
+        close = reader.close
+        reader.closed = False
+        
+        def tracked_close():
+            reader.closed = True
+            close()
+        
+        reader.close = tracked_close
+        readers.append(reader)
+        return reader
+    
+    def failing_create_sheet(*args, **kwargs):
+        raise RuntimeError("scrittura fallita")
+    
+    monkeypatch.setattr(crud, "open_workbook", tracked_open_workbook)
+    monkeypatch.setattr(crud, "create_sheet", failing_create_sheet)
+    
+    file_path = tmp_path / "fail.xlsx"
+    file_path.write_bytes(create_test_xlsx().getvalue())
+    with pytest.raises(RuntimeError):
+        crud.process_excel_file(None, "missing", file_path, workers=1)
+    assert [reader.closed for reader in readers] == [True]
+
+@pytest.mark.parametrize("engine", ["openpyxl", "calamine"])
+def test_upload_with_reader_engine(engine):
+    """Engine di lettura scelto per upload: stesso contenuto del lettore di default."""
+    from app import readers
+    if not readers.engine_available(engine):
+        pytest.skip(f"engine {engine} non installato")
+    
+    xlsx_file = create_test_xlsx(title=f"engine-{engine}-{time.time_ns()}")
+    response = client.post(
+        "/api/datasets",
+        params={"engine": engine},
+        files={"file": ("engine.xlsx", xlsx_file, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["reader_engine"] == engine
+    assert wait_for_job(data["job_id"])["status"] == "done"
+    
+    response = client.get(
+        f"/api/datasets/{data['id']}/sheets/TestSheet/preview",
+        params={"mode": "grid", "row_end": 2, "col_end": 3}
+    )
+    assert response.json()["data"] == [["Nome", "Età", "Città"], ["Mario", "30", "Roma"]]
+    
+    client.delete(f"/api/datasets/{data['id']}")
+
+def test_upload_rejects_unknown_reader_engine():
+    response = client.post(
+        "/api/datasets",
+        params={"engine": "xlrd"},
+        files={"file": ("engine.xlsx", create_test_xlsx(), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+    )
+    assert response.status_code == 400
+
+def test_preview_cache_hits_and_invalidation():
+    """Le preview ripetute sono servite dalla cache e invalidate all'eliminazione del dataset."""
+    xlsx_file = create_test_xlsx(title=f"cache-{time.time()}")
+    response = client.post(
+        "/api/datasets",
+        files={"file": ("cache.xlsx", xlsx_file, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+    )
+    data = response.json()
+    assert wait_for_job(data["job_id"])["status"] == "done"
+    
+    url = f"/api/datasets/{data['id']}/sheets/TestSheet/preview"
+    before = client.get("/api/cache/stats").json()["preview"]
+    
+    first = client.get(url, params={"mode": "table"}).json()
+    second = client.get(url, params={"mode": "table"}).json()
+    assert first == second
+    
+    after = client.get("/api/cache/stats").json()["preview"]
+    assert after["misses"] == before["misses"] + 1
+    assert after["hits"] == before["hits"] + 1
+    
+    from app.cache import preview_cache
+    assert client.delete(f"/api/datasets/{data['id']}").status_code == 204
+    assert preview_cache.get((data["id"], "TestSheet", "table", 0, False)) is None
+
+def upload_and_wait(name):
+    xlsx_file = create_test_xlsx(title=f"{name}-{time.time_ns()}")
+    response = client.post(
+        "/api/datasets",
+        files={"file": (f"{name}.xlsx", xlsx_file, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert wait_for_job(data["job_id"])["status"] == "done"
+    return data
+
+def test_merged_header_rows_in_table_preview():
+    """Intervalli uniti salvati per foglio e intestazione su due righe nella preview."""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Report"
+    wb.properties.title = f"merged-{time.time_ns()}"
+    ws["A1"] = "Cliente"
+    ws.merge_cells("A1:A2")
+    ws["B1"] = "Vendite 2023"
+    ws.merge_cells("B1:D1")
+    ws.append([None, "Q1", "Q2", "Q3"])
+    for i in range(10):
+        ws.append([f"Cliente {i}", i, i * 2, i * 3])
+    output = BytesIO()
+    wb.save(output)
+    output.seek(0)
+    
+    response = client.post(
+        "/api/datasets",
+        files={"file": ("merged.xlsx", output, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+    )
+    data = response.json()
+    assert wait_for_job(data["job_id"])["status"] == "done"
+    
+    sheet = client.get(f"/api/datasets/{data['id']}").json()["sheets"][0]
+    assert sheet["merged_cells_count"] == 2
+    assert sorted(sheet["merged_ranges"]) == [[1, 1, 2, 1], [1, 2, 1, 4]]
+    
+    preview = client.get(
+        f"/api/datasets/{data['id']}/sheets/Report/preview", params={"mode": "table"}
+    ).json()
+    assert preview["headers"] == ["Cliente", "Vendite 2023 / Q1", "Vendite 2023 / Q2", "Vendite 2023 / Q3"]
+    assert preview["rows"][0] == ["Cliente 0", "0", "0", "0"]
+    
+    client.delete(f"/api/datasets/{data['id']}")
+
+def test_export_table_csv_and_ndjson(monkeypatch):
+    """Export in streaming della tabella completa, letta a blocchi di una riga."""
+    from app import export
+    import csv
+    import json
+    monkeypatch.setattr(export, "EXPORT_CHUNK_ROWS", 1)
+    
+    data = upload_and_wait("export")
+    url = f"/api/datasets/{data['id']}/sheets/TestSheet/export"
+    
+    response = client.get(url, params={"format": "csv"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "TestSheet_0.csv" in response.headers["content-disposition"]
+    rows = list(csv.reader(response.text.splitlines()))
+    assert rows == [
+        ["Nome", "Età", "Città"],
+        ["Mario", "30", "Roma"],
+        ["Laura", "25", "Milano"],
+        ["Giuseppe", "35", "Napoli"],
+    ]
+    
+    response = client.get(url, params={"format": "ndjson"})
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert records[0] == {"Nome": "Mario", "Età": "30", "Città": "Roma"}
+    assert len(records) == 3
+    
+    assert client.get(url, params={"candidate": 9}).status_code == 404
+    assert client.get(f"/api/datasets/{data['id']}/sheets/Missing/export").status_code == 404
+    
+    client.delete(f"/api/datasets/{data['id']}")
+
+def test_grid_tiles_sparse_with_etag():
+    """Tile sparse con dizionario di stringhe, ETag dallo SHA256 e risposta 304."""
+    data = upload_and_wait("tiles")
+    base = f"/api/datasets/{data['id']}/sheets/TestSheet/grid"
+    
+    layout = client.get(base).json()
+    assert layout["n_rows"] == 4 and layout["n_cols"] == 3 and layout["complete"]
+    
+    response = client.get(f"{base}/tiles/0/0")
+    assert response.status_code == 200
+    tile = response.json()
+    assert len(tile["rows"]) == len(tile["cols"]) == len(tile["values"]) == 12
+    cells = {
+        (tile["row_start"] + r, tile["col_start"] + c): tile["strings"][v]
+        for r, c, v in zip(tile["rows"], tile["cols"], tile["values"])
+    }
+    assert cells[(1, 1)] == "Nome" and cells[(4, 3)] == "Napoli"
+    
+    etag = response.headers["etag"]
+    assert "max-age" in response.headers["cache-control"]
+    cached = client.get(f"{base}/tiles/0/0", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    for header in (f'"other", W/{etag}', "*"):
+        assert client.get(f"{base}/tiles/0/0", headers={"If-None-Match": header}).status_code == 304
+    # Confronto esatto dei tag, non di sottostringhe
+    assert client.get(f"{base}/tiles/0/0", headers={"If-None-Match": etag[:-2] + '"'}).status_code == 200
+    
+    empty = client.get(f"{base}/tiles/10/5").json()
+    assert empty["rows"] == [] and empty["strings"] == []
+    assert client.get(f"{base}/tiles/-1/0").status_code in (400, 404)
+    
+    client.delete(f"/api/datasets/{data['id']}")
+
+def test_table_stats_are_saved_per_candidate():
+    """Le statistiche sono salvate a parte (l'analisi non è riscritta) e ricalcolate se il candidato cambia."""
+    import json
+    from app import models
+    from app.cache import invalidate_dataset
+    from app.database import SessionLocal
+    data = upload_and_wait("stats")
+    url = f"/api/datasets/{data['id']}/sheets/TestSheet/stats"
+    
+    stats = client.get(url).json()
+    assert stats["rows"] == 3
+    name, age, city = stats["columns"]
+    assert name["column"] == "Nome" and name["inferred_type"] == "text"
+    assert age["inferred_type"] == "number"
+    assert (age["min"], age["max"], age["mean"]) == (25.0, 35.0, 30.0)
+    assert city["distinct"] == 3 and city["null_count"] == 0
+    
+    sheet = client.get(f"/api/datasets/{data['id']}").json()["sheets"][0]
+    assert "stats" not in json.loads(sheet["analysis_json"])
+    assert client.get(url).json() == stats
+    
+    # Una rianalisi che cambia il candidato rende obsolete le statistiche salvate
+    db = SessionLocal()
+    try:
+        row = db.query(models.Sheet).filter(models.Sheet.id == sheet["id"]).one()
+        analysis = json.loads(row.analysis_json)
+        analysis["candidates"][0]["row_end"] -= 1
+        row.analysis_json = json.dumps(analysis)
+        db.commit()
+        invalidate_dataset(data["id"])
+        assert client.get(url).json()["rows"] == 2
+        saved = db.get(models.CandidateStats, (sheet["id"], 0), populate_existing=True)
+        assert json.loads(saved.stats_json)["rows"] == 2
+    finally:
+        db.close()
+    
+    assert client.get(url, params={"candidate": 9}).status_code == 404
+    
+    client.delete(f"/api/datasets/{data['id']}")
+
+def test_export_table_parquet(monkeypatch):
+    """Export Parquet (un row group per blocco); 501 se pyarrow non è installato."""
+    from app import export
+    
+    data = upload_and_wait("export-parquet")
+    url = f"/api/datasets/{data['id']}/sheets/TestSheet/export"
+    
+    if not export.parquet_available():
+        assert client.get(url, params={"format": "parquet"}).status_code == 501
+        return
+    
+    import pyarrow.parquet as pq
+    monkeypatch.setattr(export, "EXPORT_CHUNK_ROWS", 2)
+    response = client.get(url, params={"format": "parquet"})
+    assert response.status_code == 200
+    
+    parquet_file = pq.ParquetFile(BytesIO(response.content))
+    assert parquet_file.metadata.num_row_groups == 2
+    table = parquet_file.read()
+    assert table.column_names == ["Nome", "Età", "Città"]
+    assert table.column("Nome").to_pylist() == ["Mario", "Laura", "Giuseppe"]
+    
+    client.delete(f"/api/datasets/{data['id']}")
+
+def test_typed_values_and_truncation_policy(monkeypatch):
+    """Date native nelle colonne data, testi troncati contati su foglio e job."""
+    from datetime import datetime
+    from app import cell_values
+    monkeypatch.setattr(cell_values, "CELL_TEXT_MAX_LENGTH", 20)
+    
+    wb = Workbook()
+    wb.properties.title = f"typed-{time.time_ns()}"
+    ws = wb.active
+    ws.title = "Tipi"
+    ws.append(["Nome", "DATA nascita", "DATA seriale", "Attivo"])
+    ws.append(["Mario", datetime(2024, 1, 15), 45000, True])
+    ws.append(["un nome molto lungo, davvero", datetime(2023, 12, 31, 14, 30), "44926", False])
+    xlsx_file = BytesIO()
+    wb.save(xlsx_file)
+    xlsx_file.seek(0)
+    
+    response = client.post(
+        "/api/datasets",
+        files={"file": ("typed.xlsx", xlsx_file, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+    )
+    data = response.json()
+    job = wait_for_job(data["job_id"])
+    assert job["status"] == "done"
+    assert job["cells_truncated"] == 1
+    
+    detail = client.get(f"/api/datasets/{data['id']}").json()
+    assert detail["sheets"][0]["truncated_cells"] == 1
+    
+    table = client.get(
+        f"/api/datasets/{data['id']}/sheets/Tipi/preview", params={"mode": "table"}
+    ).json()
+    assert table["rows"][0][:3] == ["Mario", "15/01/2024", format_serial(45000)]
+    # Il testo resta testo: nessuna conversione a seriale
+    assert table["rows"][1][:3] == ["un nome molto lungo,", "31/12/2023 14:30", "44926"]
+    
+    client.delete(f"/api/datasets/{data['id']}")
+
+def format_serial(serial):
+    from app.crud import format_excel_serial
+    return format_excel_serial(float(serial), str(serial))
+
+def test_truncation_policy_error_fails_job(monkeypatch):
+    """Con la policy `error` un testo oltre il limite fa fallire l'ingestione."""
+    from app import cell_values
+    monkeypatch.setattr(cell_values, "CELL_TEXT_MAX_LENGTH", 3)
+    monkeypatch.setattr(cell_values, "CELL_TEXT_OVERFLOW", "error")
+    
+    xlsx_file = create_test_xlsx(title=f"overflow-{time.time_ns()}")
+    response = client.post(
+        "/api/datasets",
+        files={"file": ("overflow.xlsx", xlsx_file, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+    )
+    data = response.json()
+    job = wait_for_job(data["job_id"])
+    assert job["status"] == "failed"
+    assert "limite 3" in job["error"]
+    assert client.get(f"/api/datasets/{data['id']}").json()["sheets"] == []
+    
+    client.delete(f"/api/datasets/{data['id']}")
+
+def test_upload_rejects_non_xlsx_content():
+    """Test rifiuto di un file che non è un archivio xlsx."""
+    response = client.post(
+        "/api/datasets",
+        files={"file": ("fake.xlsx", BytesIO(b"non sono un excel"), "application/octet-stream")}
+    )
+    assert response.status_code == 400
+
+def test_upload_rejects_too_large(monkeypatch):
+    """Test rifiuto di un file oltre la dimensione massima."""
+    from app import crud
+    monkeypatch.setattr(crud, "MAX_UPLOAD_SIZE", 1024)
+    monkeypatch.setattr(crud, "UPLOAD_CHUNK_SIZE", 256)
+    
+    xlsx_file = create_test_xlsx()
+    response = client.post(
+        "/api/datasets",
+        files={"file": ("big.xlsx", xlsx_file, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+    )
+    assert response.status_code == 413
+
+def test_job_not_found():
+    """Test job inesistente."""
+    response = client.get("/api/jobs/non-esiste")
+    assert response.status_code == 404
+
+def test_read_sessions_are_query_only():
+    """Le sessioni degli endpoint di lettura non possono scrivere."""
+    from sqlalchemy import text
+    from sqlalchemy.exc import DBAPIError
+    from app.database import ReadSessionLocal
+    
+    upload_and_wait("query_only.xlsx")
+    
+    db = ReadSessionLocal()
+    try:
+        assert db.execute(text("SELECT COUNT(*) FROM datasets")).scalar() > 0
+        with pytest.raises(DBAPIError):
+            db.execute(text("UPDATE datasets SET file_size = 0"))
+    finally:
+        db.rollback()
+        db.close()
+
 def test_list_datasets():
     """Test lista datasets."""
     response = client.get("/api/datasets")
     assert response.status_code == 200
     assert isinstance(response.json(), list)
 
+def test_list_datasets_cursor_pagination_and_filters():
+    """Test paginazione a cursore e filtri della lista datasets."""
+    prefix = f"page-{time.time_ns()}"
+    uploaded = []
+    for i in range(3):
+        content = create_test_xlsx(title=f"{prefix}-{i}").getvalue()
+        response = client.post(
+            "/api/datasets",
+            files={"file": (f"{prefix}-{i}.xlsx", BytesIO(content), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+        )
+        assert response.status_code == 200
+        uploaded.append(response.json())
+    for dataset in uploaded:
+        assert wait_for_job(dataset["job_id"])["status"] == "done"
+    
+    first = client.get("/api/datasets", params={"filename": prefix, "limit": 2})
+    assert first.status_code == 200
+    assert len(first.json()) == 2
+    cursor = first.headers["X-Next-Cursor"]
+    
+    second = client.get("/api/datasets", params={"filename": prefix, "limit": 2, "cursor": cursor})
+    assert second.status_code == 200
+    assert "X-Next-Cursor" not in second.headers
+    
+    listed = first.json() + second.json()
+    assert [d["id"] for d in listed] == [d["id"] for d in reversed(uploaded)]
+    assert all(d["sheet_count"] == 1 for d in listed)
+    
+    # Filtro per prefisso senza distinzione di maiuscole; `skip` deprecato ancora accettato
+    assert len(client.get("/api/datasets", params={"filename": prefix.upper()}).json()) == 3
+    assert client.get("/api/datasets", params={"filename": prefix[1:]}).json() == []
+    skipped = client.get("/api/datasets", params={"filename": prefix, "skip": 1, "limit": 1})
+    assert [d["id"] for d in skipped.json()] == [uploaded[1]["id"]]
+    
+    # Filtro per dimensione: nessun file di test supera 10 MB
+    too_big = client.get("/api/datasets", params={"filename": prefix, "min_size": 10 * 1024 * 1024})
+    assert too_big.json() == []
+    
+    assert client.get("/api/datasets", params={"cursor": "non-valido"}).status_code == 400
+    
+    for dataset in uploaded:
+        client.delete(f"/api/datasets/{dataset['id']}")
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,87 @@
+"""Test per lo storage dei file per contenuto (blob con reference count)."""
+import hashlib
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models
+from app.database import Base, create_database_engine
+
+CONTENT = b"contenuto del workbook"
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.fixture
+def make_session(database_url, tmp_path, monkeypatch):
+    monkeypatch.setattr(crud, "BLOB_DIR", tmp_path / "blobs")
+    engine = create_database_engine(database_url, pool_size=2)
+    Base.metadata.create_all(bind=engine)
+    # Gli oggetti restano in memoria dopo il commit, come in una sessione
+    # che ha letto il blob prima di una modifica concorrente
+    factory = sessionmaker(bind=engine, expire_on_commit=False)
+    sessions = []
+    
+    def make():
+        session = factory()
+        sessions.append(session)
+        return session
+    
+    yield make
+    for session in sessions:
+        session.close()
+    engine.dispose()
+
+
+def staged(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(CONTENT)
+    return path
+
+
+def test_store_and_release_blob(make_session, tmp_path):
+    db = make_session()
+    for idx in range(2):
+        blob = crud.store_blob(db, SHA256, staged(tmp_path, f"upload{idx}"), len(CONTENT))
+    
+    blob_file = crud.blob_path(SHA256)
+    assert blob.file_path == str(blob_file)
+    assert db.get(models.Blob, SHA256, populate_existing=True).ref_count == 2
+    
+    crud.release_blob(db, SHA256)
+    assert db.get(models.Blob, SHA256, populate_existing=True).ref_count == 1
+    assert blob_file.exists()
+    
+    crud.release_blob(db, SHA256)
+    assert db.get(models.Blob, SHA256) is None
+    assert not blob_file.exists()
+
+
+def test_store_blob_after_concurrent_release(make_session, tmp_path):
+    """Il blob letto è eliminato da un'altra sessione prima dell'incremento: viene ricreato."""
+    db = make_session()
+    crud.store_blob(db, SHA256, staged(tmp_path, "first"), len(CONTENT))
+    assert db.get(models.Blob, SHA256) is not None
+    
+    crud.release_blob(make_session(), SHA256)
+    assert not crud.blob_path(SHA256).exists()
+    
+    crud.store_blob(db, SHA256, staged(tmp_path, "second"), len(CONTENT))
+    blob = make_session().get(models.Blob, SHA256)
+    assert blob.ref_count == 1
+    assert crud.blob_path(SHA256).read_bytes() == CONTENT
+
+
+def test_release_blob_keeps_file_if_commit_fails(make_session, tmp_path, monkeypatch):
+    db = make_session()
+    crud.store_blob(db, SHA256, staged(tmp_path, "upload"), len(CONTENT))
+    
+    def failing_commit():
+        raise RuntimeError("commit fallito")
+    
+    monkeypatch.setattr(db, "commit", failing_commit)
+    with pytest.raises(RuntimeError):
+        crud.release_blob(db, SHA256)
+    db.rollback()
+    
+    assert make_session().get(models.Blob, SHA256).ref_count == 1
+    assert crud.blob_path(SHA256).exists()
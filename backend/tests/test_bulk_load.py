@@ -0,0 +1,75 @@
+"""Test per il caricamento massivo delle celle."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.bulk_load import bulk_insert_cells, cell_rows
+from app.cell_store import SQLiteCellStore
+from app.database import Base, create_database_engine
+
+
+@pytest.fixture
+def db(database_url):
+    # executemany su SQLite, COPY FROM STDIN su PostgreSQL
+    engine = create_database_engine(database_url, pool_size=1)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(models.Dataset(id="d1", filename="a.xlsx", sha256="x", file_path="a.xlsx", file_size=1))
+    session.add(models.Sheet(id=1, dataset_id="d1", sheet_name="S1", n_rows=0, n_cols=0))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_bulk_insert_cells_from_generator(db):
+    """Le celle arrivano da un generatore e restano nella transazione del chiamante."""
+    cells = ((r, c, f"{r}-{c}", "s", None) for r in range(1, 101) for c in range(1, 6))
+    
+    stats = bulk_insert_cells(db, 1, cells)
+    assert stats.rows == 500
+    assert stats.rows_per_sec > 0
+    
+    # Nessun commit implicito: il rollback annulla il caricamento
+    db.rollback()
+    assert db.query(models.Cell).count() == 0
+
+
+def test_bulk_insert_cells_typed_columns(db):
+    """Il valore nativo finisce nella colonna del suo tipo, le altre restano NULL."""
+    when = datetime(2023, 12, 31, 14, 30)
+    bulk_insert_cells(db, 1, [
+        (1, 1, "testo", "s", None),
+        (1, 2, "42", "n", 42.0),
+        (1, 3, str(when), "d", when),
+        (1, 4, "True", "b", True),
+    ])
+    db.commit()
+    
+    cells = SQLiteCellStore().read_all(db, db.get(models.Sheet, 1))
+    assert [(c.value_type, c.value) for c in cells] == [
+        ("s", None), ("n", 42.0), ("d", when), ("b", True)
+    ]
+    row = db.query(models.Cell).filter(models.Cell.col == 2).one()
+    assert (row.value_num, row.value_date, row.value_bool) == (42.0, None, None)
+    
+    chunks = list(SQLiteCellStore().iter_chunks(db, db.get(models.Sheet, 1), chunk_size=3))
+    assert [len(chunk) for chunk in chunks] == [3, 1]
+    assert [c for chunk in chunks for c in chunk] == list(cells)
+
+
+def test_cell_rows_dates_by_dialect():
+    """Su SQLite le date sono testo nel formato di SQLAlchemy, altrove restano datetime."""
+    when = datetime(2023, 12, 31, 14, 30)
+    cells = [(1, 1, str(when), "d", when)]
+    
+    assert list(cell_rows(7, cells, "sqlite")) == [
+        (7, 1, 1, str(when), "d", None, "2023-12-31 14:30:00.000000", None)
+    ]
+    assert list(cell_rows(7, cells, "postgresql"))[0][6] == when
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
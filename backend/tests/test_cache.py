@@ -0,0 +1,59 @@
+"""Test per la cache LRU in-process."""
+import pytest
+
+from app.cache import LRUCache
+
+
+def test_lru_eviction_and_counters():
+    cache = LRUCache("test", max_entries=2)
+    cache.set(("d1", "a"), 1)
+    cache.set(("d1", "b"), 2)
+    
+    # "a" diventa il più recente, quindi viene espulso "b"
+    assert cache.get(("d1", "a")) == 1
+    cache.set(("d2", "c"), 3)
+    
+    assert cache.get(("d1", "b")) is None
+    assert cache.get(("d2", "c")) == 3
+    
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+
+
+def test_invalidate_dataset():
+    cache = LRUCache("test", max_entries=10)
+    cache.set(("d1", "a"), 1)
+    cache.set(("d1", "b", "grid"), 2)
+    cache.set(("d2", "a"), 3)
+    
+    cache.invalidate_dataset("d1")
+    
+    assert cache.get(("d1", "a")) is None
+    assert cache.get(("d1", "b", "grid")) is None
+    assert cache.get(("d2", "a")) == 3
+
+
+def test_get_or_set_computes_once():
+    cache = LRUCache("test", max_entries=10)
+    calls = []
+    
+    def compute():
+        calls.append(1)
+        return {"candidates": []}
+    
+    assert cache.get_or_set(("d1", "s"), compute) == {"candidates": []}
+    assert cache.get_or_set(("d1", "s"), compute) == {"candidates": []}
+    assert len(calls) == 1
+
+
+def test_disabled_cache():
+    cache = LRUCache("test", max_entries=0)
+    cache.set(("d1", "a"), 1)
+    assert cache.get(("d1", "a")) is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,94 @@
+"""Test per i backend di memorizzazione delle celle."""
+from datetime import datetime
+
+import pytest
+
+from app import models
+from app.cell_store import CellStore, ColumnarCellStore
+
+
+CELLS = [
+    (1, 1, "Nome", "s", None), (1, 2, "Età", "s", None), (1, 5, "Città", "s", None),
+    (2, 1, "Mario", "s", None), (2, 2, "30", "n", 30.0),
+    (3, 2, "è unicode ✓", "s", None), (3, 5, "Roma", "s", None),
+    (7, 3, "isolata", "s", None),
+]
+
+
+@pytest.fixture
+def columnar(tmp_path):
+    store = ColumnarCellStore(base_dir=tmp_path)
+    sheet = models.Sheet(id=1, dataset_id="d1", sheet_name="S1")
+    assert store.write_sheet(None, sheet, iter(CELLS)) == len(CELLS)
+    return store, sheet
+
+
+def test_columnar_read_range(columnar):
+    """La lettura per rettangolo restituisce solo le celle nel range, in ordine."""
+    store, sheet = columnar
+    
+    cells = store.read_range(None, sheet, 1, 3, 2, 5)
+    assert [tuple(c) for c in cells] == [CELLS[i] for i in (1, 2, 4, 5, 6)]
+    assert store.read_range(None, sheet, 4, 6, 1, 10) == []
+    assert [tuple(c) for c in store.read_range(None, sheet, 7, 100, 3, 3)] == [CELLS[-1]]
+
+
+def test_columnar_read_all_and_clone(columnar):
+    """read_all restituisce tutte le celle; il clone è leggibile indipendentemente."""
+    store, sheet = columnar
+    assert [tuple(c) for c in store.read_all(None, sheet)] == CELLS
+    
+    chunks = list(store.iter_chunks(None, sheet, chunk_size=3))
+    assert [len(chunk) for chunk in chunks] == [3, 3, 2]
+    assert [tuple(c) for chunk in chunks for c in chunk] == CELLS
+    
+    target = models.Sheet(id=2, dataset_id="d2", sheet_name="S1")
+    store.clone_sheet(None, sheet, target)
+    store.delete_dataset(None, "d1")
+    assert [tuple(c) for c in store.read_all(None, target)] == CELLS
+
+
+def test_columnar_typed_values(tmp_path):
+    """Numeri, date e booleani tornano con il loro tipo nativo."""
+    store = ColumnarCellStore(base_dir=tmp_path)
+    sheet = models.Sheet(id=1, dataset_id="d1", sheet_name="Tipi")
+    when = datetime(2024, 2, 29, 13, 45, 30, 250)
+    cells = [
+        (1, 1, "1.5", "n", 1.5),
+        (1, 2, str(when), "d", when),
+        (1, 3, "True", "b", True),
+        (1, 4, "False", "b", False),
+        (1, 5, "testo", "s", None),
+    ]
+    store.write_sheet(None, sheet, iter(cells))
+    
+    read = store.read_all(None, sheet)
+    assert [tuple(c) for c in read] == cells
+    assert type(read[0].value) is float
+    assert type(read[2].value) is bool
+
+
+def test_columnar_empty_sheet(tmp_path):
+    """Un foglio senza celle produce letture vuote."""
+    store = ColumnarCellStore(base_dir=tmp_path)
+    sheet = models.Sheet(id=1, dataset_id="d1", sheet_name="Vuoto")
+    assert store.write_sheet(None, sheet, iter([])) == 0
+    assert store.read_range(None, sheet, 1, 50, 1, 20) == []
+    assert store.read_all(None, sheet) == []
+    assert list(store.iter_chunks(None, sheet)) == []
+
+
+def test_cell_store_requires_every_method():
+    """Un backend incompleto non è istanziabile: l'errore arriva alla registrazione, non alla prima lettura."""
+    class WriteOnlyCellStore(CellStore):
+        name = "write-only"
+        
+        def write_sheet(self, db, sheet, cells):
+            return 0
+    
+    with pytest.raises(TypeError, match="read_range"):
+        WriteOnlyCellStore()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,79 @@
+"""Test per le statistiche per colonna."""
+from datetime import datetime
+
+import pytest
+
+from app import column_stats
+from app.cell_store import CellValue
+from app.column_stats import HyperLogLog, TableStats
+
+
+def test_hyperloglog_estimate_within_error():
+    """La stima resta entro pochi punti percentuali del valore esatto."""
+    hll = HyperLogLog()
+    for start in range(0, 200_000, 50_000):
+        hll.add([f"valore-{i}" for i in range(start, start + 50_000)])
+    # Valori ripetuti non cambiano la stima
+    hll.add([f"valore-{i}" for i in range(1000)])
+    
+    assert abs(hll.count() - 200_000) / 200_000 < 0.03
+    
+    small = HyperLogLog()
+    small.add(["a", "b", "c", "a"])
+    assert small.count() == 3
+
+
+def test_table_stats_types_nulls_and_ranges():
+    """Tipo prevalente, celle vuote, min/max/media e top-k per colonna."""
+    cells = [
+        CellValue(2, 1, "Mario", "s"),
+        CellValue(2, 2, "30", "n", 30.0),
+        CellValue(2, 3, "2024-01-15 00:00:00", "d", datetime(2024, 1, 15)),
+        CellValue(3, 1, "Laura", "s"),
+        CellValue(3, 2, "25", "n", 25.0),
+        CellValue(4, 1, "Mario", "s"),
+        CellValue(4, 2, "n.d.", "s"),
+        CellValue(4, 3, "2023-12-31 14:30:00", "d", datetime(2023, 12, 31, 14, 30)),
+    ]
+    table = TableStats(["Nome", "Età", "Data"], col_start=1)
+    # Due blocchi: le statistiche si combinano tra blocchi
+    table.add_chunk(2, cells[:5])
+    table.add_chunk(2, cells[5:])
+    stats = table.to_dict()
+    
+    assert stats["rows"] == 4
+    name, age, when = stats["columns"]
+    
+    assert name["inferred_type"] == "text"
+    assert name["null_count"] == 1 and name["null_ratio"] == 0.25
+    assert name["distinct"] == 2 and not name["distinct_approximate"]
+    assert name["top_values"][0] == {"value": "Mario", "count": 2}
+    
+    assert age["inferred_type"] == "mixed"
+    assert age["type_counts"] == {"number": 2, "text": 1}
+    assert (age["min"], age["max"], age["mean"]) == (25.0, 30.0, 27.5)
+    
+    assert when["inferred_type"] == "date"
+    assert (when["min"], when["max"]) == ("2023-12-31T14:30:00", "2024-01-15T00:00:00")
+    assert when["mean"] is None
+
+
+def test_table_stats_switches_to_approximate(monkeypatch):
+    """Oltre la soglia i distinti sono stimati e il top-k è potato."""
+    monkeypatch.setattr(column_stats, "STATS_DISTINCT_EXACT_LIMIT", 100)
+    monkeypatch.setattr(column_stats, "STATS_TOP_K", 2)
+    
+    table = TableStats(["Codice"], col_start=1)
+    for chunk in range(5):
+        rows = range(chunk * 1000 + 2, chunk * 1000 + 1002)
+        table.add_chunk(1000, [CellValue(r, 1, f"C{r % 3000}", "s") for r in rows])
+    column = table.to_dict()["columns"][0]
+    
+    assert column["distinct_approximate"]
+    assert abs(column["distinct"] - 3000) / 3000 < 0.05
+    assert column["top_values_approximate"]
+    assert len(column["top_values"]) == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
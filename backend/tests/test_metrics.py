@@ -0,0 +1,114 @@
+"""Test per le metriche e l'header Server-Timing."""
+import re
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.main import app
+from tests.test_api import create_test_xlsx, wait_for_job
+
+client = TestClient(app)
+
+
+def test_histogram_and_counter_text_format():
+    counter = metrics.Counter("test_total", "Contatore di prova")
+    counter.inc(route="/a")
+    counter.inc(2, route="/a")
+    counter.inc(route='/b"c')
+    assert counter.value(route="/a") == 3
+    assert 'test_total{route="/b\\"c"} 1' in counter.samples()
+    
+    histogram = metrics.Histogram("test_seconds", "Istogramma di prova", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, stage="x")
+    assert histogram.samples() == [
+        'test_seconds_bucket{stage="x",le="0.1"} 1',
+        'test_seconds_bucket{stage="x",le="1.0"} 2',
+        'test_seconds_bucket{stage="x",le="+Inf"} 3',
+        'test_seconds_sum{stage="x"} 5.55',
+        'test_seconds_count{stage="x"} 3',
+    ]
+
+
+def test_timed_iterator_measures_only_the_producer():
+    def slow_producer():
+        for i in range(5):
+            time.sleep(0.01)
+            yield i
+    
+    items = metrics.TimedIterator(slow_producer(), batch=2)
+    consumed = []
+    for item in items:
+        time.sleep(0.02)
+        consumed.append(item)
+    
+    assert consumed == [0, 1, 2, 3, 4]
+    assert 0.05 <= items.seconds < 0.1
+
+
+def metric_value(text, name, **labels):
+    """Valore di una serie nel testo di /metrics (0 se assente)."""
+    for line in text.splitlines():
+        match = re.match(r"^(\w+)(?:\{(.*)\})? (\S+)$", line)
+        if not match or match.group(1) != name:
+            continue
+        series = dict(re.findall(r'(\w+)="([^"]*)"', match.group(2) or ""))
+        if all(series.get(k) == v for k, v in labels.items()):
+            return float(match.group(3))
+    return 0.0
+
+
+def test_metrics_endpoint_counts_requests_queries_and_ingestion():
+    route = "/api/datasets/{dataset_id}/sheets/{sheet_name}/preview"
+    before = client.get("/metrics").text
+    
+    response = client.post(
+        "/api/datasets",
+        files={"file": ("metrics.xlsx", create_test_xlsx(title=f"metrics-{time.time_ns()}"), "application/octet-stream")}
+    )
+    data = response.json()
+    assert wait_for_job(data["job_id"])["status"] == "done"
+    client.get(f"/api/datasets/{data['id']}/sheets/TestSheet/preview", params={"mode": "table"})
+    
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    after = response.text
+    
+    def delta(name, **labels):
+        return metric_value(after, name, **labels) - metric_value(before, name, **labels)
+    
+    assert delta("http_requests_total", method="GET", route=route, status="200") == 1
+    assert delta("http_request_duration_seconds_count", route=route) == 1
+    assert delta("http_request_sql_queries_total", route=route) >= 1
+    assert delta("stage_duration_seconds_count", stage="preview_table") == 1
+    assert delta("stage_duration_seconds_count", stage="ingest_read") == 1
+    assert delta("stage_duration_seconds_count", stage="analyze") == 1
+    assert delta("ingest_cells_total") == 12
+    assert delta("ingest_bytes_total") > 0
+    assert delta("sql_queries_total", engine="write") > 0
+    assert 'cache_hits_total{cache="preview"}' in after
+    
+    client.delete(f"/api/datasets/{data['id']}")
+
+
+def test_server_timing_header(monkeypatch):
+    # Il middleware è istanziato alla costruzione dello stack dell'applicazione
+    middleware = app.middleware_stack
+    while not isinstance(middleware, metrics.MetricsMiddleware):
+        middleware = middleware.app
+    
+    response = client.get("/api/datasets")
+    assert "server-timing" not in response.headers
+    
+    monkeypatch.setattr(middleware, "server_timing", True)
+    response = client.get("/api/datasets")
+    timing = response.headers["server-timing"]
+    assert re.search(r'sql;desc="\d+ query";dur=[\d.]+', timing)
+    assert re.search(r"total;dur=[\d.]+$", timing)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
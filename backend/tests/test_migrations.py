@@ -0,0 +1,95 @@
+"""Test per le migrazioni dello schema."""
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from app.database import Base
+from app.migrations import run_migrations
+
+
+LEGACY_SCHEMA = [
+    "CREATE TABLE datasets (id VARCHAR PRIMARY KEY, filename VARCHAR NOT NULL, sha256 VARCHAR NOT NULL, "
+    "upload_date DATETIME, file_path VARCHAR NOT NULL, file_size INTEGER NOT NULL)",
+    "CREATE TABLE sheets (id INTEGER PRIMARY KEY AUTOINCREMENT, dataset_id VARCHAR NOT NULL REFERENCES datasets(id) ON DELETE CASCADE, "
+    "sheet_name VARCHAR NOT NULL, n_rows INTEGER NOT NULL, n_cols INTEGER NOT NULL, merged_cells_count INTEGER, analysis_json TEXT)",
+    "CREATE INDEX ix_sheet_dataset ON sheets (dataset_id)",
+    "CREATE TABLE cells (id INTEGER PRIMARY KEY AUTOINCREMENT, dataset_id VARCHAR NOT NULL REFERENCES datasets(id) ON DELETE CASCADE, "
+    "sheet_name VARCHAR NOT NULL, row INTEGER NOT NULL, col INTEGER NOT NULL, value_text VARCHAR(2000) NOT NULL)",
+    "CREATE INDEX ix_cell_dataset ON cells (dataset_id)",
+    "CREATE INDEX ix_cell_sheet ON cells (sheet_name)",
+    "CREATE INDEX ix_cell_position ON cells (row, col)",
+]
+
+
+def test_migrate_legacy_cells(tmp_path):
+    """Le celle del vecchio schema vengono ricollegate agli sheet tramite sheet_id."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO datasets VALUES ('d1', 'a.xlsx', 'x', NULL, 'a.xlsx', 10)"))
+        conn.execute(text("INSERT INTO sheets (dataset_id, sheet_name, n_rows, n_cols) VALUES ('d1', 'S1', 2, 2)"))
+        conn.execute(text("INSERT INTO sheets (dataset_id, sheet_name, n_rows, n_cols) VALUES ('d1', 'S2', 1, 1)"))
+        conn.execute(text(
+            "INSERT INTO cells (dataset_id, sheet_name, row, col, value_text) VALUES "
+            "('d1', 'S1', 1, 1, 'a'), ('d1', 'S1', 2, 2, 'b'), ('d1', 'S2', 1, 1, 'c')"
+        ))
+    
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    
+    inspector = inspect(engine)
+    columns = {c["name"] for c in inspector.get_columns("cells")}
+    assert columns == {"sheet_id", "row", "col", "value_text", "value_type", "value_num", "value_date", "value_bool"}
+    assert "ix_sheet_dataset_name" in {i["name"] for i in inspector.get_indexes("sheets")}
+    
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT s.sheet_name, c.row, c.col, c.value_text FROM cells c "
+            "JOIN sheets s ON s.id = c.sheet_id ORDER BY c.sheet_id, c.row, c.col"
+        )).all()
+    assert rows == [("S1", 1, 1, "a"), ("S1", 2, 2, "b"), ("S2", 1, 1, "c")]
+    
+    # Solo testo: i fogli restano da rileggere con --reparse
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT DISTINCT value_type FROM cells")).scalars().all() == ["s"]
+        assert conn.execute(text("SELECT DISTINCT detector_version FROM sheets")).scalars().all() == [None]
+    
+    with engine.begin() as conn:
+        assert conn.execute(text("SELECT filename_key FROM datasets")).scalar() == "a.xlsx"
+        assert conn.execute(text("PRAGMA user_version")).scalar() == 1
+        conn.execute(text(
+            "INSERT INTO datasets (id, filename, sha256, upload_date, file_path, file_size) "
+            "VALUES ('d2', 'B.xlsx', 'y', '2024-01-01 00:00:00', 'b.xlsx', 1)"
+        ))
+    
+    # Una seconda esecuzione non rilegge le date (migrazione una tantum)
+    run_migrations(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT upload_date, filename_key FROM datasets WHERE id = 'd2'")).one() == (
+            "2024-01-01 00:00:00", "b.xlsx"
+        )
+
+
+def test_migrate_legacy_cells_resets_detector_version(tmp_path):
+    """Un'analisi già versionata non nasconde i fogli migrati al re-parse."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("ALTER TABLE sheets ADD COLUMN detector_version INTEGER"))
+        conn.execute(text("INSERT INTO datasets VALUES ('d1', 'a.xlsx', 'x', NULL, 'a.xlsx', 10)"))
+        conn.execute(text(
+            "INSERT INTO sheets (dataset_id, sheet_name, n_rows, n_cols, detector_version) VALUES ('d1', 'S1', 1, 1, 1)"
+        ))
+        conn.execute(text("INSERT INTO cells (dataset_id, sheet_name, row, col, value_text) VALUES ('d1', 'S1', 1, 1, '30')"))
+    
+    run_migrations(engine)
+    
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT detector_version FROM sheets")).scalar() is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,69 @@
+"""Test per il profiling delle ingestioni."""
+import re
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.profiling import SamplingProfiler
+from tests.test_api import create_test_xlsx, wait_for_job
+
+client = TestClient(app)
+
+
+def busy_loop(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_sampling_profiler_collapsed_stacks():
+    with SamplingProfiler(interval=0.001) as profiler:
+        busy_loop(0.1)
+    
+    assert profiler.samples > 10
+    lines = profiler.collapsed().splitlines()
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == profiler.samples
+    # Stack dalla radice al frame corrente: la funzione campionata è in fondo
+    assert lines[0].rsplit(" ", 1)[0].endswith(f"busy_loop (test_profiling.py:{busy_loop.__code__.co_firstlineno})")
+    assert "test_sampling_profiler_collapsed_stacks" in lines[0]
+
+
+def test_upload_with_profile():
+    response = client.post(
+        "/api/datasets",
+        params={"profile": "true"},
+        files={"file": ("profile.xlsx", create_test_xlsx(title=f"profile-{time.time_ns()}"), "application/octet-stream")}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    job = wait_for_job(data["job_id"])
+    assert job["status"] == "done"
+    assert job["profile"] is True
+    
+    response = client.get(f"/api/jobs/{data['job_id']}/profile")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert all(re.match(r"^\S.* \d+$", line) for line in response.text.splitlines())
+    
+    client.delete(f"/api/datasets/{data['id']}")
+    assert client.get(f"/api/jobs/{data['job_id']}/profile").status_code == 404
+
+
+def test_profile_not_available_without_flag():
+    response = client.post(
+        "/api/datasets",
+        files={"file": ("noprofile.xlsx", create_test_xlsx(title=f"noprofile-{time.time_ns()}"), "application/octet-stream")}
+    )
+    data = response.json()
+    assert wait_for_job(data["job_id"])["profile"] is False
+    
+    response = client.get(f"/api/jobs/{data['job_id']}/profile")
+    assert response.status_code == 404
+    
+    client.delete(f"/api/datasets/{data['id']}")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
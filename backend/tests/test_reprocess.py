@@ -0,0 +1,137 @@
+"""Test per la rielaborazione dei dataset già caricati."""
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import models, reprocess
+from app.database import SessionLocal
+from app.main import app
+from app.table_detection import DETECTOR_VERSION
+from tests.test_api import create_test_xlsx, wait_for_job
+
+client = TestClient(app)
+
+OUTDATED_ANALYSIS = json.dumps({"candidates": []})
+
+
+@pytest.fixture
+def dataset():
+    response = client.post(
+        "/api/datasets",
+        files={"file": ("reprocess.xlsx", create_test_xlsx(title=f"reprocess-{time.time_ns()}"), "application/octet-stream")}
+    )
+    data = response.json()
+    assert wait_for_job(data["job_id"])["status"] == "done"
+    yield data["id"]
+    client.delete(f"/api/datasets/{data['id']}")
+
+
+def outdate(dataset_id):
+    """Simula un'analisi prodotta da una versione precedente del rilevamento."""
+    db = SessionLocal()
+    try:
+        db.query(models.Sheet).filter(models.Sheet.dataset_id == dataset_id).update(
+            {"analysis_json": OUTDATED_ANALYSIS, "detector_version": None}
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def sheet_state(dataset_id):
+    sheet = client.get(f"/api/datasets/{dataset_id}").json()["sheets"][0]
+    return sheet["detector_version"], json.loads(sheet["analysis_json"])
+
+
+def test_ingestion_records_detector_version(dataset):
+    version, analysis = sheet_state(dataset)
+    assert version == DETECTOR_VERSION
+    assert analysis["candidates"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_reanalyze_only_stale_sheets(dataset, workers):
+    # Un secondo dataset con lo stesso contenuto (fogli clonati)
+    response = client.post(
+        "/api/datasets",
+        files={"file": ("copy.xlsx", create_test_xlsx(title=f"reprocess-{time.time_ns()}"), "application/octet-stream")}
+    )
+    other = response.json()["id"]
+    assert wait_for_job(response.json()["job_id"])["status"] == "done"
+    
+    _, expected = sheet_state(dataset)
+    outdate(dataset)
+    outdate(other)
+    
+    db = SessionLocal()
+    try:
+        progress = []
+        stats = reprocess.reanalyze_sheets(
+            db, [dataset, other], workers=workers, batch_size=1,
+            progress=lambda done, failed, total: progress.append((done, failed, total))
+        )
+        assert (stats.sheets, stats.failed) == (2, 0)
+        assert progress == [(1, 0, 2), (2, 0, 2)]
+        assert sheet_state(dataset) == sheet_state(other) == (DETECTOR_VERSION, expected)
+        
+        # Già aggiornati: nulla da fare, se non con force
+        assert reprocess.reanalyze_sheets(db, [dataset, other], workers=workers).sheets == 0
+        assert reprocess.reanalyze_sheets(db, [dataset], force=True, workers=workers).sheets == 1
+    finally:
+        db.close()
+        client.delete(f"/api/datasets/{other}")
+
+
+def test_reprocess_api_refreshes_cached_preview(dataset):
+    outdate(dataset)
+    # L'analisi obsoleta (nessun candidato) finisce nella cache delle analisi
+    response = client.get(f"/api/datasets/{dataset}/sheets/TestSheet/preview", params={"mode": "table"})
+    assert response.json()["headers"] == []
+    
+    response = client.post("/api/reprocess", json={"dataset_ids": [dataset]})
+    assert response.status_code == 202
+    assert response.json()["status"] == "running"
+    
+    deadline = time.time() + 20
+    while (status := client.get("/api/reprocess").json())["status"] == "running":
+        assert time.time() < deadline
+        time.sleep(0.05)
+    assert status["status"] == "done"
+    assert (status["sheets_done"], status["sheets_total"], status["detector_version"]) == (1, 1, DETECTOR_VERSION)
+    
+    response = client.get(f"/api/datasets/{dataset}/sheets/TestSheet/preview", params={"mode": "table"})
+    assert response.status_code == 200
+    assert response.json()["headers"] == ["Nome", "Età", "Città"]
+    
+    assert client.post("/api/reprocess", json={"dataset_ids": ["nessuno"]}).status_code == 404
+
+
+def test_reparse_api(dataset):
+    # Già alla versione corrente: nessun job senza force
+    response = client.post("/api/reprocess/reparse", json={"dataset_ids": [dataset]})
+    assert response.status_code == 202
+    assert response.json() == {"job_ids": [], "skipped": {}}
+    
+    outdate(dataset)
+    response = client.post("/api/reprocess/reparse", json={"dataset_ids": [dataset]})
+    job_ids = response.json()["job_ids"]
+    assert len(job_ids) == 1
+    job = wait_for_job(job_ids[0])
+    assert (job["status"], job["cells_loaded"]) == ("done", 12)
+    
+    version, analysis = sheet_state(dataset)
+    assert version == DETECTOR_VERSION and analysis["candidates"]
+    assert len(client.get(f"/api/datasets/{dataset}").json()["sheets"]) == 1
+
+
+def test_cli_reanalysis(dataset, capsys):
+    outdate(dataset)
+    reprocess.main(["--dataset", dataset, "--workers", "1"])
+    assert "1/1 fogli (0 falliti)" in capsys.readouterr().out
+    assert sheet_state(dataset)[0] == DETECTOR_VERSION
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
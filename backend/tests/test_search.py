@@ -0,0 +1,151 @@
+"""Test per l'indice di ricerca sulle celle."""
+import time
+import uuid
+from io import BytesIO
+
+import pytest
+from fastapi.testclient import TestClient
+from openpyxl import Workbook
+from sqlalchemy.orm import sessionmaker
+
+from app import models, search
+from app.bulk_load import bulk_insert_cells
+from app.database import Base, create_database_engine
+from app.main import app
+from tests.test_api import wait_for_job
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db(database_url):
+    # FTS5 su SQLite, GIN su tsvector su PostgreSQL
+    engine = create_database_engine(database_url, pool_size=1)
+    Base.metadata.create_all(bind=engine)
+    search.create_search_index(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(models.Dataset(id="d1", filename="clienti.xlsx", sha256="x", file_path="a.xlsx", file_size=1))
+    session.add(models.Dataset(id="d2", filename="ordini.xlsx", sha256="y", file_path="b.xlsx", file_size=1))
+    session.add(models.Sheet(id=1, dataset_id="d1", sheet_name="Clienti", n_rows=0, n_cols=0))
+    session.add(models.Sheet(id=2, dataset_id="d2", sheet_name="Ordini", n_rows=0, n_cols=0))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_cell_key_round_trip():
+    key = search.cell_key(123, 1_048_576, 16_384)
+    assert search.split_key(key) == (123, 1_048_576, 16_384)
+    first, last = search.sheet_key_range(123)
+    assert first <= key <= last < search.sheet_key_range(124)[0]
+
+
+def test_query_terms():
+    assert search.query_terms('C-1234 "Rossi"*') == ["C", "1234", "Rossi"]
+    with pytest.raises(search.SearchQueryError):
+        search.query_terms(' "* - ')
+
+
+def test_index_search_and_delete(db):
+    bulk_insert_cells(db, 1, [
+        (1, 1, "Cliente", "s", None), (1, 2, "Codice", "s", None),
+        (2, 1, "Mario Rossi", "s", None), (2, 2, "C-12345", "s", None),
+        (3, 1, "Laura Bianchi", "s", None), (3, 2, "C-12999", "s", None),
+    ])
+    bulk_insert_cells(db, 2, [(5, 3, "Ordine di Mario Rossi, cliente C-12345", "s", None)])
+    for sheet in db.query(models.Sheet):
+        search.index_sheet(db, sheet)
+    db.commit()
+    
+    hits, next_cursor = search.search_cells(db, "c-123")
+    assert [(h.dataset_id, h.sheet_name, h.row, h.col) for h in hits] == [("d1", "Clienti", 2, 2), ("d2", "Ordini", 5, 3)]
+    assert next_cursor is None
+    assert hits[0].value == "C-12345"
+    assert "<mark>" in hits[0].snippet
+    assert hits[1].filename == "ordini.xlsx"
+    
+    # Tutti i termini, ognuno come prefisso; senza distinzione di maiuscole
+    hits, _ = search.search_cells(db, "ross mar")
+    assert [(h.row, h.col) for h in hits] == [(2, 1), (5, 3)]
+    hits, _ = search.search_cells(db, "rossi mario", dataset_id="d2")
+    assert [h.sheet_name for h in hits] == ["Ordini"]
+    assert search.search_cells(db, "rossi", dataset_id="nessuno") == ([], None)
+    
+    # Paginazione per chiave
+    hits, next_cursor = search.search_cells(db, "c", limit=2)
+    assert len(hits) == 2 and next_cursor is not None
+    more, last_cursor = search.search_cells(db, "c", limit=10, cursor=next_cursor)
+    assert [(h.row, h.col) for h in hits + more] == [(1, 1), (1, 2), (2, 2), (3, 2), (5, 3)]
+    assert last_cursor is None
+    
+    search.delete_sheets(db, [1])
+    db.commit()
+    hits, _ = search.search_cells(db, "rossi")
+    assert [h.sheet_name for h in hits] == ["Ordini"]
+
+
+def test_search_api():
+    code = f"Z{uuid.uuid4().hex[:10]}"
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Clienti"
+    ws.append(["Cliente", "Codice", "Città"])
+    for i in range(30):
+        ws.append([f"Cliente {i}", f"{code}-{i:02d}", "Roma"])
+    xlsx = BytesIO()
+    wb.save(xlsx)
+    xlsx.seek(0)
+    
+    response = client.post("/api/datasets", files={"file": ("search.xlsx", xlsx, "application/octet-stream")})
+    data = response.json()
+    assert wait_for_job(data["job_id"])["status"] == "done"
+    
+    response = client.get("/api/search", params={"q": code, "limit": 20})
+    assert response.status_code == 200
+    hits = response.json()
+    assert len(hits) == 20
+    assert hits[0] == {
+        "dataset_id": data["id"], "filename": "search.xlsx", "sheet_name": "Clienti",
+        "row": 2, "col": 2, "value": f"{code}-00", "snippet": f"<mark>{code}</mark>-00",
+    }
+    
+    response = client.get("/api/search", params={"q": code, "limit": 20, "cursor": response.headers["X-Next-Cursor"]})
+    assert [h["row"] for h in response.json()] == list(range(22, 32))
+    assert "X-Next-Cursor" not in response.headers
+    
+    # Tutti i termini nella stessa cella
+    response = client.get("/api/search", params={"q": f"{code}-07 roma", "dataset_id": data["id"]})
+    assert response.json() == []
+    response = client.get("/api/search", params={"q": f"{code} 07"})
+    assert [(h["row"], h["col"]) for h in response.json()] == [(9, 2)]
+    
+    assert client.get("/api/search", params={"q": "-- *"}).status_code == 400
+    
+    client.delete(f"/api/datasets/{data['id']}")
+    assert client.get("/api/search", params={"q": code}).json() == []
+
+
+def test_duplicate_upload_is_searchable():
+    code = f"Q{time.time_ns()}"
+    wb = Workbook()
+    wb.active.append([code])
+    xlsx = BytesIO()
+    wb.save(xlsx)
+    
+    ids = []
+    for _ in range(2):
+        response = client.post("/api/datasets", files={"file": ("dup.xlsx", BytesIO(xlsx.getvalue()), "application/octet-stream")})
+        data = response.json()
+        assert wait_for_job(data["job_id"])["status"] == "done"
+        ids.append(data["id"])
+    
+    hits = client.get("/api/search", params={"q": code}).json()
+    assert sorted(h["dataset_id"] for h in hits) == sorted(ids)
+    
+    for dataset_id in ids:
+        client.delete(f"/api/datasets/{dataset_id}")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,114 @@
+"""Test per il rilevamento delle tabelle."""
+import json
+
+import pytest
+
+from app import table_detection
+from app.cell_store import CellValue
+from app.table_detection import SheetAnalyzer, analyze_sheet_structure
+
+
+def make_cells(grid, row_offset=1, col_offset=1):
+    """Converte una lista di righe in celle (le stringhe vuote sono celle vuote)."""
+    return [
+        CellValue(row_offset + r, col_offset + c, value)
+        for r, row in enumerate(grid)
+        for c, value in enumerate(row)
+        if value
+    ]
+
+
+TITLE_AND_TABLE = [["Report vendite 2023", "", ""], ["", "", ""]] + [["Nome", "Età", "Città"]] + [
+    [f"Persona {i}", str(20 + i), "Roma"] for i in range(12)
+]
+
+
+def test_empty_sheet():
+    assert json.loads(analyze_sheet_structure([])) == {"candidates": []}
+
+
+def test_title_block_above_table():
+    """Il titolo sopra la tabella è separato: il primo candidato parte dall'intestazione."""
+    analysis = json.loads(analyze_sheet_structure(make_cells(TITLE_AND_TABLE)))
+    candidates = analysis["candidates"]
+    
+    assert candidates[0] == {
+        "row_start": 3, "row_end": 15, "col_start": 1, "col_end": 3,
+        "score": 1.0, "header_row_start": 3, "header_row": 3, "confidence": "high"
+    }
+    # Il titolo isolato non è un candidato; l'ultimo è l'intero bounding box
+    assert len(candidates) == 2
+    assert candidates[1]["row_start"] == 1
+    assert candidates[1]["score"] == 40 / 45
+
+
+def test_merged_cells_multi_row_header():
+    """Celle unite nell'intestazione: header su due righe, dati dalla terza."""
+    cells = [
+        (1, 1, "Cliente"), (1, 2, "Vendite 2023"), (1, 5, "Note"),
+        (2, 2, "Q1"), (2, 3, "Q2"), (2, 4, "Q3"),
+    ]
+    for r in range(3, 13):
+        cells += [(r, 1, f"Cliente {r}"), (r, 2, str(r)), (r, 3, str(r * 2)), (r, 4, str(r * 3)), (r, 5, "ok")]
+    
+    analyzer = SheetAnalyzer()
+    for row, col, value in cells:
+        analyzer.add(row, col, value)
+    
+    # Senza intervalli uniti l'intestazione resta su una sola riga
+    candidate = json.loads(analyzer.to_json())["candidates"][0]
+    assert candidate["header_row_start"] == candidate["header_row"]
+    
+    analyzer.merged_ranges = [(1, 1, 2, 1), (1, 2, 1, 4), (1, 5, 2, 5)]
+    candidate = json.loads(analyzer.to_json())["candidates"][0]
+    assert (candidate["header_row_start"], candidate["header_row"]) == (1, 2)
+
+
+def test_analyzer_observe_passes_cells_through():
+    """L'accumulatore inoltra le celle invariate e produce la stessa analisi."""
+    cells = make_cells(TITLE_AND_TABLE)
+    analyzer = SheetAnalyzer()
+    
+    # Ordine di arrivo diverso da quello (row, col): il risultato non cambia
+    forwarded = list(analyzer.observe(tuple(c) for c in reversed(cells)))
+    
+    assert forwarded == [tuple(c) for c in reversed(cells)]
+    assert analyzer.to_json() == analyze_sheet_structure(cells)
+
+
+def test_side_by_side_and_stacked_tables():
+    """Tabelle separate da colonne o righe vuote: un candidato per ognuna, le più grandi prima."""
+    cells = [(1, 1, "Report trimestrale")]
+    # Due tabelle affiancate (colonna D vuota) e una sotto (riga 14 vuota)
+    cells += [(3, 1, "Prodotto"), (3, 2, "Qta"), (3, 3, "Prezzo")]
+    cells += [(r, c, f"{r}{c}") for r in range(4, 13) for c in range(1, 4)]
+    cells += [(3, 5, "Regione"), (3, 6, "Totale")]
+    cells += [(r, c, f"{r}{c}") for r in range(4, 8) for c in range(5, 7)]
+    cells += [(15, 1, "Mese"), (15, 2, "Ordini"), (15, 3, "Resi"), (15, 4, "Note")]
+    cells += [(r, c, f"{r}{c}") for r in range(16, 21) for c in range(1, 5)]
+    
+    analyzer = SheetAnalyzer()
+    for row, col, value in cells:
+        analyzer.add(row, col, value)
+    candidates = json.loads(analyzer.to_json())["candidates"]
+    
+    boxes = [(c["row_start"], c["row_end"], c["col_start"], c["col_end"]) for c in candidates]
+    assert boxes == [(3, 12, 1, 3), (15, 20, 1, 4), (3, 7, 5, 6), (1, 20, 1, 6)]
+    assert [c["header_row"] for c in candidates[:3]] == [3, 15, 3]
+    assert all(c["score"] == 1.0 and c["confidence"] == "high" for c in candidates[:3])
+
+
+def test_segment_blocks_splits_on_gutters():
+    rows = table_detection.np.array([1, 1, 2, 2, 5, 5, 1, 2])
+    cols = table_detection.np.array([1, 2, 1, 2, 1, 2, 9, 9])
+    labels = table_detection.segment_blocks(rows, cols).tolist()
+    assert labels[0:4] == [labels[0]] * 4 and labels[4] == labels[5] and labels[6] == labels[7]
+    assert len(set(labels)) == 3
+    
+    # Con un gutter minimo di 3 la riga 5 (dopo 2 righe vuote) resta nello stesso blocco
+    labels = table_detection.segment_blocks(rows, cols, min_gap=3).tolist()
+    assert labels[0:6] == [labels[0]] * 6 and labels[6] == labels[7] != labels[0]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
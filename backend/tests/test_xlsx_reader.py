@@ -0,0 +1,121 @@
+"""Test per il lettore xlsx in streaming."""
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from app import readers
+from app.xlsx_reader import XlsxReader
+
+
+def openpyxl_cells(path, sheet_name):
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        return [
+            (r, c, value)
+            for r, row in enumerate(wb[sheet_name].iter_rows(values_only=True), start=1)
+            for c, value in enumerate(row, start=1)
+            if value is not None
+        ]
+    finally:
+        wb.close()
+
+
+def build_report(path):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Report"
+    ws["A1"] = "Cliente"
+    ws.merge_cells("A1:A2")
+    ws["B1"] = "Vendite 2023"
+    ws.merge_cells("B1:D1")
+    ws.append([None, "Q1", "Q2", "Q3"])
+    ws.append(["Rossi", 10, 2.5, True])
+    ws.append([datetime(2023, 1, 2, 3, 4, 5), date(2020, 5, 6), time(12, 30), timedelta(hours=30)])
+    ws["F6"] = "  testo  "
+    ws["G7"] = 1e20
+    ws["H8"] = "=SUM(B3:C3)"
+    wb.create_sheet("Vuoto")
+    wb.save(path)
+    return path
+
+
+def test_values_match_openpyxl_and_merged_ranges(tmp_path):
+    """Stessi valori (e tipi) di openpyxl in read_only, più gli intervalli uniti."""
+    path = build_report(tmp_path / "report.xlsx")
+    
+    with XlsxReader(path) as reader:
+        assert reader.sheetnames == ["Report", "Vuoto"]
+        
+        sheet = reader.sheet("Report")
+        cells = list(sheet.iter_cells())
+        expected = openpyxl_cells(path, "Report")
+        assert cells == expected
+        assert [type(v) for _, _, v in cells] == [type(v) for _, _, v in expected]
+        assert sorted(sheet.merged_ranges) == [(1, 1, 2, 1), (1, 2, 1, 4)]
+        assert (sheet.max_row, sheet.max_col) == (8, 8)
+        
+        empty = reader.sheet("Vuoto")
+        assert list(empty.iter_cells()) == []
+        assert empty.merged_ranges == []
+
+
+@pytest.mark.parametrize("engine", readers.READER_ENGINES)
+def test_engines_read_the_same_cells(tmp_path, engine):
+    """Tutti gli engine restituiscono gli stessi valori e intervalli uniti."""
+    if not readers.engine_available(engine):
+        pytest.skip(f"engine {engine} non installato")
+    path = build_report(tmp_path / "report.xlsx")
+    
+    with readers.open_workbook(path, engine) as reader:
+        assert reader.sheetnames == ["Report", "Vuoto"]
+        sheet = reader.sheet("Report")
+        cells = list(sheet.iter_cells())
+        expected = openpyxl_cells(path, "Report")
+        assert cells == expected
+        assert [type(v) for _, _, v in cells] == [type(v) for _, _, v in expected]
+        assert sorted(sheet.merged_ranges) == [(1, 1, 2, 1), (1, 2, 1, 4)]
+        assert list(reader.sheet("Vuoto").iter_cells()) == []
+
+
+@pytest.mark.parametrize("internals", ["missing", "changed"])
+def test_openpyxl_engine_falls_back_to_public_api(tmp_path, monkeypatch, internals):
+    """Senza il parser interno di openpyxl (o se la sua API cambia) le celle sono lette con iter_rows."""
+    if internals == "missing":
+        monkeypatch.setattr(readers, "WorkSheetParser", None)
+    else:
+        def changed_parser(*args, **kwargs):
+            raise TypeError("unexpected keyword argument 'epoch'")
+        monkeypatch.setattr(readers, "WorkSheetParser", changed_parser)
+    path = build_report(tmp_path / "report.xlsx")
+    
+    with readers.open_workbook(path, readers.ENGINE_OPENPYXL) as reader:
+        sheet = reader.sheet("Report")
+        assert list(sheet.iter_cells()) == openpyxl_cells(path, "Report")
+        assert (sheet.max_row, sheet.max_col) == (8, 8)
+        # Gli intervalli uniti non sono esposti dal foglio read_only
+        assert sheet.merged_ranges == []
+
+
+def test_unknown_engine(tmp_path):
+    with pytest.raises(readers.ReaderUnavailableError):
+        readers.check_engine("xlrd")
+
+
+def test_dimensions_without_dimension_element(tmp_path):
+    """Senza <dimension> (workbook write_only) le dimensioni vengono dalle celle lette."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Dati")
+    ws.append(["a", "b", "c"])
+    ws.append([1, None, 3])
+    path = tmp_path / "write_only.xlsx"
+    wb.save(path)
+    
+    with XlsxReader(path) as reader:
+        sheet = reader.sheet("Dati")
+        assert list(sheet.iter_cells()) == [(1, 1, "a"), (1, 2, "b"), (1, 3, "c"), (2, 1, 1), (2, 3, 3)]
+        assert (sheet.max_row, sheet.max_col) == (2, 3)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -10,7 +10,22 @@ export interface Dataset {
     sha256: string;
     upload_date: string;
     file_size: number;
+    reader_engine?: string | null;
     sheet_count: number;
+    job_id?: string | null;
+}
+
+export type JobStatus = 'queued' | 'parsing' | 'analyzing' | 'done' | 'failed';
+
+export interface Job {
+    id: string;
+    dataset_id: string;
+    status: JobStatus;
+    sheets_total: number;
+    sheets_done: number;
+    current_sheet: string | null;
+    cells_truncated: number | null;
+    error: string | null;
 }
 
 export interface Sheet {
@@ -19,7 +34,10 @@ export interface Sheet {
     n_rows: number;
     n_cols: number;
     merged_cells_count: number;
+    merged_ranges: number[][];
     analysis_json: string | null;
+    detector_version: number | null;
+    truncated_cells: number;
 }
 
 export interface DatasetDetail {
@@ -38,6 +56,27 @@ export interface GridPreview {
     };
 }
 
+export interface GridLayout {
+    n_rows: number;
+    n_cols: number;
+    tile_rows: number;
+    tile_cols: number;
+    complete: boolean;
+}
+
+// Tile sparsa: solo le celle non vuote, con offset relativi all'inizio della tile
+// e indici nel dizionario di stringhe della tile
+export interface GridTile {
+    tile_row: number;
+    tile_col: number;
+    row_start: number;
+    col_start: number;
+    rows: number[];
+    cols: number[];
+    values: number[];
+    strings: string[];
+}
+
 export interface TablePreview {
     mode: 'table';
     headers: string[];
@@ -53,6 +92,11 @@ export const uploadDataset = async (file: File): Promise<Dataset> => {
     return response.data;
 };
 
+export const getJob = async (jobId: string): Promise<Job> => {
+    const response = await api.get<Job>(`/jobs/${jobId}`);
+    return response.data;
+};
+
 export const getDatasets = async (): Promise<Dataset[]> => {
     const response = await api.get<Dataset[]>('/datasets');
     return response.data;
@@ -94,4 +138,21 @@ export const getSheetPreview = async (
     return response.data;
 };
 
+export const getGridLayout = async (datasetId: string, sheetName: string): Promise<GridLayout> => {
+    const response = await api.get<GridLayout>(`/datasets/${datasetId}/sheets/${encodeURIComponent(sheetName)}/grid`);
+    return response.data;
+};
+
+export const getGridTile = async (
+    datasetId: string,
+    sheetName: string,
+    tileRow: number,
+    tileCol: number
+): Promise<GridTile> => {
+    const response = await api.get<GridTile>(
+        `/datasets/${datasetId}/sheets/${encodeURIComponent(sheetName)}/grid/tiles/${tileRow}/${tileCol}`
+    );
+    return response.data;
+};
+
 export default api;
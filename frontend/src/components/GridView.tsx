@@ -1,51 +1,183 @@
-import { GridPreview } from '../api';
+import { UIEvent, useEffect, useMemo, useRef, useState } from 'react';
+import { useQuery, useQueries } from '@tanstack/react-query';
+import { getGridLayout, getGridTile, GridTile } from '../api';
 
 interface GridViewProps {
-    data: GridPreview;
+    datasetId: string;
+    sheetName: string;
 }
 
-export default function GridView({ data }: GridViewProps) {
-    const { data: grid, dimensions } = data;
+const ROW_HEIGHT = 28;
+const COL_WIDTH = 120;
+const ROW_HEADER_WIDTH = 64;
+const VIEWPORT_HEIGHT = 600;
+// Righe/colonne renderizzate oltre l'area visibile
+const OVERSCAN = 10;
+// I browser limitano l'altezza di un elemento (~17M px su Firefox): oltre questa
+// soglia lo scroll verticale viene scalato
+const MAX_SCROLL_HEIGHT = 15_000_000;
+
+function columnName(col: number): string {
+    let name = '';
+    while (col > 0) {
+        const rem = (col - 1) % 26;
+        name = String.fromCharCode(65 + rem) + name;
+        col = Math.floor((col - 1) / 26);
+    }
+    return name;
+}
+
+export default function GridView({ datasetId, sheetName }: GridViewProps) {
+    const viewportRef = useRef<HTMLDivElement>(null);
+    const [scroll, setScroll] = useState({ top: 0, left: 0, width: 1000 });
+
+    useEffect(() => {
+        const viewport = viewportRef.current;
+        if (viewport) {
+            setScroll((prev) => ({ ...prev, width: viewport.clientWidth }));
+        }
+    }, []);
+
+    const { data: layout } = useQuery({
+        queryKey: ['grid-layout', datasetId, sheetName],
+        queryFn: () => getGridLayout(datasetId, sheetName),
+        refetchInterval: (query) => (query.state.data && !query.state.data.complete ? 2000 : false),
+    });
+
+    const nRows = Math.max(layout?.n_rows ?? 0, 1);
+    const nCols = Math.max(layout?.n_cols ?? 0, 1);
+    const fullHeight = nRows * ROW_HEIGHT;
+    const scrollHeight = Math.min(fullHeight, MAX_SCROLL_HEIGHT);
+    const scale = fullHeight > MAX_SCROLL_HEIGHT
+        ? (fullHeight - VIEWPORT_HEIGHT) / (scrollHeight - VIEWPORT_HEIGHT)
+        : 1;
+
+    // Posizione "virtuale" (non scalata) della prima riga visibile
+    const virtualTop = scroll.top * scale;
+    const firstRow = Math.max(1, Math.floor(virtualTop / ROW_HEIGHT) + 1 - OVERSCAN);
+    const lastRow = Math.min(nRows, Math.ceil((virtualTop + VIEWPORT_HEIGHT) / ROW_HEIGHT) + OVERSCAN);
+    const firstCol = Math.max(1, Math.floor(scroll.left / COL_WIDTH) + 1 - 2);
+    const lastCol = Math.min(nCols, Math.ceil((scroll.left + scroll.width) / COL_WIDTH) + 2);
+
+    // Tile che coprono l'area visibile
+    const tileKeys = useMemo(() => {
+        if (!layout) return [];
+        const keys: [number, number][] = [];
+        for (let tr = Math.floor((firstRow - 1) / layout.tile_rows); tr <= Math.floor((lastRow - 1) / layout.tile_rows); tr++) {
+            for (let tc = Math.floor((firstCol - 1) / layout.tile_cols); tc <= Math.floor((lastCol - 1) / layout.tile_cols); tc++) {
+                keys.push([tr, tc]);
+            }
+        }
+        return keys;
+    }, [layout, firstRow, lastRow, firstCol, lastCol]);
+
+    const tiles = useQueries({
+        queries: tileKeys.map(([tr, tc]) => ({
+            queryKey: ['grid-tile', datasetId, sheetName, tr, tc, layout?.complete],
+            queryFn: () => getGridTile(datasetId, sheetName, tr, tc),
+            // Le tile di un foglio completo non cambiano
+            staleTime: layout?.complete ? Infinity : 0,
+        })),
+    });
+
+    // Celle delle tile caricate, indicizzate per "row:col"
+    const cells = useMemo(() => {
+        const map = new Map<string, string>();
+        tiles.forEach(({ data }) => {
+            const tile = data as GridTile | undefined;
+            if (!tile) return;
+            for (let i = 0; i < tile.rows.length; i++) {
+                map.set(`${tile.row_start + tile.rows[i]}:${tile.col_start + tile.cols[i]}`, tile.strings[tile.values[i]]);
+            }
+        });
+        return map;
+    }, [tiles]);
+
+    const handleScroll = (e: UIEvent<HTMLDivElement>) => {
+        const target = e.currentTarget;
+        setScroll({ top: target.scrollTop, left: target.scrollLeft, width: target.clientWidth });
+    };
+
+    // Offset verticale di una riga rispetto al contenuto scrollabile
+    const rowTop = (row: number) => scroll.top + (row - 1) * ROW_HEIGHT - virtualTop;
+
+    const rows = [];
+    for (let row = firstRow; row <= lastRow; row++) {
+        const rowCells = [];
+        for (let col = firstCol; col <= lastCol; col++) {
+            const value = cells.get(`${row}:${col}`);
+            rowCells.push(
+                <div
+                    key={col}
+                    className="absolute border-r border-b border-gray-200 px-2 truncate"
+                    style={{ left: ROW_HEADER_WIDTH + (col - 1) * COL_WIDTH, width: COL_WIDTH, height: ROW_HEIGHT, lineHeight: `${ROW_HEIGHT}px` }}
+                    title={value}
+                >
+                    {value ?? ''}
+                </div>
+            );
+        }
+        rows.push(
+            <div
+                key={row}
+                className={`absolute left-0 ${row % 2 === 0 ? 'bg-gray-50' : 'bg-white'}`}
+                style={{ top: rowTop(row), height: ROW_HEIGHT, width: ROW_HEADER_WIDTH + nCols * COL_WIDTH }}
+            >
+                <div
+                    className="sticky left-0 z-10 bg-gray-100 border-r border-b border-gray-300 font-medium text-center text-sm"
+                    style={{ width: ROW_HEADER_WIDTH, height: ROW_HEIGHT, lineHeight: `${ROW_HEIGHT}px` }}
+                >
+                    {row}
+                </div>
+                {rowCells}
+            </div>
+        );
+    }
+
+    const headers = [];
+    for (let col = firstCol; col <= lastCol; col++) {
+        headers.push(
+            <div
+                key={col}
+                className="absolute top-0 bg-gray-200 border-r border-b border-gray-300 text-center font-semibold"
+                style={{ left: ROW_HEADER_WIDTH + (col - 1) * COL_WIDTH, width: COL_WIDTH, height: ROW_HEIGHT, lineHeight: `${ROW_HEIGHT}px` }}
+            >
+                {columnName(col)}
+            </div>
+        );
+    }
 
     return (
         <div>
             <div className="mb-4 text-sm text-gray-600">
-                Visualizzazione celle da riga {dimensions.row_start} a {dimensions.row_end},
-                colonna {dimensions.col_start} a {dimensions.col_end}
+                {layout
+                    ? `${layout.n_rows.toLocaleString()} righe × ${layout.n_cols.toLocaleString()} colonne — righe ${firstRow}-${lastRow} visibili`
+                    : 'Caricamento dimensioni del foglio...'}
+                {layout && !layout.complete && ' (elaborazione in corso)'}
             </div>
 
-            <div className="overflow-auto max-h-[600px]">
-                <table className="min-w-full border-collapse border border-gray-300 text-sm">
-                    <thead className="sticky top-0 bg-gray-100 z-10">
-                        <tr>
-                            <th className="border border-gray-300 px-2 py-1 bg-gray-200 w-12">#</th>
-                            {grid[0]?.map((_, colIdx) => (
-                                <th key={colIdx} className="border border-gray-300 px-2 py-1 bg-gray-200 min-w-[100px]">
-                                    {String.fromCharCode(65 + ((dimensions.col_start + colIdx - 1) % 26))}
-                                    {Math.floor((dimensions.col_start + colIdx - 1) / 26) || ''}
-                                </th>
-                            ))}
-                        </tr>
-                    </thead>
-                    <tbody>
-                        {grid.map((row, rowIdx) => (
-                            <tr key={rowIdx} className={rowIdx % 2 === 0 ? 'bg-white' : 'bg-gray-50'}>
-                                <td className="border border-gray-300 px-2 py-1 bg-gray-100 font-medium text-center">
-                                    {dimensions.row_start + rowIdx}
-                                </td>
-                                {row.map((cell, colIdx) => (
-                                    <td
-                                        key={colIdx}
-                                        className="border border-gray-300 px-2 py-1"
-                                        title={cell}
-                                    >
-                                        {cell || <span className="text-gray-300">—</span>}
-                                    </td>
-                                ))}
-                            </tr>
-                        ))}
-                    </tbody>
-                </table>
+            <div
+                ref={viewportRef}
+                onScroll={handleScroll}
+                className="relative overflow-auto border border-gray-300 text-sm"
+                style={{ height: VIEWPORT_HEIGHT }}
+            >
+                <div className="relative" style={{ height: scrollHeight + ROW_HEIGHT, width: ROW_HEADER_WIDTH + nCols * COL_WIDTH }}>
+                    <div className="sticky top-0 z-20 h-0">
+                        <div className="relative" style={{ height: ROW_HEIGHT }}>
+                            <div
+                                className="sticky left-0 z-30 bg-gray-200 border-r border-b border-gray-300 text-center"
+                                style={{ width: ROW_HEADER_WIDTH, height: ROW_HEIGHT, lineHeight: `${ROW_HEIGHT}px` }}
+                            >
+                                #
+                            </div>
+                            {headers}
+                        </div>
+                    </div>
+                    <div className="absolute left-0 right-0" style={{ top: ROW_HEIGHT }}>
+                        {rows}
+                    </div>
+                </div>
             </div>
         </div>
     );
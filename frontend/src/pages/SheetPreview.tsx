@@ -9,8 +9,6 @@ export default function SheetPreview() {
     const { id, sheetName } = useParams<{ id: string; sheetName: string }>();
     const [viewMode, setViewMode] = useState<'grid' | 'table'>('table');
     const [candidateIdx, setCandidateIdx] = useState(0);
-    const [rowRange, setRowRange] = useState({ start: 1, end: 50 });
-    const [colRange, setColRange] = useState({ start: 1, end: 20 });
     const [rawValues, setRawValues] = useState(false);
 
     const { data: detailData } = useQuery({
@@ -20,23 +18,15 @@ export default function SheetPreview() {
     });
 
     const { data: previewData, isLoading } = useQuery({
-        queryKey: ['preview', id, sheetName, viewMode, candidateIdx, rowRange, colRange, rawValues],
-        queryFn: () => {
-            if (viewMode === 'grid') {
-                return getSheetPreview(id!, sheetName!, 'grid', {
-                    rowStart: rowRange.start,
-                    rowEnd: rowRange.end,
-                    colStart: colRange.start,
-                    colEnd: colRange.end,
-                });
-            } else {
-                return getSheetPreview(id!, sheetName!, 'table', {
-                    candidate: candidateIdx,
-                    rawValues: rawValues
-                });
-            }
-        },
-        enabled: !!id && !!sheetName,
+        queryKey: ['preview', id, sheetName, 'table', candidateIdx, rawValues],
+        queryFn: () => getSheetPreview(id!, sheetName!, 'table', {
+            candidate: candidateIdx,
+            rawValues: rawValues
+        }),
+        // La vista griglia carica le proprie tile (GridView)
+        enabled: !!id && !!sheetName && viewMode === 'table',
+        // Il contenuto di un foglio non cambia: le finestre già viste restano valide
+        staleTime: Infinity,
     });
 
     const sheet = detailData?.sheets.find(s => s.sheet_name === sheetName);
@@ -52,14 +42,6 @@ export default function SheetPreview() {
         }
     });
 
-    const handleNextPage = () => {
-        setRowRange(prev => ({ start: prev.start + 50, end: prev.end + 50 }));
-    };
-
-    const handlePrevPage = () => {
-        setRowRange(prev => ({ start: Math.max(1, prev.start - 50), end: Math.max(51, prev.end - 50) }));
-    };
-
     return (
         <div>
             <Link to={`/datasets/${id}`} className="text-indigo-600 hover:text-indigo-700 mb-4 inline-block">
@@ -101,9 +83,9 @@ export default function SheetPreview() {
                                 onChange={(e) => setCandidateIdx(parseInt(e.target.value))}
                                 className="border border-gray-300 rounded px-3 py-1 text-sm"
                             >
-                                {candidates.map((_: any, idx: number) => (
+                                {candidates.map((c: any, idx: number) => (
                                     <option key={idx} value={idx}>
-                                        Candidato {idx + 1}
+                                        Candidato {idx + 1} (righe {c.row_start}-{c.row_end}, colonne {c.col_start}-{c.col_end})
                                     </option>
                                 ))}
                             </select>
@@ -123,38 +105,17 @@ export default function SheetPreview() {
                             </label>
                         </div>
                     )}
-
-                    {viewMode === 'grid' && (
-                        <div className="flex items-center gap-2">
-                            <button
-                                onClick={handlePrevPage}
-                                disabled={rowRange.start === 1}
-                                className="px-3 py-1 bg-gray-200 text-gray-700 rounded hover:bg-gray-300 disabled:opacity-50 disabled:cursor-not-allowed text-sm"
-                            >
-                                ← Precedente
-                            </button>
-                            <span className="text-sm text-gray-600">
-                                Righe {rowRange.start}-{rowRange.end}
-                            </span>
-                            <button
-                                onClick={handleNextPage}
-                                className="px-3 py-1 bg-gray-200 text-gray-700 rounded hover:bg-gray-300 text-sm"
-                            >
-                                Successiva →
-                            </button>
-                        </div>
-                    )}
                 </div>
             </div>
 
             <div className="bg-white rounded-lg shadow-lg p-6 overflow-x-auto">
-                {isLoading ? (
+                {viewMode === 'grid' ? (
+                    <GridView datasetId={id!} sheetName={sheetName!} />
+                ) : isLoading ? (
                     <div className="flex justify-center items-center h-64">
                         <div className="animate-spin rounded-full h-12 w-12 border-b-2 border-indigo-600"></div>
                     </div>
-                ) : viewMode === 'grid' && previewData?.mode === 'grid' ? (
-                    <GridView data={previewData} />
-                ) : viewMode === 'table' && previewData?.mode === 'table' ? (
+                ) : previewData?.mode === 'table' ? (
                     <TableView data={previewData} />
                 ) : (
                     <p className="text-gray-600">Nessun dato disponibile</p>
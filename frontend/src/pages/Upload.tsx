@@ -1,20 +1,44 @@
-import { useState, useCallback } from 'react';
+import { useState, useCallback, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { useMutation } from '@tanstack/react-query';
-import { uploadDataset } from '../api';
+import { useMutation, useQuery } from '@tanstack/react-query';
+import { uploadDataset, getJob, Dataset } from '../api';
 
 export default function Upload() {
     const navigate = useNavigate();
     const [dragActive, setDragActive] = useState(false);
     const [selectedFile, setSelectedFile] = useState<File | null>(null);
+    const [uploaded, setUploaded] = useState<Dataset | null>(null);
 
     const uploadMutation = useMutation({
         mutationFn: uploadDataset,
         onSuccess: (data) => {
-            navigate(`/datasets/${data.id}`);
+            if (data.job_id) {
+                setUploaded(data);
+            } else {
+                navigate(`/datasets/${data.id}`);
+            }
         },
     });
 
+    // Polling dello stato di elaborazione finché il job non termina
+    const { data: job } = useQuery({
+        queryKey: ['job', uploaded?.job_id],
+        queryFn: () => getJob(uploaded!.job_id!),
+        enabled: !!uploaded?.job_id,
+        refetchInterval: (query) => {
+            const status = query.state.data?.status;
+            return status === 'done' || status === 'failed' ? false : 1000;
+        },
+    });
+
+    useEffect(() => {
+        if (uploaded && job?.status === 'done') {
+            navigate(`/datasets/${uploaded.id}`);
+        }
+    }, [uploaded, job, navigate]);
+
+    const isProcessing = uploadMutation.isPending || (!!uploaded && job?.status !== 'failed');
+
     const handleDrag = useCallback((e: React.DragEvent) => {
         e.preventDefault();
         e.stopPropagation();
@@ -119,7 +143,7 @@ export default function Upload() {
 
                         <button
                             onClick={handleUpload}
-                            disabled={uploadMutation.isPending}
+                            disabled={isProcessing}
                             className="w-full bg-indigo-600 text-white px-6 py-3 rounded-lg font-semibold hover:bg-indigo-700 disabled:bg-gray-400 disabled:cursor-not-allowed transition"
                         >
                             {uploadMutation.isPending ? (
@@ -130,6 +154,12 @@ export default function Upload() {
                                     </svg>
                                     Caricamento in corso...
                                 </span>
+                            ) : isProcessing ? (
+                                <span>
+                                    Elaborazione in corso
+                                    {job && job.sheets_total > 0 && ` (${job.sheets_done}/${job.sheets_total} fogli)`}
+                                    ...
+                                </span>
                             ) : (
                                 'Carica ed Elabora'
                             )}
@@ -140,6 +170,12 @@ export default function Upload() {
                                 Errore durante il caricamento. Riprova.
                             </div>
                         )}
+
+                        {job?.status === 'failed' && (
+                            <div className="bg-red-50 border border-red-200 text-red-700 px-4 py-3 rounded-lg">
+                                Errore durante l'elaborazione: {job.error}
+                            </div>
+                        )}
                     </div>
                 )}
             </div>